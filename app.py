@@ -1,7 +1,11 @@
-from flask import Flask, request, render_template, jsonify, session
+from flask import Flask, request, render_template, jsonify, session, send_file
+from werkzeug.wsgi import LimitedStream
 import os
 import json
 import logging
+import uuid
+import hmac
+import hashlib
 from datetime import datetime
 
 # Import enhanced services
@@ -11,6 +15,23 @@ from services.speech_service import SpeechService
 from services.reader_service import ReaderService
 from services.storage_service import StorageService
 from services.story_summary_animation_service import StorySummaryAnimationService  # NEW: Story summary animation
+from services.lifecycle_service import LifecycleService
+from services.resilience_service import UpstreamUnavailable, upstream_status
+from services.credential_service import CredentialService
+from services.animation_job_service import AnimationJobService
+from services.ken_burns_service import KenBurnsService
+from services.story_pipeline_service import StoryPipelineService
+from services.prompt_registry import get_prompt_registry
+from services.metering_service import get_meter
+from services.telemetry_service import get_telemetry
+from services.profiling_service import get_profiler, ProfilingMiddleware
+from services.archive_service import ArchiveService
+from services.offline_package_service import OfflinePackageService
+from services.page_fragment_service import PageFragmentService
+from services.page_variation_service import PageVariationService
+from services.coalescing_service import RequestCoalescer
+from services.background_pool_service import BackgroundPoolService
+from services.story_generation_service import StoryGenerationService, StoryGenerationError
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -31,6 +52,25 @@ os.makedirs('temp_stories', exist_ok=True)
 CLAUDE_API_KEY = os.getenv('CLAUDE_API_KEY')
 STABILITY_API_KEY = os.getenv('STABILITY_API_KEY')
 ELEVEN_LABS_API_KEY = os.getenv('ELEVEN_LABS_API_KEY')
+# Per-page animations each visitor may start per day
+PAGE_ANIMATION_DAILY_BUDGET = int(os.getenv('PAGE_ANIMATION_DAILY_BUDGET', 12))
+# One JSON call for story, simplified story and image descriptions (falls back to step-by-step)
+STRUCTURED_STORY_GENERATION = os.getenv('STRUCTURED_STORY_GENERATION', 'true').lower() == 'true'
+# Pages rendered into the story response; later pages are fetched from /story_page as the reader scrolls
+INLINE_STORY_PAGES = int(os.getenv('INLINE_STORY_PAGES', 6))
+# Seconds a /generate repeated with the same idempotency key replays the first story
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', 600))
+# Longest a duplicate /generate waits for the identical request already running
+GENERATE_COALESCE_TIMEOUT = 600
+# Ready-made pictures of each template's recurring scenes: 'off', 'fallback' (when Stability is refusing
+# calls) or 'prefer' (whenever a page's scene matches); the pool is filled while the worker is idle
+BACKGROUND_POOL = os.getenv('BACKGROUND_POOL', 'off').lower()
+BACKGROUND_POOL_PER_SCENE = int(os.getenv('BACKGROUND_POOL_PER_SCENE', 2))
+BACKGROUND_POOL_IDLE_SECONDS = int(os.getenv('BACKGROUND_POOL_IDLE_SECONDS', 300))
+# /import_stories can overwrite any saved story, so it is off unless this token is set and sent with the upload
+ARCHIVE_IMPORT_TOKEN = os.getenv('ARCHIVE_IMPORT_TOKEN')
+# Largest archive /import_stories accepts (streamed to disk, so not bound by MAX_CONTENT_LENGTH)
+MAX_IMPORT_BYTES = int(os.getenv('MAX_IMPORT_BYTES', 2 * 1024 * 1024 * 1024))
 
 # Enhanced reading speed settings with predictive timing
 READING_SPEED_SETTINGS = {
@@ -49,25 +89,209 @@ READING_SPEED_SETTINGS = {
 }
 
 # Initialize enhanced services
+# Prompt templates are loaded and validated once, at startup
+prompt_registry = get_prompt_registry()
+# Tokens, credits and characters used per story and per day (DAILY_BUDGET_USD caps optional stages)
+meter = get_meter()
+# Per-stage latency histograms, served in Prometheus format at /metrics
+telemetry = get_telemetry()
 story_service = StoryService(CLAUDE_API_KEY)
 image_service = ImageService(STABILITY_API_KEY)
 speech_service = SpeechService(ELEVEN_LABS_API_KEY, READING_SPEED_SETTINGS)
 reader_service = ReaderService()
 storage_service = StorageService()
+# Tracks in-flight generations for readiness checks and graceful shutdown
+lifecycle_service = LifecycleService()
+# Pictures of recurring scenes drawn while idle, handed to matching pages
+background_pool_service = BackgroundPoolService(
+    image_service, lifecycle_service, mode=BACKGROUND_POOL, per_scene=BACKGROUND_POOL_PER_SCENE,
+    idle_seconds=BACKGROUND_POOL_IDLE_SECONDS
+)
+# Pages are illustrated while the rest of the story is still streaming in
+story_pipeline_service = StoryPipelineService(story_service, image_service, structured=STRUCTURED_STORY_GENERATION,
+                                              background_pool=background_pool_service)
+# Stability key is validated once and refreshed in the background
+stability_credentials = CredentialService(STABILITY_API_KEY)
 # NEW: Initialize story summary animation service
-story_summary_animation_service = StorySummaryAnimationService(STABILITY_API_KEY, READING_SPEED_SETTINGS)
+story_summary_animation_service = StorySummaryAnimationService(STABILITY_API_KEY, READING_SPEED_SETTINGS, stability_credentials)
+# Local pan/zoom slideshow when Stability isn't configured or its render fails
+ken_burns_service = KenBurnsService(READING_SPEED_SETTINGS)
+# Summary videos render in the background and are patched into the story when ready
+animation_job_service = AnimationJobService(
+    story_summary_animation_service, storage_service, ken_burns_service,
+    daily_page_budget=PAGE_ANIMATION_DAILY_BUDGET
+)
+# Streams saved stories and their media to and from a single tar archive
+archive_service = ArchiveService(storage_service)
+# Pre-rendered pages and narration that the story service worker caches for offline reading
+offline_package_service = OfflinePackageService(storage_service, speech_service)
+# Redraws or rewrites a single page of a stored story
+page_variation_service = PageVariationService(story_service, image_service, reader_service, storage_service)
+# Rendered story pages, reused until the page's content changes
+page_fragment_service = PageFragmentService(
+    lambda page, is_last: render_template('_story_page.html', page=page, is_last=is_last)
+)
+# Runs a double-submitted or refreshed /generate once and gives every copy the same story
+generate_coalescer = RequestCoalescer(ttl=IDEMPOTENCY_KEY_TTL)
+# Profiles requests that carry PROFILE_TOKEN, and one in PROFILE_SAMPLE_EVERY /generate and /read calls
+profiler = get_profiler()
+app.wsgi_app = ProfilingMiddleware(app.wsgi_app, profiler)
+
+def summary_animation_available():
+    """Whether a summary animation can be made, remotely or with the local renderer."""
+    return bool(STABILITY_API_KEY) or ken_burns_service.is_available()
+
+# Form, pages, animations and summary page of a new story; shared with the asyncio /generate
+story_generation_service = StoryGenerationService(reader_service, animation_job_service, summary_animation_available)
+
+def page_has_animation(page):
+    """Whether a page has an animation, finished or still on its way."""
+    return page.get('has_animation', False) or page.get('animation_status') in ('queued', 'rendering')
+
+def render_story(story_key, content, inline_pages=INLINE_STORY_PAGES, **context):
+    """Render story.html with the first pages inline and the rest as placeholders loaded from /story_page.
+
+    Args:
+        story_key (str): Saved or temporary story ID the pages are cached and fetched under
+        content (list): The story's pages
+        inline_pages (int): Pages rendered into the response (None for all of them)
+        **context: Extra template variables
+    """
+    inline_pages = len(content) if inline_pages is None else inline_pages
+    return render_template(
+        'story.html',
+        page_fragments=page_fragment_service.render_pages(story_key, content, 0, inline_pages),
+        lazy_page_urls=[f"/story_page/{story_key}/{index + 1}" for index in range(inline_pages, len(content))],
+        has_animations=any(page_has_animation(page) for page in content),
+        story_key=story_key,
+        **context
+    )
+
+def collect_service_gauges():
+    """Point-in-time state for /metrics: upstream limits, work in flight, render queue and spend."""
+    upstreams = upstream_status()
+    in_flight = lifecycle_service.status()['in_flight']
+    queue = animation_job_service.queue_status()
+    fragments = page_fragment_service.status()
+    coalesced = generate_coalescer.status()
+    pool = background_pool_service.status()
+    return [
+        ('upstream_circuit_open', 'Whether calls to an upstream are currently refused',
+         [({'upstream': name}, int(status['circuit']['state'] == 'open')) for name, status in upstreams.items()]),
+        ('upstream_concurrency_limit', 'Adaptive concurrency limit per upstream',
+         [({'upstream': name}, status['concurrency']['limit']) for name, status in upstreams.items()]),
+        ('upstream_in_flight', 'Calls currently running per upstream',
+         [({'upstream': name}, status['concurrency']['in_flight']) for name, status in upstreams.items()]),
+        ('upstream_queued', 'Calls waiting for a concurrency slot per upstream',
+         [({'upstream': name}, status['concurrency']['queued']) for name, status in upstreams.items()]),
+        ('requests_in_flight', 'Tracked requests currently running in this worker',
+         [({'kind': kind}, count) for kind, count in in_flight.items()]),
+        ('animation_render_queue', 'Page animations waiting for or using a render slot',
+         [({'state': 'queued'}, queue['queued']), ({'state': 'rendering'}, queue['rendering'])]),
+        ('spend_today_usd', 'Estimated remote API spend today', [({}, round(meter.spend_today(), 4))]),
+        ('page_fragment_cache_bytes', 'Size of the rendered story page cache', [({}, fragments['bytes'])]),
+        ('page_fragment_cache_lookups', 'Rendered story page lookups since the worker started',
+         [({'result': 'hit'}, fragments['hits']), ({'result': 'miss'}, fragments['misses'])]),
+        ('generate_coalescing_entries', 'Story generations running, and finished ones kept for idempotent replay',
+         [({'state': 'in_flight'}, coalesced['in_flight']), ({'state': 'kept'}, coalesced['kept'])]),
+        ('generate_requests_shared', 'Story requests answered with another request\'s story since the worker started',
+         [({}, coalesced['shared'])]),
+        ('background_pool_pictures', 'Ready-made scene pictures in the background pool per template',
+         [({'template': template_type}, count) for template_type, count in pool['assets'].items()]),
+        ('background_pool_pages_served', 'Story pages given a pooled picture since the worker started',
+         [({}, pool['served'])]),
+    ]
+
+telemetry.add_collector(collect_service_gauges)
+
+def current_user_id():
+    """Anonymous per-browser ID used for the page animation budget."""
+    if 'user_id' not in session:
+        session['user_id'] = str(uuid.uuid4())
+    return session['user_id']
+
+def render_generated_story(description, character_description, template_type, story_text,
+                           simplified_story_text, image_descriptions, content, enable_animation):
+    """Store a freshly generated story as the session's current story and render it."""
+    # Check if we have a summary animation (finished or still rendering) for the success message
+    has_summary_animation = any(page.get('is_summary_page') and page_has_animation(page) for page in content)
+
+    # Store enhanced story data
+    temp_id = storage_service.store_temp_story({
+        'description': description,
+        'character_description': character_description,
+        'template_type': template_type,
+        'story_text': story_text,
+        'simplified_text': simplified_story_text,
+        'image_descriptions': image_descriptions,
+        'content': content,
+        'uses_photo_reference': image_service.has_reference_photo(),
+        'has_summary_animation': enable_animation and has_summary_animation,  # NEW
+        # Which prompt templates wrote this story; anything cached from it should key on this
+        'prompt_version': prompt_registry.version,
+        # Remote API usage of this story, see /usage/<temp_id>
+        'usage_id': meter.current_usage_id()
+    })
+
+    session['current_story_id'] = temp_id
+
+    # Let any background render know where to put its video
+    for page in content:
+        if page.get('animation_status') in ('queued', 'rendering'):
+            animation_job_service.attach_temp_story(page['animation_job'], temp_id)
+
+    logging.info(f"Story generation completed successfully! Generated {len(content)} pages")
+    if has_summary_animation:
+        logging.info("✓ Includes story summary animation at the end")
+
+    return render_story(temp_id, content)
+
+def generate_request_key():
+    """Which /generate requests are the same request, for coalescing.
+
+    With an idempotency key (Idempotency-Key header or idempotency_key form
+    field) every request carrying the key gets the first one's story, also
+    after it has finished. Without one, identical requests from the same
+    browser only share a story while it is being generated.
+
+    Returns:
+        tuple: (key, fingerprint of the story options, whether the key is an idempotency key)
+    """
+    fingerprint = hashlib.sha256(json.dumps([
+        (request.form.get('description') or '').strip(),
+        request.form.get('template_type', 'adventure'),
+        request.form.get('enable_animation') == 'true',
+        request.form.get('animate_pages') == 'true',
+        request.form.get('animation_reading_mode', 'normal')
+    ]).encode('utf-8')).hexdigest()
+
+    idempotency_key = request.headers.get('Idempotency-Key') or request.form.get('idempotency_key')
+    if idempotency_key:
+        return f"{current_user_id()}:key:{idempotency_key[:128]}", fingerprint, True
+    return f"{current_user_id()}:request:{fingerprint}", fingerprint, False
+
+def generated_story_result(result, previous_story_id):
+    """What _generate_story returned, in a form other requests can replay."""
+    response = app.make_response(result)
+    story_id = session.get('current_story_id')
+    return {
+        'body': response.get_data(as_text=True),
+        'status': response.status_code,
+        # Only set when this request stored a new story
+        'story_id': story_id if story_id != previous_story_id else None
+    }
 
-# Add JSON filter for templates
-@app.template_filter('from_json')
-def from_json_filter(value):
-    try:
-        return json.loads(value) if value else {}
-    except (json.JSONDecodeError, TypeError):
-        return {}
+def replay_generated_story(result):
+    """Answer a duplicate request with the story another request generated."""
+    if result['story_id']:
+        session['current_story_id'] = result['story_id']
+    return result['body'], result['status'], {'X-Coalesced-Request': 'true'}
 
 @app.route('/')
 def index():
     """Main page with story creation and library."""
+    # Start the session now, so a double-submitted first story is recognised as one request
+    current_user_id()
     return render_template('index.html')
 
 @app.route('/get_voices')
@@ -83,226 +307,54 @@ def get_voices():
 @app.route('/generate', methods=['POST'])
 def generate():
     """Generate story with balanced filtering and optional story summary animation"""
-    description = request.form.get('description')
-    template_type = request.form.get('template_type', 'adventure')
-    # NEW: Animation options
-    enable_animation = request.form.get('enable_animation') == 'true'
-    animation_reading_mode = request.form.get('animation_reading_mode', 'normal')
-
-    # Use photo-based character description since we have the reference photo
-    character_description = "4 years old, curly brown hair, light skin, blue-green eyes"
-
-    if not description:
-        return render_template('index.html', error="Please describe Esme's adventure!")
-
+    if lifecycle_service.is_draining():
+        return render_template('index.html', error="The story generator is restarting. Please try again in a moment."), 503
+
+    key, fingerprint, idempotent = generate_request_key()
+    previous_story_id = session.get('current_story_id')
+
+    def generate_once():
+        # Every remote call made for this story is metered under one ID
+        with meter.story_scope(str(uuid.uuid4())), telemetry.span('generate'):
+            return generated_story_result(_generate_story(), previous_story_id)
+
+    with lifecycle_service.track('generate'):
+        try:
+            # The same story already being generated for this browser is shared, not made twice
+            result, shared = generate_coalescer.run(
+                key, fingerprint, generate_once,
+                # Failed attempts aren't kept, so retrying with the same key tries again
+                keep=lambda result: idempotent and result['story_id'] is not None,
+                timeout=GENERATE_COALESCE_TIMEOUT
+            )
+        except ValueError as e:
+            return render_template('index.html', error=str(e)), 422
+        except TimeoutError as e:
+            return render_template('index.html', error=str(e)), 503
+        if shared:
+            return replay_generated_story(result)
+        return result['body'], result['status']
+
+def _generate_story():
     try:
-        logging.info(f"Generating {template_type} story with photo reference...")
-        if enable_animation:
-            logging.info(f"Story summary animation enabled for {animation_reading_mode} reading mode")
-
-        # Generate story with selected template
-        story_text = story_service.generate_story_with_template(
-            description, character_description, template_type
+        options = story_generation_service.request_options(request.form)
+        # Stream the story and illustrate each page as soon as it has been written
+        story = story_pipeline_service.generate(
+            options['description'], options['character_description'], options['template_type']
         )
-
-        if not story_text:
-            return render_template('index.html', error="Story generation failed. Please try again.")
-
-        # Generate enhanced simplified version
-        simplified_story_text = story_service.generate_simplified_story(story_text)
-
-        # Process into pages - ONLY filter obvious metadata
-        raw_pages = story_text.split('\n\n')
-        pages = []
-
-        for page in raw_pages:
-            page = page.strip()
-
-            # Skip empty pages
-            if not page:
-                continue
-
-            # Only skip VERY OBVIOUS metadata - be conservative
-            obvious_skip_patterns = [
-                '[The revised version includes:',  # Exact metadata headers
-                '[The improved version has:',
-                '1. More playful, bouncy rhymes',  # Exact numbered improvements
-                '2. Concrete details kids can relate to',
-                '3. Active verbs (',
-                '4. Simple but engaging language',
-                '5. More sensory details',
-                '6. Fun activities that 4-year-olds enjoy'
-            ]
-
-            should_skip = False
-            for pattern in obvious_skip_patterns:
-                if page.startswith(pattern):
-                    should_skip = True
-                    logging.info(f"Skipped obvious metadata: {page[:50]}...")
-                    break
-
-            # Keep everything else, including story titles and content
-            if not should_skip and len(page) > 10:  # Keep anything with substance
-                pages.append(page)
-                logging.info(f"Kept story content: {page[:50]}...")
-
-        logging.info(f"Final result: {len(pages)} story pages (filtered from {len(raw_pages)} raw sections)")
-
-        # If we have too few pages, be even less aggressive
-        if len(pages) < 3:
-            logging.warning("Too few pages detected, using minimal filtering...")
-            pages = []
-            for page in raw_pages:
-                page = page.strip()
-                if page and len(page) > 20:  # Keep almost everything
-                    pages.append(page)
-            logging.info(f"Minimal filtering result: {len(pages)} pages")
-
-        if len(pages) == 0:
-            return render_template('index.html', error="Story processing failed - no valid content found. Please try again.")
-
-        # Process simplified pages the same way
-        raw_simplified = simplified_story_text.split('\n\n') if simplified_story_text else []
-        simplified_pages = []
-
-        for page in raw_simplified:
-            page = page.strip()
-            if page and len(page) > 10:  # Keep substantial simplified content
-                # Apply same obvious metadata filtering to simplified version
-                should_skip = False
-                for pattern in obvious_skip_patterns:
-                    if page.startswith(pattern):
-                        should_skip = True
-                        break
-
-                if not should_skip:
-                    simplified_pages.append(page)
-
-        logging.info(f"Processed {len(simplified_pages)} simplified pages")
-
-        # Initialize image service with photo reference
-        image_service.generate_character_profile(character_description)
-
-        # Generate image descriptions for better scenes
-        image_descriptions = story_service.generate_image_descriptions(pages, character_description)
-
-        content = []
-        story_context = ""
-
-        for index, text in enumerate(pages):
-            logging.info(f"Processing story page {index + 1} of {len(pages)}")
-
-            # Use enhanced image description or fallback
-            image_description = image_descriptions[index] if index < len(image_descriptions) else text
-
-            # Generate image using photo reference
-            image_url = image_service.generate_story_image(
-                image_description, 
-                index + 1, 
-                story_context
-            )
-
-            # Process text for reading
-            stanzas = reader_service.process_story_text(text)
-
-            # Process simplified text
-            simplified_text = simplified_pages[index] if index < len(simplified_pages) else ""
-            simplified_stanzas = reader_service.process_story_text(simplified_text)
-
-            content.append({
-                'page': index + 1,
-                'text': text,
-                'image': image_url,
-                'stanzas': stanzas,
-                'simplified_text': simplified_text,
-                'simplified_stanzas': simplified_stanzas,
-                'has_animation': False  # Only the summary page will have animation
-            })
-
-            # Build context for next image
-            story_context += f" {text}"
-            if len(story_context) > 300:
-                story_context = story_context[-300:]
-
-        # NEW: Add story summary animation if requested
-        if enable_animation and STABILITY_API_KEY:
-            logging.info(f"Adding story summary animation at the end...")
-
-            try:
-                # Add a single summary animation page at the end of the story
-                content = story_summary_animation_service.add_story_summary_page(
-                    content, 
-                    character_description,
-                    animation_reading_mode
-                )
-
-                # Check if summary animation was successful
-                summary_page = content[-1] if content else None
-                if summary_page and summary_page.get('has_animation'):
-                    logging.info("✓ Story summary animation added successfully")
-                else:
-                    error = summary_page.get('animation_error', 'Unknown error') if summary_page else 'No summary page created'
-                    logging.warning(f"✗ Story summary animation failed: {error}")
-
-            except Exception as e:
-                logging.error(f"Story summary animation generation failed: {e}")
-                # Add a summary page without animation
-                summary_page = {
-                    'page': len(content) + 1,
-                    'text': 'The End',
-                    'image': content[0]['image'] if content else '/static/images/default.jpg',
-                    'stanzas': [{'index': 0, 'lines': ['The End'], 'reading_analysis': {'word_count': 2, 'sight_words': 1, 'phonics_words': 0, 'complex_words': 0, 'sight_word_ratio': 50.0, 'difficulty': 'easy', 'recommended_reading_mode': 'normal'}}],
-                    'simplified_text': 'The End',
-                    'simplified_stanzas': [{'index': 0, 'lines': ['The End'], 'reading_analysis': {'word_count': 2, 'sight_words': 1, 'phonics_words': 0, 'complex_words': 0, 'sight_word_ratio': 50.0, 'difficulty': 'easy', 'recommended_reading_mode': 'normal'}}],
-                    'is_summary_page': True,
-                    'has_animation': False,
-                    'animation_error': f"Animation generation failed: {str(e)}"
-                }
-                content.append(summary_page)
-
-        elif enable_animation and not STABILITY_API_KEY:
-            logging.warning("Story summary animation requested but no Stability AI API key configured")
-            # Add summary page without animation
-            summary_page = {
-                'page': len(content) + 1,
-                'text': 'The End',
-                'image': content[0]['image'] if content else '/static/images/default.jpg',
-                'stanzas': [{'index': 0, 'lines': ['The End'], 'reading_analysis': {'word_count': 2, 'sight_words': 1, 'phonics_words': 0, 'complex_words': 0, 'sight_word_ratio': 50.0, 'difficulty': 'easy', 'recommended_reading_mode': 'normal'}}],
-                'simplified_text': 'The End',
-                'simplified_stanzas': [{'index': 0, 'lines': ['The End'], 'reading_analysis': {'word_count': 2, 'sight_words': 1, 'phonics_words': 0, 'complex_words': 0, 'sight_word_ratio': 50.0, 'difficulty': 'easy', 'recommended_reading_mode': 'normal'}}],
-                'is_summary_page': True,
-                'has_animation': False,
-                'animation_error': 'No Stability AI API key configured'
-            }
-            content.append(summary_page)
-
-        # Store enhanced story data
-        temp_id = storage_service.store_temp_story({
-            'description': description,
-            'character_description': character_description,
-            'template_type': template_type,
-            'story_text': story_text,
-            'simplified_text': simplified_story_text,
-            'image_descriptions': image_descriptions,
-            'content': content,
-            'uses_photo_reference': image_service.has_reference_photo(),
-            'has_summary_animation': enable_animation and any(page.get('is_summary_page') and page.get('has_animation') for page in content)  # NEW
-        })
-
-        session['current_story_id'] = temp_id
-
-        # Check if we have a summary animation for the success message
-        has_summary_animation = any(page.get('is_summary_page') and page.get('has_animation') for page in content)
-
-        logging.info(f"Story generation completed successfully! Generated {len(content)} pages")
-        if has_summary_animation:
-            logging.info("✓ Includes story summary animation at the end")
-
-        return render_template('story.html', story=content, has_animations=has_summary_animation)
-
+        return render_generated_story(**story_generation_service.build_story(options, story, current_user_id()))
     except Exception as e:
-        logging.error(f"Error in story generation: {e}")
-        return render_template('index.html', error=f"Story creation failed: {str(e)}")
+        return story_generation_failed(e)
+
+def story_generation_failed(error):
+    """The form again, with what went wrong while making a story."""
+    if isinstance(error, StoryGenerationError):
+        return render_template('index.html', error=str(error))
+    if isinstance(error, UpstreamUnavailable):
+        logging.warning(f"Story generation shed: {error}")
+        return render_template('index.html', error="Esme's story helpers are very busy right now. Please try again in a minute."), 503
+    logging.error(f"Error in story generation: {error}")
+    return render_template('index.html', error=f"Story creation failed: {str(error)}")
 
 @app.route('/read', methods=['POST'])
 def read_text():
@@ -367,13 +419,15 @@ def analyze_story_summary():
 
     try:
         # Use the story summary animation service to analyze the story
-        analysis = story_summary_animation_service._analyze_story_motion(story_content)
+        page_motion = story_summary_animation_service.analyze_page_motion(story_content)
+        analysis = story_summary_animation_service._analyze_story_motion(story_content, page_motion)
         summary = story_summary_animation_service._create_story_summary(story_content)
 
         return jsonify({
             'success': True,
             'analysis': {
                 'motion_intensity': analysis,
+                'page_motion': page_motion,
                 'story_summary': summary,
                 'total_pages': len(story_content),
                 'animation_approach': 'story_summary'
@@ -387,7 +441,7 @@ def analyze_story_summary():
 
 @app.route('/generate_story_summary_animation', methods=['POST'])
 def generate_story_summary_animation():
-    """Generate a story summary animation on demand."""
+    """Start a story summary animation on demand; poll /animation_status/<job_id> for the video."""
     data = request.json
     story_content = data.get('story_content', [])
     character_description = data.get('character_description', '4 years old, curly brown hair, light skin, blue-green eyes')
@@ -397,12 +451,15 @@ def generate_story_summary_animation():
         return jsonify({'error': 'No story content provided'}), 400
 
     try:
-        result = story_summary_animation_service.generate_story_summary_animation(
-            story_content,
-            character_description,
-            reading_mode
-        )
+        with lifecycle_service.track('animation'):
+            result = animation_job_service.submit(
+                story_content,
+                character_description,
+                reading_mode
+            )
 
+        if result.get('status') == 'rendering':
+            return jsonify(result), 202
         return jsonify(result)
     except Exception as e:
         logging.error(f"Error generating story summary animation: {e}")
@@ -411,6 +468,18 @@ def generate_story_summary_animation():
             'error': str(e)
         }), 500
 
+@app.route('/animation_status/<job_id>')
+def get_animation_status(job_id):
+    """Progress of a background story summary render."""
+    try:
+        status = animation_job_service.status(job_id, session.get('current_story_id'))
+        if not status:
+            return jsonify({'error': 'Unknown animation job'}), 404
+        return jsonify(status)
+    except Exception as e:
+        logging.error(f"Error getting animation status {job_id}: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/save_story', methods=['POST'])
 def save_story():
     """Save story with photo reference metadata"""
@@ -461,22 +530,237 @@ def view_story(story_id):
     """View story with enhanced features."""
     try:
         story = storage_service.get_story(story_id)
-        has_animations = any(page.get('has_animation', False) for page in story['content'])
-        return render_template('story.html', story=story['content'], has_animations=has_animations)
+        return render_story(story_id, story['content'], story_id=story_id)
     except Exception as e:
         logging.error(f"Error viewing story {story_id}: {e}")
         return render_template('index.html', error=f"Could not load story: {str(e)}")
 
+def find_story(story_id):
+    """This session's current story or a saved story, as (story, is_temp); story is None if neither exists."""
+    if story_id == session.get('current_story_id'):
+        return storage_service.get_temp_story(story_id), True
+    try:
+        return storage_service.get_story(story_id), False
+    except ValueError:
+        return None, False
+
+@app.route('/story_page/<story_id>/<int:page_number>')
+def story_page(story_id, page_number):
+    """One rendered page (1-based) of a saved story or of this session's current story."""
+    story, _ = find_story(story_id)
+    if not story:
+        return jsonify({'error': 'Story not found'}), 404
+    if not 1 <= page_number <= len(story['content']):
+        return jsonify({'error': 'Page not found'}), 404
+    return page_fragment_service.render_page(story_id, story['content'], page_number - 1)
+
+@app.route('/regenerate_page/<story_id>/<int:page_number>', methods=['POST'])
+def regenerate_page(story_id, page_number):
+    """Redraw a page's illustration ({"part": "image"}), rewrite its text ("text") or both ("both").
+
+    Works on this session's current story or a saved story, updating it in place.
+    Returns the updated page, its rendered HTML and whether the story's offline package is now out of date.
+    """
+    data = request.json or {}
+    story, is_temp = find_story(story_id)
+    if not story:
+        return jsonify({'error': 'Story not found'}), 404
+    if not 1 <= page_number <= len(story['content']):
+        return jsonify({'error': 'Page not found'}), 404
+
+    try:
+        with lifecycle_service.track('regenerate'), meter.story_scope(story.get('usage_id') or f"story-{story_id}"):
+            story = page_variation_service.regenerate_page(
+                story_id, story, page_number - 1, data.get('part', 'image'), data.get('instructions', ''), temp=is_temp
+            )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except UpstreamUnavailable as e:
+        logging.warning(f"Page regeneration shed: {e}")
+        return jsonify({'error': "Esme's story helpers are very busy right now. Please try again in a minute."}), 503
+    except Exception as e:
+        logging.error(f"Error regenerating page {page_number} of story {story_id}: {e}")
+        return jsonify({'error': str(e)}), 500
+
+    # A saved story's offline copy no longer matches it
+    offline_package_stale = not is_temp and offline_package_service.mark_stale(story_id)
+
+    return jsonify({
+        'success': True,
+        'page': story['content'][page_number - 1],
+        'html': page_fragment_service.render_page(story_id, story['content'], page_number - 1),
+        'offline_package_stale': offline_package_stale
+    })
+
 @app.route('/delete_story/<story_id>', methods=['DELETE'])
 def delete_story(story_id):
     """Delete story."""
     try:
         storage_service.delete_story(story_id)
+        offline_package_service.delete_package(story_id)
+        page_fragment_service.invalidate(story_id)
         return jsonify({'success': True})
     except Exception as e:
         logging.error(f"Error deleting story {story_id}: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/offline_package/<story_id>', methods=['POST'])
+def build_offline_package(story_id):
+    """Narrate and render a saved story into an offline package; returns its manifest."""
+    data = request.json or {}
+    voice_id = data.get('voice')
+    if not voice_id:
+        return jsonify({'error': 'No voice selected'}), 400
+    if meter.over_budget():
+        return jsonify({'error': 'The daily API budget is used up; try again tomorrow'}), 429
+
+    def render_page(story, offline):
+        # No server to fetch later pages from, so every page goes into the HTML
+        return render_story(story_id, story['content'], inline_pages=None, offline=offline)
+
+    try:
+        with meter.story_scope(f"offline-{story_id}"):
+            manifest = offline_package_service.build_package(story_id, voice_id, render_page, data.get('voice_name'))
+        return jsonify(manifest)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        logging.error(f"Error building offline package for {story_id}: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/offline_package/<story_id>')
+def get_offline_package(story_id):
+    """Manifest of a story's offline package."""
+    manifest = offline_package_service.get_package(story_id)
+    if not manifest:
+        return jsonify({'error': 'This story has no offline package'}), 404
+    return jsonify(manifest)
+
+@app.route('/story-sw.js')
+def story_service_worker():
+    """The offline story service worker, served from the root so it may control /static/offline/."""
+    response = send_file(os.path.join(app.static_folder, 'js', 'story-sw.js'), mimetype='application/javascript')
+    # Browsers check for a new worker on each visit; let them see updates immediately
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/export_stories')
+def export_stories():
+    """Download saved stories (all, or ?ids=a,b) with their images and videos as a tar archive."""
+    ids = request.args.get('ids')
+    story_ids = [story_id for story_id in ids.split(',') if story_id] if ids else None
+    try:
+        archive = archive_service.export_stories(story_ids)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 404
+
+    filename = f"esme-stories-{datetime.now().strftime('%Y%m%d-%H%M%S')}.tar"
+    return app.response_class(archive, mimetype='application/x-tar', headers={
+        'Content-Disposition': f'attachment; filename="{filename}"'
+    })
+
+def import_admin():
+    """Whether imports are enabled and the request carries the import token."""
+    token = request.headers.get('X-Import-Token')
+    return bool(ARCHIVE_IMPORT_TOKEN) and bool(token) and hmac.compare_digest(token, ARCHIVE_IMPORT_TOKEN)
+
+@app.route('/import_stories', methods=['POST'])
+def import_stories():
+    """Import an archive from /export_stories sent as the request body (?replace=true overwrites same-ID stories).
+
+    Needs ARCHIVE_IMPORT_TOKEN in the X-Import-Token header; archives over MAX_IMPORT_BYTES are refused.
+    """
+    if not import_admin():
+        return jsonify({'error': 'Importing is not enabled or the token is wrong'}), 403
+    if request.content_length is None:
+        return jsonify({'error': 'Send the archive as the request body with a Content-Length'}), 411
+    if request.content_length > MAX_IMPORT_BYTES:
+        return jsonify({'error': f"The archive is larger than the import limit of {MAX_IMPORT_BYTES} bytes"}), 413
+    # Archives are far bigger than MAX_CONTENT_LENGTH and are read as a stream, not buffered; never past Content-Length
+    stream = LimitedStream(request.environ['wsgi.input'], request.content_length)
+    try:
+        result = archive_service.import_stories(stream, replace=request.args.get('replace') == 'true')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logging.error(f"Error importing stories: {e}")
+        return jsonify({'error': f"Import failed: {str(e)}"}), 500
+    return jsonify(result)
+
+@app.route('/ready')
+def ready():
+    """Readiness check: 503 once the worker starts draining for shutdown."""
+    status = lifecycle_service.status()
+    return jsonify(status), 503 if lifecycle_service.is_draining() else 200
+
+@app.route('/upstream_status')
+def get_upstream_status():
+    """Circuit breaker and concurrency limit state for each remote API."""
+    return jsonify(upstream_status())
+
+@app.route('/prompt_status')
+def get_prompt_status():
+    """Version and per-template hashes of the loaded prompt templates."""
+    return jsonify({'version': prompt_registry.version, 'templates': prompt_registry.status()})
+
+@app.route('/animation_queue')
+def get_animation_queue():
+    """Depth of the page animation render queue in this worker."""
+    return jsonify(animation_job_service.queue_status())
+
+@app.route('/metrics')
+def get_metrics():
+    """Stage and upstream latency histograms and service gauges for Prometheus (this worker)."""
+    return app.response_class(telemetry.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+def profile_admin():
+    """Whether the request carries the profiling admin token."""
+    return profiler.is_admin(request.headers.get('X-Profile-Token') or request.args.get('profile_token'))
+
+@app.route('/profiles')
+def get_profiles():
+    """Recent request profiles with route, duration and hottest functions (admin only)."""
+    if not profile_admin():
+        return jsonify({'error': 'Profiling is not enabled or the token is wrong'}), 403
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({'profiles': profiler.list_profiles(max(1, min(limit, profiler.keep)))})
+
+@app.route('/profiles/<profile_id>')
+def download_profile(profile_id):
+    """Download one profile: .pstats for cProfile, folded stacks for flame graphs (admin only)."""
+    if not profile_admin():
+        return jsonify({'error': 'Profiling is not enabled or the token is wrong'}), 403
+    path = profiler.profile_file(profile_id)
+    if not path:
+        return jsonify({'error': 'Unknown profile'}), 404
+    return send_file(os.path.abspath(path), as_attachment=True, download_name=os.path.basename(path))
+
+@app.route('/usage')
+def get_usage():
+    """Estimated API usage and spend per day, with the daily budget."""
+    days = request.args.get('days', 7, type=int)
+    return jsonify(meter.daily_summary(max(1, min(days, 90))))
+
+@app.route('/usage/<temp_id>')
+def get_story_usage(temp_id):
+    """API usage of one generated story by upstream and call."""
+    story_data = storage_service.get_temp_story(temp_id)
+    if not story_data or not story_data.get('usage_id'):
+        return jsonify({'error': 'Unknown story'}), 404
+    return jsonify(meter.story_summary(story_data['usage_id']))
+
+@app.route('/account_status')
+def get_account_status():
+    """Cached Stability AI key validation and credits; account details only with the profiling admin token."""
+    try:
+        status = stability_credentials.status()
+        if not profile_admin():
+            status = {key: status[key] for key in ('valid', 'credits', 'checked_at', 'age_seconds')}
+        return jsonify(status)
+    except Exception as e:
+        logging.error(f"Error getting account status: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/story_templates')
 def get_story_templates():
     """Get available story templates."""
@@ -519,7 +803,9 @@ if __name__ == '__main__':
     # NEW: Story summary animation capability status
     if STABILITY_API_KEY:
         print("✨ Story summary animation capability: ENABLED")
+    elif ken_burns_service.is_available():
+        print("🎞️ Story summary animation capability: LOCAL SLIDESHOW (no Stability AI key)")
     else:
-        print("📖 Story summary animation capability: DISABLED (no Stability AI key)")
+        print("📖 Story summary animation capability: DISABLED (no Stability AI key or ffmpeg)")
 
     app.run(host='0.0.0.0', port=8080, debug=True)
\ No newline at end of file
@@ -0,0 +1,256 @@
+"""Asyncio serving mode for Esme's Story Generator.
+
+The remote-API endpoints (/generate, /read and /get_voices) run natively on
+the event loop through the httpx-based services, so an in-flight TTS stream
+or story generation holds a coroutine instead of a worker thread. Summary
+videos render as background jobs (see AnimationJobService). Every other
+route is served by the regular Flask app through asgiref's WSGI adapter, on
+a pool of WEB_THREADS threads (default 8).
+
+Run with:
+    uvicorn asgi:application --host 0.0.0.0 --port 8080
+"""
+import os
+import asyncio
+import json
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from flask import request, render_template, session
+from werkzeug.test import EnvironBuilder
+
+from app import (
+    app, CLAUDE_API_KEY, STABILITY_API_KEY, ELEVEN_LABS_API_KEY, READING_SPEED_SETTINGS, STRUCTURED_STORY_GENERATION,
+    render_generated_story, story_generation_service, story_generation_failed, lifecycle_service, meter, telemetry,
+    current_user_id, profiler, generate_coalescer, generate_request_key, generated_story_result, replay_generated_story,
+    GENERATE_COALESCE_TIMEOUT, background_pool_service, ken_burns_service
+)
+from services.async_services import (
+    create_async_client, AsyncStoryService, AsyncImageService, AsyncSpeechService, AsyncStoryPipelineService
+)
+
+# One pooled HTTP client shared by all async services
+http_client = create_async_client()
+
+story_service = AsyncStoryService(CLAUDE_API_KEY, http_client)
+image_service = AsyncImageService(STABILITY_API_KEY, http_client)
+speech_service = AsyncSpeechService(ELEVEN_LABS_API_KEY, READING_SPEED_SETTINGS, http_client)
+story_pipeline = AsyncStoryPipelineService(story_service, image_service, structured=STRUCTURED_STORY_GENERATION,
+                                           background_pool=background_pool_service)
+
+# Flask routes run here. asgiref's default runs every WSGI request on one shared thread, one at a time,
+# and that thread breaks once native handlers have used it
+wsgi_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('WEB_THREADS', 8)), thread_name_prefix='wsgi')
+
+
+class ThreadPoolWsgiInstance(WsgiToAsgiInstance):
+    """One WSGI request, run on wsgi_executor instead of asgiref's single thread-sensitive thread."""
+
+    async def run_wsgi_app(self, body):
+        # The base class's run_wsgi_app, without the thread-sensitive @sync_to_async around it
+        run = WsgiToAsgiInstance.__dict__['run_wsgi_app'].func
+        await sync_to_async(run, thread_sensitive=False, executor=wsgi_executor)(self, body)
+
+
+class ThreadPoolWsgiToAsgi(WsgiToAsgi):
+    async def __call__(self, scope, receive, send):
+        await ThreadPoolWsgiInstance(self.wsgi_application, self.duplicate_header_limit)(scope, receive, send)
+
+
+wsgi_application = ThreadPoolWsgiToAsgi(app)
+
+
+async def _read_body(receive):
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return body
+
+
+async def _send_response(send, status, body, headers):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(k.encode('latin-1'), str(v).encode('latin-1')) for k, v in headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _send_json(send, data, status=200):
+    await _send_response(send, status, json.dumps(data).encode(), [('Content-Type', 'application/json')])
+
+
+def _profile_mode(scope):
+    """Whether (and how) to profile a native request; the Flask routes are handled by ProfilingMiddleware."""
+    headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope['headers']}
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    return profiler.choose_mode(
+        scope['path'],
+        headers.get('x-profile-token') or query.get('profile_token', [None])[0],
+        headers.get('x-profile-mode') or query.get('profile_mode', [None])[0]
+    )
+
+
+def _flask_environ(scope, body):
+    """Build a WSGI environ so Flask's request, session and templates work for native handlers."""
+    headers = [(k.decode('latin-1'), v.decode('latin-1')) for k, v in scope['headers']]
+    return EnvironBuilder(
+        path=scope['path'],
+        method=scope['method'],
+        headers=headers,
+        data=body,
+        query_string=scope.get('query_string', b'').decode('latin-1')
+    ).get_environ()
+
+
+async def get_voices(scope, receive, send):
+    """Get available voices optimized for children's content."""
+    voices = await speech_service.get_voices()
+    await _send_json(send, {"voices": voices})
+
+
+async def read_text(scope, receive, send):
+    """Stream text-to-speech audio to the client as it arrives from ElevenLabs."""
+    try:
+        data = json.loads(await _read_body(receive))
+
+        raw_text = data.get('text', '')
+        voice_id = data.get('voice', '')
+        reading_mode = data.get('reading_mode', 'normal')
+
+        if not raw_text or not voice_id:
+            await _send_response(send, 400, b"Missing text or voice", [('Content-Type', 'text/plain')])
+            return
+
+        logging.info(f"Enhanced speech generation: mode={reading_mode}, text_length={len(raw_text)}")
+        audio_stream, response_headers = await speech_service.generate_speech(raw_text, voice_id, reading_mode)
+    except Exception as e:
+        logging.error(f"Enhanced speech generation error: {e}")
+        await _send_response(send, 500, f"Speech generation failed: {str(e)}".encode(), [('Content-Type', 'text/plain')])
+        return
+
+    headers = [('Content-Type', 'audio/mpeg')] + list(response_headers.items())
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [(k.encode('latin-1'), str(v).encode('latin-1')) for k, v in headers],
+    })
+    try:
+        async for chunk in audio_stream:
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    finally:
+        await audio_stream.aclose()
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+async def generate(scope, receive, send):
+    """Generate a story with all remote calls awaited, illustrating pages as they stream in."""
+    environ = _flask_environ(scope, await _read_body(receive))
+
+    if lifecycle_service.is_draining():
+        with app.request_context(environ):
+            response = app.make_response((render_template(
+                'index.html', error="The story generator is restarting. Please try again in a moment."
+            ), 503))
+        await _send_response(send, response.status_code, response.get_data(), response.headers.to_wsgi_list())
+        return
+
+    with app.request_context(environ), lifecycle_service.track('generate'):
+        result = await _coalesced_generate()
+        response = app.process_response(app.make_response(result))
+
+    await _send_response(send, response.status_code, response.get_data(), response.headers.to_wsgi_list())
+
+
+async def _coalesced_generate():
+    """Generate the story, or share the one an identical request is already generating (see app.generate)."""
+    try:
+        key, fingerprint, idempotent = generate_request_key()
+        entry, leader = generate_coalescer.begin(key, fingerprint)
+    except ValueError as e:
+        return render_template('index.html', error=str(e)), 422
+
+    if not leader:
+        try:
+            return replay_generated_story(
+                await asyncio.to_thread(generate_coalescer.wait, entry, GENERATE_COALESCE_TIMEOUT)
+            )
+        except TimeoutError as e:
+            return render_template('index.html', error=str(e)), 503
+
+    previous_story_id = session.get('current_story_id')
+    try:
+        # The usage ID follows the story into pipeline tasks and to_thread calls
+        with meter.story_scope(str(uuid.uuid4())), telemetry.span('generate'):
+            result = generated_story_result(await _generate_story(), previous_story_id)
+    except BaseException as e:
+        # Including cancellation, so followers aren't left waiting on a request that is gone
+        generate_coalescer.finish(key, entry, error=e if isinstance(e, Exception) else RuntimeError("Request cancelled"))
+        raise
+    generate_coalescer.finish(key, entry, result, keep=idempotent and result['story_id'] is not None)
+    return result['body'], result['status']
+
+
+async def _generate_story():
+    try:
+        options = story_generation_service.request_options(request.form)
+        # Pages are illustrated as they stream in; the simplified story overlaps the last images
+        story = await story_pipeline.generate(
+            options['description'], options['character_description'], options['template_type']
+        )
+        # Reads today's spend from SQLite and queues animations, so it runs off the event loop
+        built = await asyncio.to_thread(story_generation_service.build_story, options, story, current_user_id())
+        return render_generated_story(**built)
+    except Exception as e:
+        return story_generation_failed(e)
+
+
+ROUTES = {
+    ('GET', '/get_voices'): get_voices,
+    ('POST', '/read'): read_text,
+    ('POST', '/generate'): generate,
+}
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # Each uvicorn worker starts its own rendering pool and background pool thread
+            ken_burns_service.start()
+            background_pool_service.start()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await http_client.aclose()
+            wsgi_executor.shutdown(wait=False)
+            ken_burns_service.stop()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """ASGI entry point: native async handlers for remote-API routes, Flask for the rest."""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+
+    if scope['type'] == 'http':
+        handler = ROUTES.get((scope['method'], scope['path']))
+        if handler:
+            mode = _profile_mode(scope)
+            if mode is None:
+                await handler(scope, receive, send)
+            else:
+                # Runs on the event loop, so the profile includes whatever else the loop did meanwhile
+                with profiler.profile(f"{scope['method']} {scope['path']}", mode):
+                    await handler(scope, receive, send)
+            return
+
+    await wsgi_application(scope, receive, send)
@@ -0,0 +1,303 @@
+"""Load test the story generator against mock upstreams, without any API keys.
+
+Starts the mock Claude, Stability and ElevenLabs servers, launches the app
+with its API URLs pointed at them (in a scratch directory, so stories.db and
+static/images are untouched), then drives each scenario at a fixed
+concurrency and reports throughput and p50/p95/p99 latency per endpoint.
+
+Scenarios:
+    generate   POST /generate
+    read       POST /read, reading the whole audio stream
+    library    POST /save_story, GET /get_stories and GET /view_story/<id>
+               (each virtual user generates one story first, not timed)
+
+Examples:
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --server gunicorn --workers 2 --concurrency 16 --requests 64
+    python benchmarks/load_test.py --server uvicorn --scenarios generate,read --claude-latency 2
+    python benchmarks/load_test.py --target http://localhost:8080 --scenarios library
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from mock_upstreams import MockUpstreams, add_arguments, parse_settings  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+READ_TEXT = (
+    "Esme skipped along the garden path, where sunflowers nodded in a row. "
+    "She found a puddle for a splashing bath, and giggled as the breezes blow."
+)
+
+
+class AppServer:
+    """The app running in a subprocess, in a scratch working directory."""
+
+    def __init__(self, server, environment, workers=1, threads=8):
+        self.server = server
+        self.environment = environment
+        self.workers = workers
+        self.threads = threads
+        self.port = _free_port()
+        self.workdir = tempfile.mkdtemp(prefix='esme-bench-')
+        self.process = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self, timeout=60):
+        env = dict(os.environ)
+        env.update(self.environment)
+        env.update({
+            'PORT': str(self.port),
+            'WEB_CONCURRENCY': str(self.workers),
+            'WEB_THREADS': str(self.threads),
+            'PROMPT_DIR': os.path.join(ROOT, 'prompts'),
+            'PYTHONPATH': ROOT,
+        })
+
+        if self.server == 'uvicorn':
+            command = [sys.executable, '-m', 'uvicorn', 'asgi:application', '--app-dir', ROOT,
+                       '--host', '127.0.0.1', '--port', str(self.port), '--workers', str(self.workers),
+                       '--log-level', 'warning']
+        else:
+            env['SERVER'] = self.server
+            command = [sys.executable, os.path.join(ROOT, 'main.py')]
+
+        log = open(os.path.join(self.workdir, 'server.log'), 'w')
+        self.process = subprocess.Popen(command, cwd=self.workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"{self.server} exited early, see {log.name}")
+            try:
+                if requests.get(f"{self.base_url}/ready", timeout=1).status_code == 200:
+                    logging.info(f"✓ {self.server} ready on {self.base_url} (logs in {log.name})")
+                    return self
+            except requests.RequestException:
+                pass
+            time.sleep(0.25)
+        raise RuntimeError(f"{self.server} did not become ready within {timeout}s, see {log.name}")
+
+    def stop(self, keep_workdir=False):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if not keep_workdir:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class LoadTest:
+    """Runs scenarios against a base URL and collects latencies per endpoint."""
+
+    def __init__(self, base_url, concurrency=8, requests_per_scenario=32, timeout=300):
+        self.base_url = base_url
+        self.concurrency = concurrency
+        self.requests_per_scenario = requests_per_scenario
+        self.timeout = timeout
+        self.results = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def run(self, scenario):
+        """Run one scenario and return its wall time in seconds."""
+        action = getattr(self, f"_{scenario}")
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            list(pool.map(lambda _: action(), range(self.requests_per_scenario)))
+        wall = time.perf_counter() - started
+        with self._lock:
+            for endpoint in self.results:
+                if self.results[endpoint]['scenario'] == scenario:
+                    self.results[endpoint]['wall'] = wall
+        return wall
+
+    @property
+    def session(self):
+        """One HTTP session (and so one story session cookie) per virtual user."""
+        if not hasattr(self._local, 'session'):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _generate(self):
+        self._timed('generate', 'POST /generate', self._post_generate)
+
+    def _read(self):
+        def read():
+            response = self.session.post(f"{self.base_url}/read", json={
+                'text': READ_TEXT, 'voice': 'mock-sarah', 'reading_mode': 'normal'
+            }, stream=True, timeout=self.timeout)
+            for _ in response.iter_content(chunk_size=32768):
+                pass
+            if response.headers.get('X-Error'):
+                raise RuntimeError(response.headers['X-Error'])
+            return response
+        self._timed('read', 'POST /read', read)
+
+    def _library(self):
+        if not getattr(self._local, 'has_story', False):
+            # The story to save must be the session's current one; setup isn't timed
+            self._post_generate()
+            self._local.has_story = True
+
+        saved = self._timed('library', 'POST /save_story', lambda: self.session.post(
+            f"{self.base_url}/save_story", json={'title': 'Benchmark story'}, timeout=self.timeout
+        ))
+        self._timed('library', 'GET /get_stories', lambda: self.session.get(
+            f"{self.base_url}/get_stories", timeout=self.timeout
+        ))
+        if saved is not None:
+            story_id = saved.json().get('story_id')
+            self._timed('library', 'GET /view_story/<id>', lambda: self.session.get(
+                f"{self.base_url}/view_story/{story_id}", timeout=self.timeout
+            ))
+
+    def _post_generate(self):
+        response = self.session.post(f"{self.base_url}/generate", data={
+            'description': 'Esme explores a sunny garden and splashes in puddles',
+            'template_type': 'adventure'
+        }, timeout=self.timeout)
+        # Failures render the form again with an error message instead of the story
+        if response.status_code == 200 and '<p class="error">' in response.text:
+            raise RuntimeError('generation returned the error page')
+        return response
+
+    def _timed(self, scenario, endpoint, call):
+        started = time.perf_counter()
+        error = None
+        response = None
+        try:
+            response = call()
+            if response.status_code >= 400:
+                error = f"HTTP {response.status_code}"
+        except Exception as e:
+            error = str(e)[:200]
+        elapsed = time.perf_counter() - started
+
+        with self._lock:
+            result = self.results.setdefault(endpoint, {'scenario': scenario, 'latencies': [], 'errors': {}, 'wall': None})
+            if error:
+                result['errors'][error] = result['errors'].get(error, 0) + 1
+            else:
+                result['latencies'].append(elapsed)
+        return None if error else response
+
+    def report(self):
+        """Throughput and latency percentiles per endpoint."""
+        rows = []
+        for endpoint, result in self.results.items():
+            latencies = sorted(result['latencies'])
+            errors = sum(result['errors'].values())
+            rows.append({
+                'endpoint': endpoint,
+                'requests': len(latencies) + errors,
+                'errors': errors,
+                'error_kinds': result['errors'],
+                'throughput_rps': round(len(latencies) / result['wall'], 2) if result['wall'] else None,
+                'p50_ms': _percentile(latencies, 50),
+                'p95_ms': _percentile(latencies, 95),
+                'p99_ms': _percentile(latencies, 99),
+                'max_ms': _percentile(latencies, 100),
+            })
+        return rows
+
+
+def _percentile(sorted_values, percent):
+    """Nearest-rank percentile in milliseconds."""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-percent * len(sorted_values) // 100))
+    return round(sorted_values[int(rank) - 1] * 1000, 1)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def print_report(rows, settings):
+    print()
+    print(f"concurrency={settings['concurrency']} requests/scenario={settings['requests']} server={settings['server']}")
+    header = f"{'endpoint':<24}{'reqs':>6}{'errs':>6}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+    print(header)
+    print('-' * len(header))
+    for row in rows:
+        cells = [row['throughput_rps'], row['p50_ms'], row['p95_ms'], row['p99_ms'], row['max_ms']]
+        formatted = ''.join(f"{'-' if value is None else value:>{width}}" for value, width in zip(cells, (9, 10, 10, 10, 10)))
+        print(f"{row['endpoint']:<24}{row['requests']:>6}{row['errors']:>6}{formatted}")
+    for row in rows:
+        for error, count in row['error_kinds'].items():
+            print(f"  {row['endpoint']}: {count} x {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--scenarios', default='generate,read,library', help='Comma-separated: generate, read, library')
+    parser.add_argument('--concurrency', type=int, default=8, help='Simultaneous virtual users')
+    parser.add_argument('--requests', type=int, default=32, help='Iterations per scenario')
+    parser.add_argument('--server', default='waitress', choices=['waitress', 'gunicorn', 'uvicorn'])
+    parser.add_argument('--workers', type=int, default=1, help='Server worker processes')
+    parser.add_argument('--threads', type=int, default=16, help='Threads per worker (waitress/gunicorn)')
+    parser.add_argument('--target', help='Benchmark an already running app instead of starting one')
+    parser.add_argument('--json', help='Also write the results to this file')
+    parser.add_argument('--keep', action='store_true', help="Keep the app's scratch directory and log")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    scenarios = [scenario.strip() for scenario in args.scenarios.split(',') if scenario.strip()]
+
+    mock = None
+    app_server = None
+    try:
+        if args.target:
+            base_url = args.target.rstrip('/')
+        else:
+            mock = MockUpstreams(settings=parse_settings(args), seed=args.seed).start()
+            app_server = AppServer(args.server, mock.environment(), args.workers, args.threads).start()
+            base_url = app_server.base_url
+
+        load_test = LoadTest(base_url, args.concurrency, args.requests)
+        for scenario in scenarios:
+            logging.info(f"Running {scenario}: {args.requests} iterations at concurrency {args.concurrency}...")
+            wall = load_test.run(scenario)
+            logging.info(f"✓ {scenario} finished in {wall:.1f}s")
+
+        rows = load_test.report()
+        settings = {'concurrency': args.concurrency, 'requests': args.requests,
+                    'server': 'external' if args.target else args.server}
+        print_report(rows, settings)
+        if mock:
+            print(f"\nupstream calls: {json.dumps(dict(sorted(mock.requests.items())))}")
+        if args.json:
+            with open(args.json, 'w') as f:
+                json.dump({'settings': settings, 'results': rows,
+                           'upstream_calls': mock.requests if mock else None}, f, indent=2)
+    finally:
+        if app_server:
+            app_server.stop(keep_workdir=args.keep)
+        if mock:
+            mock.stop()
+
+
+if __name__ == '__main__':
+    main()
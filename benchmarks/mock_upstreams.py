@@ -0,0 +1,393 @@
+"""Local stand-ins for the Claude, Stability and ElevenLabs APIs.
+
+One threaded HTTP server answers every route the services call, with the
+same request and response shapes:
+
+    POST /v1/messages                                    Claude Messages (JSON or SSE stream)
+    POST /v1/generation/<engine>/text-to-image           Stability image generation
+    POST /v1/generation/<engine>/image-to-image
+    POST /v2beta/image-to-video                          Stability video render (returns an id)
+    GET  /v2beta/image-to-video/result/<id>              202 while rendering, then MP4 bytes
+    GET  /v1/user/account, /v1/user/balance              Stability key check
+    GET  /v1/voices                                      ElevenLabs voices
+    POST /v1/text-to-speech/<voice>/stream               ElevenLabs streamed MP3
+
+Latency, jitter, error rate and payload sizes are set per upstream. Point
+the app at it with environment() (CLAUDE_API_URL, STABILITY_API_HOST,
+ELEVEN_LABS_API_URL and dummy keys).
+
+Run on its own:
+    python benchmarks/mock_upstreams.py --port 9100 --claude-latency 1.5 --error-rate 0.02
+"""
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import base64
+import random
+import logging
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from PIL import Image
+
+UPSTREAM_DEFAULTS = {
+    'claude': {
+        'latency': 0.8,          # Seconds to the first byte
+        'jitter': 0.2,           # Standard deviation of the latency
+        'error_rate': 0.0,       # Share of calls answered with error_status
+        'error_status': 529,
+        'stream_interval': 0.02, # Seconds between streamed text deltas
+        'stanzas': 6,
+    },
+    'stability': {
+        'latency': 3.0,
+        'jitter': 0.5,
+        'error_rate': 0.0,
+        'error_status': 503,
+        'image_size': 512,       # Pixels per side of the returned PNG
+        'video_kb': 512,
+        'video_polls': 2,        # Result polls answered 202 before the video is ready
+    },
+    'elevenlabs': {
+        'latency': 0.3,
+        'jitter': 0.1,
+        'error_rate': 0.0,
+        'error_status': 429,
+        'audio_kb': 96,
+        'chunk_kb': 8,
+        'chunk_interval': 0.02,  # Seconds between audio chunks
+    },
+}
+
+STANZA_LINES = [
+    "Esme skipped along the garden path,",
+    "Where sunflowers nodded in a row,",
+    "She found a puddle for a splashing bath,",
+    "And giggled as the breezes blow.",
+]
+
+
+class MockUpstreams:
+    """Threaded HTTP server impersonating the three remote APIs."""
+
+    def __init__(self, host="127.0.0.1", port=0, settings=None, seed=None):
+        """Initialize MockUpstreams.
+
+        Args:
+            host (str): Interface to listen on
+            port (int): Port to listen on (0 picks a free one)
+            settings (dict): Per-upstream overrides of UPSTREAM_DEFAULTS
+            seed (int, optional): Seed for latency and error sampling
+        """
+        self.settings = {name: dict(values) for name, values in UPSTREAM_DEFAULTS.items()}
+        for name, overrides in (settings or {}).items():
+            self.settings[name].update(overrides)
+
+        self.random = random.Random(seed)
+        self.requests = {}
+        self._lock = threading.Lock()
+        self._renders = {}
+        self._image_base64 = self._build_image(self.settings['stability']['image_size'])
+        self._video = os.urandom(self.settings['stability']['video_kb'] * 1024)
+
+        self.server = ThreadingHTTPServer((host, port), _Handler)
+        self.server.daemon_threads = True
+        self.server.mock = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def environment(self):
+        """Environment variables pointing the app at this server."""
+        return {
+            'CLAUDE_API_URL': f"{self.base_url}/v1/messages",
+            'STABILITY_API_HOST': self.base_url,
+            'ELEVEN_LABS_API_URL': f"{self.base_url}/v1",
+            'CLAUDE_API_KEY': 'mock-claude-key',
+            'STABILITY_API_KEY': 'mock-stability-key',
+            'ELEVEN_LABS_API_KEY': 'mock-elevenlabs-key',
+        }
+
+    def start(self):
+        """Serve in a background thread."""
+        self._thread = threading.Thread(target=self.server.serve_forever, name='mock-upstreams', daemon=True)
+        self._thread.start()
+        logging.info(f"✓ Mock upstreams listening on {self.base_url}")
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, route):
+        with self._lock:
+            self.requests[route] = self.requests.get(route, 0) + 1
+
+    def delay(self, upstream):
+        """Sleep for one sampled latency of an upstream."""
+        settings = self.settings[upstream]
+        time.sleep(max(0.0, self.random.gauss(settings['latency'], settings['jitter'])))
+
+    def should_fail(self, upstream):
+        return self.random.random() < self.settings[upstream]['error_rate']
+
+    def start_render(self):
+        render_id = uuid.uuid4().hex
+        with self._lock:
+            self._renders[render_id] = 0
+        return render_id
+
+    def poll_render(self, render_id):
+        """Whether a render is finished, counting this poll."""
+        with self._lock:
+            if render_id not in self._renders:
+                return None
+            self._renders[render_id] += 1
+            return self._renders[render_id] > self.settings['stability']['video_polls']
+
+    def claude_reply(self, prompt):
+        """Text shaped like what each of the app's prompts asks for."""
+        stanzas = self.settings['claude']['stanzas']
+        if '"stanzas"' in prompt:
+            return json.dumps({'stanzas': [
+                {
+                    'text': self._stanza(index),
+                    'simplified': f"Esme can run.\nSee her go to the big tree {index + 1}.",
+                    'image_description': f"Esme in a sunny garden, scene {index + 1}, splashing in a puddle"
+                }
+                for index in range(stanzas)
+            ]}, indent=2)
+        if prompt.startswith('Rewrite one stanza'):
+            return json.dumps({
+                'text': '\n'.join(STANZA_LINES[:-1] + ["And off she skipped to play some more."]),
+                'simplified': "Esme can sit.\nSee her get up.",
+                'image_description': "Esme in a sunny garden, waving at a friendly dog by the gate"
+            })
+        if 'image descriptions' in prompt[:200]:
+            return '\n'.join(
+                f"{index + 1}. Esme in a sunny garden, scene {index + 1}, smiling at the flowers"
+                for index in range(stanzas)
+            )
+        return '\n\n'.join(self._stanza(index) for index in range(stanzas))
+
+    def _stanza(self, index):
+        return '\n'.join(STANZA_LINES[:-1] + [f"{STANZA_LINES[-1][:-1]} (part {index + 1})."])
+
+    def _build_image(self, size):
+        image = Image.effect_noise((size, size), 48).convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG')
+        return base64.b64encode(buffer.getvalue()).decode()
+
+    @property
+    def image_base64(self):
+        return self._image_base64
+
+    @property
+    def video(self):
+        return self._video
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def mock(self):
+        return self.server.mock
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path.startswith('/v2beta/image-to-video/result/'):
+            self._video_result(path.rsplit('/', 1)[-1])
+        elif path == '/v1/user/account':
+            self.mock.count('stability.account')
+            self._send_json(200, {'id': 'mock', 'email': 'mock@example.com', 'organizations': [{'name': 'Mock'}]})
+        elif path == '/v1/user/balance':
+            self.mock.count('stability.balance')
+            self._send_json(200, {'credits': 1000.0})
+        elif path == '/v1/voices':
+            self.mock.count('elevenlabs.voices')
+            self.mock.delay('elevenlabs')
+            self._send_json(200, {'voices': [
+                {'voice_id': 'mock-sarah', 'name': 'Sarah (mock)'},
+                {'voice_id': 'mock-george', 'name': 'George (mock)'},
+            ]})
+        else:
+            self._send_json(404, {'error': f'No mock for GET {path}'})
+
+    def do_POST(self):
+        path = self.path.split('?')[0]
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+        if path == '/v1/messages':
+            self._claude(json.loads(body))
+        elif path.startswith('/v1/generation/'):
+            self._stability_image(path.rsplit('/', 1)[-1])
+        elif path == '/v2beta/image-to-video':
+            self._video_submit()
+        elif path.startswith('/v1/text-to-speech/'):
+            self._speech(json.loads(body))
+        else:
+            self._send_json(404, {'error': f'No mock for POST {path}'})
+
+    def _claude(self, payload):
+        stream = payload.get('stream', False)
+        self.mock.count('claude.messages-stream' if stream else 'claude.messages')
+        self.mock.delay('claude')
+        if self.mock.should_fail('claude'):
+            self._send_json(self.mock.settings['claude']['error_status'],
+                            {'type': 'error', 'error': {'type': 'overloaded_error', 'message': 'Overloaded'}})
+            return
+
+        prompt = payload['messages'][0]['content']
+        text = self.mock.claude_reply(prompt)
+        usage = {'input_tokens': len(prompt) // 4, 'output_tokens': len(text) // 4}
+        if not stream:
+            self._send_json(200, {
+                'id': f"msg_{uuid.uuid4().hex[:12]}", 'type': 'message', 'role': 'assistant',
+                'content': [{'type': 'text', 'text': text}], 'usage': usage
+            })
+            return
+
+        def events():
+            yield {'type': 'message_start', 'message': {'usage': {'input_tokens': usage['input_tokens'], 'output_tokens': 1}}}
+            for start in range(0, len(text), 24):
+                yield {'type': 'content_block_delta', 'index': 0,
+                       'delta': {'type': 'text_delta', 'text': text[start:start + 24]}}
+            yield {'type': 'message_delta', 'delta': {'stop_reason': 'end_turn'}, 'usage': {'output_tokens': usage['output_tokens']}}
+            yield {'type': 'message_stop'}
+
+        chunks = (f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode() for event in events())
+        self._send_chunked(200, 'text/event-stream', chunks, self.mock.settings['claude']['stream_interval'])
+
+    def _stability_image(self, operation):
+        self.mock.count(f"stability.{operation}")
+        self.mock.delay('stability')
+        if self.mock.should_fail('stability'):
+            self._send_json(self.mock.settings['stability']['error_status'], {'message': 'Service unavailable'})
+            return
+        self._send_json(200, {'artifacts': [
+            {'base64': self.mock.image_base64, 'seed': 12345, 'finishReason': 'SUCCESS'}
+        ]})
+
+    def _video_submit(self):
+        self.mock.count('stability.image-to-video')
+        self.mock.delay('stability')
+        if self.mock.should_fail('stability'):
+            self._send_json(self.mock.settings['stability']['error_status'], {'errors': ['Service unavailable']})
+            return
+        self._send_json(200, {'id': self.mock.start_render()})
+
+    def _video_result(self, render_id):
+        self.mock.count('stability.image-to-video-result')
+        finished = self.mock.poll_render(render_id)
+        if finished is None:
+            self._send_json(404, {'errors': ['Unknown generation']})
+        elif not finished:
+            self._send_json(202, {'id': render_id, 'status': 'in-progress'})
+        else:
+            self._send_bytes(200, 'video/mp4', self.mock.video)
+
+    def _speech(self, payload):
+        self.mock.count('elevenlabs.text-to-speech')
+        self.mock.delay('elevenlabs')
+        settings = self.mock.settings['elevenlabs']
+        if self.mock.should_fail('elevenlabs'):
+            self._send_json(settings['error_status'], {'detail': {'status': 'too_many_concurrent_requests'}})
+            return
+
+        chunk_size = settings['chunk_kb'] * 1024
+        total = settings['audio_kb'] * 1024
+        chunks = (os.urandom(min(chunk_size, total - start)) for start in range(0, total, chunk_size))
+        self._send_chunked(200, 'audio/mpeg', chunks, settings['chunk_interval'],
+                           headers={'character-cost': str(len(payload.get('text', '')))})
+
+    def _send_json(self, status, data):
+        self._send_bytes(status, 'application/json', json.dumps(data).encode())
+
+    def _send_bytes(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_chunked(self, status, content_type, chunks, interval, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Transfer-Encoding', 'chunked')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            for index, chunk in enumerate(chunks):
+                if index and interval:
+                    time.sleep(interval)
+                self.wfile.write(f"{len(chunk):x}\r\n".encode() + chunk + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading (e.g. a cancelled narration)
+            self.close_connection = True
+
+
+def parse_settings(args):
+    """Per-upstream overrides from command line arguments."""
+    settings = {name: {} for name in UPSTREAM_DEFAULTS}
+    for name in UPSTREAM_DEFAULTS:
+        option = name.replace('elevenlabs', 'speech')
+        latency = getattr(args, f"{option}_latency")
+        if latency is not None:
+            settings[name]['latency'] = latency
+        if args.error_rate is not None:
+            settings[name]['error_rate'] = args.error_rate
+    if args.image_size is not None:
+        settings['stability']['image_size'] = args.image_size
+    if args.audio_kb is not None:
+        settings['elevenlabs']['audio_kb'] = args.audio_kb
+    return settings
+
+
+def add_arguments(parser):
+    """Mock upstream options shared with the load test."""
+    group = parser.add_argument_group('mock upstreams')
+    group.add_argument('--claude-latency', type=float, help='Seconds to the first Claude byte')
+    group.add_argument('--stability-latency', type=float, help='Seconds per Stability call')
+    group.add_argument('--speech-latency', type=float, help='Seconds to the first ElevenLabs byte')
+    group.add_argument('--error-rate', type=float, help='Share of upstream calls that fail (0-1)')
+    group.add_argument('--image-size', type=int, help='Pixels per side of generated images')
+    group.add_argument('--audio-kb', type=int, help='Size of each narration in KB')
+    group.add_argument('--seed', type=int, help='Seed for latency and error sampling')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9100)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    mock = MockUpstreams(args.host, args.port, parse_settings(args), seed=args.seed).start()
+    for name, value in mock.environment().items():
+        print(f"export {name}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
+        sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
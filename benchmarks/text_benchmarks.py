@@ -0,0 +1,241 @@
+"""Micro-benchmarks for the text analysis that runs on every page and narration.
+
+Times ReaderService (process_story_text, calculate_word_timing,
+classify_word_type, _count_syllables) and SpeechService.analyze_text_for_timing
+on a corpus made from the stories in stories.db plus synthetic long texts
+built from the same stanzas. No API keys or network are needed.
+
+Each benchmark is checked against a budget (an upper bound per call, generous
+enough for a slow CI machine) and, with --baseline, against an earlier run on
+the same machine. The script exits with status 1 on any regression, so it can
+gate a deploy:
+
+    python benchmarks/text_benchmarks.py --save-baseline text-baseline.json
+    ... change the text code ...
+    python benchmarks/text_benchmarks.py --baseline text-baseline.json
+"""
+import os
+import re
+import sys
+import json
+import random
+import sqlite3
+import logging
+import argparse
+import tempfile
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# SpeechService sets up usage metering on construction; keep it out of the real database
+os.environ.setdefault('METERING_DB', os.path.join(tempfile.gettempdir(), 'esme-bench-usage.db'))
+
+from services.reader_service import ReaderService  # noqa: E402
+from services.speech_service import SpeechService  # noqa: E402
+
+# Used when stories.db has no stories yet, so the suite always has a realistic page
+SAMPLE_STORY = """Esme skipped along the garden path,
+Where sunflowers nodded in a row.
+She found a puddle for a splashing bath,
+And giggled as the breezes blow.
+
+A ladybird climbed up her thumb,
+Its spots as red as cherry pie.
+"Hello, little friend!" she hummed,
+And watched it flutter to the sky.
+
+The clouds rolled in, all soft and grey,
+The raindrops tapped a pitter-pat.
+Esme danced and twirled away,
+Beneath her yellow polka hat."""
+
+# Microseconds per call (per word for the word-level functions). Several times
+# what a laptop measures, so only real slowdowns trip them.
+BUDGETS_US = {
+    'reader.process_story_text[story]': 2000,
+    'reader.process_story_text[long]': 60000,
+    'reader.calculate_word_timing[normal]': 40,
+    'reader.calculate_word_timing[learning]': 40,
+    'reader.classify_word_type': 30,
+    'reader._count_syllables': 15,
+    'speech.analyze_text_for_timing[story]': 5000,
+    'speech.analyze_text_for_timing[long]': 150000,
+    'speech.analyze_text_for_timing[learning]': 5000,
+}
+
+
+def load_corpus(db_path, long_words=5000, seed=7):
+    """Story texts from the database plus synthetic long texts.
+
+    Args:
+        db_path (str): SQLite database with the stories table
+        long_words (int): Approximate word count of the synthetic long text
+        seed (int): Seed for shuffling stanzas into the long text
+
+    Returns:
+        dict: 'stories' (list of str), 'long' (str) and 'words' (list of str, with punctuation)
+    """
+    stories = []
+    if os.path.exists(db_path):
+        # Read-only, so a benchmark run can't touch the library
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            for story_text, simplified_text in conn.execute('SELECT story_text, simplified_text FROM stories'):
+                stories.extend(text for text in (story_text, simplified_text) if text and text.strip())
+        except sqlite3.Error as e:
+            logging.warning(f"Could not read stories from {db_path}: {e}")
+        finally:
+            conn.close()
+    if not stories:
+        logging.warning(f"No stories in {db_path}, using the built-in sample story")
+        stories = [SAMPLE_STORY]
+
+    stanzas = [stanza.strip() for text in stories for stanza in text.split('\n\n') if stanza.strip()]
+    rng = random.Random(seed)
+    long_stanzas = []
+    word_count = 0
+    while word_count < long_words:
+        stanza = rng.choice(stanzas)
+        long_stanzas.append(stanza)
+        word_count += len(stanza.split())
+
+    words = [word for text in stories for word in text.split()]
+    return {'stories': stories, 'long': '\n\n'.join(long_stanzas), 'words': words}
+
+
+def build_benchmarks(corpus):
+    """Benchmark name -> (function, calls per run)."""
+    reader = ReaderService()
+    speech = SpeechService(None, {})
+    stories = corpus['stories']
+    words = corpus['words']
+    long_text = corpus['long']
+
+    def each_story(function, *args):
+        return lambda: [function(text, *args) for text in stories]
+
+    def each_word(function, *args):
+        return lambda: [function(word, *args) for word in words]
+
+    return {
+        'reader.process_story_text[story]': (each_story(reader.process_story_text), len(stories)),
+        'reader.process_story_text[long]': (lambda: reader.process_story_text(long_text), 1),
+        'reader.calculate_word_timing[normal]': (each_word(reader.calculate_word_timing, 'normal', True), len(words)),
+        'reader.calculate_word_timing[learning]': (each_word(reader.calculate_word_timing, 'learning', True), len(words)),
+        'reader.classify_word_type': (each_word(reader.classify_word_type), len(words)),
+        'reader._count_syllables': (each_word(reader._count_syllables), len(words)),
+        'speech.analyze_text_for_timing[story]': (each_story(speech.analyze_text_for_timing), len(stories)),
+        'speech.analyze_text_for_timing[long]': (lambda: speech.analyze_text_for_timing(long_text), 1),
+        'speech.analyze_text_for_timing[learning]': (each_story(speech.analyze_text_for_timing, 'learning'), len(stories)),
+    }
+
+
+def measure(function, calls, repeat=5):
+    """Best-of-repeat time per call in microseconds.
+
+    The minimum is the least noisy estimate of what the code costs; slower
+    runs measure the machine being busy.
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+    return best / calls * 1_000_000
+
+
+def calibrate(repeat=5):
+    """Time a fixed workload of the same kind (regexes, string and dict work).
+
+    Shared and throttled machines drift by tens of percent between runs;
+    comparing each result relative to this keeps a baseline usable.
+    """
+    text = SAMPLE_STORY.lower()
+
+    def workload():
+        counts = {}
+        for word in re.findall(r'\b\w+\b', text):
+            counts[word] = counts.get(word, 0) + len(re.findall(r'[aeiouy]+', word))
+        return sorted(counts.items())
+
+    return measure(workload, 1, repeat)
+
+
+def check(results, calibration, baseline=None, tolerance=0.5):
+    """Compare results with the budgets and an optional baseline.
+
+    Args:
+        results (dict): Benchmark name -> microseconds per call
+        calibration (float): This run's calibrate() time
+        baseline (dict, optional): An earlier run's 'results' and 'calibration'
+        tolerance (float): Allowed slowdown against the baseline
+
+    Returns:
+        list: One message per regression (empty when everything passed)
+    """
+    # How much slower this machine is right now than when the baseline was taken
+    speed = calibration / baseline['calibration'] if baseline else 1.0
+    failures = []
+    for name, microseconds in results.items():
+        budget = BUDGETS_US.get(name)
+        if budget is not None and microseconds > budget:
+            failures.append(f"{name}: {microseconds:.2f}us is over its {budget}us budget")
+        if baseline and name in baseline['results']:
+            expected = baseline['results'][name] * speed
+            if microseconds > expected * (1 + tolerance):
+                slowdown = (microseconds / expected - 1) * 100
+                failures.append(f"{name}: {microseconds:.2f}us is {slowdown:.0f}% slower than the baseline "
+                                f"({expected:.2f}us after adjusting for machine speed)")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--db', default=os.path.join(ROOT, 'stories.db'), help='Database to take stories from')
+    parser.add_argument('--long-words', type=int, default=5000, help='Words in the synthetic long text')
+    parser.add_argument('--repeat', type=int, default=5, help='Timing runs per benchmark (the best counts)')
+    parser.add_argument('--filter', help='Only run benchmarks whose name matches this regex')
+    parser.add_argument('--baseline', help='Fail if slower than this earlier run by more than --tolerance')
+    parser.add_argument('--tolerance', type=float, default=0.5,
+                        help='Allowed slowdown against the baseline (0.5 = 50%%; lower it on a quiet machine)')
+    parser.add_argument('--save-baseline', help='Write the results to this file for later --baseline runs')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    corpus = load_corpus(args.db, args.long_words)
+    logging.info(f"Corpus: {len(corpus['stories'])} story texts, {len(corpus['words'])} words, "
+                 f"{len(corpus['long'].split())} words of synthetic long text")
+
+    calibration = calibrate(args.repeat)
+    results = {}
+    print(f"\n{'benchmark':<44}{'us/call':>12}{'budget':>10}")
+    print('-' * 66)
+    for name, (function, calls) in build_benchmarks(corpus).items():
+        if args.filter and not re.search(args.filter, name):
+            continue
+        results[name] = measure(function, calls, args.repeat)
+        print(f"{name:<44}{results[name]:>12.2f}{BUDGETS_US.get(name, '-'):>10}")
+
+    calibration = min(calibration, calibrate(args.repeat))
+    print(f"{'calibration':<44}{calibration:>12.2f}")
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'results': results, 'calibration': calibration, 'corpus_words': len(corpus['words'])}, f, indent=2)
+        logging.info(f"✓ Saved baseline to {args.save_baseline}")
+
+    failures = check(results, calibration, baseline, args.tolerance)
+    print()
+    for failure in failures:
+        logging.error(f"✗ {failure}")
+    if failures:
+        sys.exit(1)
+    logging.info(f"✓ {len(results)} benchmarks within budget" + (' and baseline' if baseline else ''))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Production entry point for Esme's Story Generator.
+
+main() imports app, which creates the service singletons and initializes
+the database once, before any worker starts (gunicorn's preload), so
+workers fork with everything ready. The import is deferred to main() so
+that processes spawned from this script (local video rendering) don't load
+the whole app again.
+
+    python main.py
+
+Configuration (environment variables):
+    PORT              Port to listen on (default 8080)
+    SERVER            'gunicorn' or 'waitress' (default: gunicorn if installed)
+    WEB_CONCURRENCY   Worker processes (default: number of CPUs)
+    WEB_THREADS       Threads per worker (default 8; requests are I/O-bound)
+    WORKER_TIMEOUT    Seconds before a silent worker is killed (default 600)
+    GRACEFUL_TIMEOUT  Seconds to let in-flight generations finish on shutdown (default 300)
+"""
+import os
+import sys
+import signal
+import logging
+import multiprocessing
+
+
+def server_settings():
+    """Read worker/thread configuration from the environment."""
+    return {
+        'port': int(os.environ.get('PORT', 8080)),
+        'workers': int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count())),
+        'threads': int(os.environ.get('WEB_THREADS', 8)),
+        # A full /generate with animation can take several minutes
+        'timeout': int(os.environ.get('WORKER_TIMEOUT', 600)),
+        'graceful_timeout': int(os.environ.get('GRACEFUL_TIMEOUT', 300)),
+    }
+
+
+def _post_worker_init(worker):
+    """Start per-worker background work, and flip readiness to draining as soon as a worker is asked to stop."""
+    from app import lifecycle_service, ken_burns_service, background_pool_service
+
+    ken_burns_service.start()
+    background_pool_service.start()
+    previous_handler = signal.getsignal(signal.SIGTERM)
+
+    def handle_term(signum, frame):
+        lifecycle_service.begin_shutdown()
+        if callable(previous_handler):
+            previous_handler(signum, frame)
+
+    signal.signal(signal.SIGTERM, handle_term)
+
+
+def run_gunicorn(settings):
+    """Serve with gunicorn's threaded workers, preloading the app in the master."""
+    from gunicorn.app.base import BaseApplication
+    from app import app
+
+    class StoryServer(BaseApplication):
+        def __init__(self, application, options):
+            self.application = application
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return self.application
+
+    options = {
+        'bind': f"0.0.0.0:{settings['port']}",
+        'workers': settings['workers'],
+        'threads': settings['threads'],
+        'worker_class': 'gthread',
+        'timeout': settings['timeout'],
+        'graceful_timeout': settings['graceful_timeout'],
+        'preload_app': True,
+        'post_worker_init': _post_worker_init,
+    }
+    logging.info(f"Starting gunicorn: {settings['workers']} workers x {settings['threads']} threads on port {settings['port']}")
+    StoryServer(app, options).run()
+
+
+def run_waitress(settings):
+    """Serve with waitress (single process), draining in-flight generations on SIGTERM."""
+    from waitress import serve
+    from app import app, lifecycle_service, ken_burns_service, background_pool_service
+
+    ken_burns_service.start()
+    background_pool_service.start()
+
+    def handle_term(signum, frame):
+        lifecycle_service.begin_shutdown()
+        lifecycle_service.wait_for_drain(settings['graceful_timeout'])
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, handle_term)
+
+    if settings['workers'] > 1:
+        logging.warning("waitress runs a single process; WEB_CONCURRENCY is ignored (use gunicorn to scale across cores)")
+    logging.info(f"Starting waitress: {settings['threads']} threads on port {settings['port']}")
+    serve(app, host='0.0.0.0', port=settings['port'], threads=settings['threads'],
+          channel_timeout=settings['timeout'])
+
+
+def main():
+    settings = server_settings()
+    server = os.environ.get('SERVER')
+
+    if server is None:
+        try:
+            import gunicorn  # noqa: F401
+            server = 'gunicorn'
+        except ImportError:
+            server = 'waitress'
+
+    if server == 'gunicorn':
+        run_gunicorn(settings)
+    elif server == 'waitress':
+        run_waitress(settings)
+    else:
+        raise SystemExit(f"Unknown SERVER '{server}' (expected 'gunicorn' or 'waitress')")
+
+
+if __name__ == '__main__':
+    main()
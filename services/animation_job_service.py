@@ -0,0 +1,511 @@
+import os
+import heapq
+import hashlib
+import threading
+import logging
+import time
+import uuid
+from itertools import count
+from concurrent.futures import ThreadPoolExecutor
+from services.metering_service import get_meter
+from services.telemetry_service import get_telemetry
+
+class AnimationJobService:
+    """Runs Stability image-to-video renders as background jobs and patches finished videos into stories.
+
+    Submitting a render only uploads the image. A single scheduler thread per
+    process polls Stability with backoff, saves the MP4 when it is ready and
+    updates the matching pages of the temporary story (and any saved copy of
+    it), so /generate can return the story pages straight away.
+
+    Summary renders are submitted immediately. Per-page renders wait on a
+    bounded render queue, ordered by page position, and are started a few
+    at a time; pages with an identical image share a single render.
+
+    When there is no Stability key, or the remote render can't be started or
+    fails, the job falls back to a local Ken Burns render if one is available.
+    """
+
+    def __init__(self, animation_service, storage_service, local_renderer=None,
+                 poll_interval=10, max_poll_interval=30, max_wait=900,
+                 max_queued_renders=24, max_concurrent_renders=2, max_pages_per_story=4, daily_page_budget=12):
+        """Initialize AnimationJobService.
+
+        Args:
+            animation_service (StorySummaryAnimationService): Submits and fetches renders
+            storage_service (StorageService): Where stories waiting on a render live
+            local_renderer (KenBurnsService, optional): CPU fallback renderer
+            poll_interval (float): Seconds before the first poll
+            max_poll_interval (float): Upper bound for the poll backoff
+            max_wait (float): Seconds after which a render is given up on
+            max_queued_renders (int): Page renders allowed to wait in the queue
+            max_concurrent_renders (int): Page renders running on Stability at once
+            max_pages_per_story (int): Most pages animated in one story
+            daily_page_budget (int): Page renders each user may start per day
+        """
+        self.animation_service = animation_service
+        self.storage_service = storage_service
+        self.local_renderer = local_renderer
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.max_wait = max_wait
+        self.max_queued_renders = max_queued_renders
+        self.max_concurrent_renders = max_concurrent_renders
+        self.max_pages_per_story = max_pages_per_story
+        self.daily_page_budget = daily_page_budget
+        # Page renders are submitted from the scheduler thread, outside the story's request
+        self.meter = get_meter()
+        self.telemetry = get_telemetry()
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._jobs = {}
+        self._schedule = []
+        self._render_queue = []
+        self._queue_order = count()
+        self._active_renders = 0
+        self._scheduler_pid = None
+        # Local renders already use a process pool each; run them one at a time
+        self._local_renders = ThreadPoolExecutor(max_workers=1, thread_name_prefix='local-render')
+
+    def submit(self, story_content, character_description, reading_mode="normal"):
+        """Submit a story summary render and start polling it in the background.
+
+        Args:
+            story_content (list): List of story page data
+            character_description (str): Character description
+            reading_mode (str): Reading mode
+
+        Returns:
+            dict: A 'rendering' job (job_id, started_at, ...) or a failed animation result
+        """
+        with self.telemetry.span('animation.submit_summary', 'stability'):
+            submitted = self.animation_service.submit_story_summary_animation(
+                story_content, character_description, reading_mode
+            )
+        if not submitted['success']:
+            if not self._can_render_locally():
+                return submitted
+            logging.info(f"Rendering story summary animation locally: {submitted['error']}")
+            prepared = self.animation_service.prepare_summary_animation(story_content, character_description)
+            if 'error' in prepared:
+                return {'success': False, 'error': prepared['error']}
+            job = self._new_summary_job(f"local-{uuid.uuid4().hex}", prepared, story_content, reading_mode)
+            with self._lock:
+                self._forget_finished_jobs()
+                self._jobs[job['job_id']] = job
+            self._local_renders.submit(self._render_locally, job, submitted['error'])
+            return self._describe(job)
+
+        job = self._new_summary_job(submitted['generation_id'], submitted['prepared'], story_content, reading_mode)
+        job['generation_id'] = submitted['generation_id']
+        self._ensure_scheduler()
+        with self._lock:
+            self._forget_finished_jobs()
+            self._jobs[job['job_id']] = job
+            heapq.heappush(self._schedule, (job['started_at'] + job['interval'], job['job_id']))
+            self._wakeup.notify()
+
+        return self._describe(job)
+
+    def _new_summary_job(self, job_id, prepared, story_content, reading_mode):
+        return {
+            'job_id': job_id,
+            'kind': 'summary',
+            'status': 'rendering',
+            'success': False,
+            'started_at': time.time(),
+            'interval': self.poll_interval,
+            'prepared': prepared,
+            'summary_image': f"/{prepared['summary_image_path']}",
+            'story_summary': prepared['story_summary'],
+            # Kept for the local fallback render, each page animated at its own strength
+            'pages': [
+                {'image': page.get('image', ''), 'motion_intensity': motion['motion_intensity']}
+                for page, motion in zip(story_content, prepared['page_motion'])
+                if not page.get('is_summary_page')
+            ],
+            'reading_mode': reading_mode,
+            'temp_ids': [],
+            'result': None
+        }
+
+    def start_summary_page(self, story_content, character_description, reading_mode="normal"):
+        """Build the summary page for a story, rendering its animation in the background.
+
+        Args:
+            story_content (list): List of story page data
+            character_description (str): Character description
+            reading_mode (str): Reading mode
+
+        Returns:
+            dict: Summary page (animation 'rendering', or 'failed' if the render could not start)
+        """
+        logging.info("Adding story summary animation page...")
+        job = self.submit(story_content, character_description, reading_mode)
+        return self.animation_service.build_summary_page(story_content, job)
+
+    def enqueue_page_animations(self, story_content, user_id, reading_mode="normal"):
+        """Queue animations for the liveliest pages of a story.
+
+        Pages are marked 'queued' in place and filled in as their renders
+        finish. A page whose image has already been animated, or is waiting
+        to be, reuses that render without spending the user's budget.
+
+        Args:
+            story_content (list): List of story page data
+            user_id (str): Whose daily page animation budget to charge
+            reading_mode (str): Reading mode
+
+        Returns:
+            list: The story content, with the selected pages marked
+        """
+        page_motion = self.animation_service.analyze_page_motion(story_content)
+        selected = sorted(
+            (index for index, page in enumerate(story_content) if not page.get('is_summary_page')),
+            key=lambda index: -page_motion[index]['motion_intensity']
+        )[:self.max_pages_per_story]
+
+        new_jobs = {}
+        for index in sorted(selected):
+            page = story_content[index]
+            image_path = page.get('image', '').lstrip('/')
+            if not image_path or not os.path.exists(image_path):
+                continue
+            with open(image_path, 'rb') as f:
+                image_hash = hashlib.sha256(f.read()).hexdigest()
+            job_id = f"page-{image_hash[:16]}"
+            video_path = self.animation_service.page_video_path(image_hash)
+
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job and job['status'] == 'failed':
+                    job = None
+
+            if job or job_id in new_jobs:
+                self._mark_page(page, job or new_jobs[job_id])
+            elif os.path.exists(video_path):
+                # Animated before, possibly by another worker or before a restart
+                self._apply_page_result(page, {
+                    'success': True,
+                    'video_path': f"/{video_path}",
+                    'duration': 4.0,
+                    'description': "Animated scene"
+                })
+            else:
+                new_jobs[job_id] = {
+                    'job_id': job_id,
+                    'kind': 'page',
+                    'status': 'queued',
+                    'success': False,
+                    'started_at': time.time(),
+                    'interval': self.poll_interval,
+                    # Readers reach earlier pages first
+                    'priority': index,
+                    'image_path': image_path,
+                    'image_hash': image_hash,
+                    'pages': [{'image': page['image'], 'motion_intensity': page_motion[index]['motion_intensity']}],
+                    'reading_mode': reading_mode,
+                    'usage_id': self.meter.current_usage_id(),
+                    'temp_ids': [],
+                    'result': None
+                }
+                self._mark_page(page, new_jobs[job_id])
+
+        if not new_jobs:
+            return story_content
+
+        # Livelier pages get the budget and queue slots first
+        candidates = sorted(new_jobs.values(), key=lambda job: -job['pages'][0]['motion_intensity'])
+        with self._lock:
+            free_slots = max(0, self.max_queued_renders - len(self._render_queue))
+        granted = self.storage_service.reserve_animation_budget(
+            user_id, min(len(candidates), free_slots), self.daily_page_budget
+        )
+
+        for job in candidates[granted:]:
+            logging.info(f"Not animating {job['image_path']}: daily budget used up or render queue full")
+            for page in story_content:
+                if page.get('animation_job') == job['job_id']:
+                    for key in ('animation_status', 'animation_job', 'animation_started_at'):
+                        page.pop(key, None)
+
+        self._ensure_scheduler()
+        with self._lock:
+            self._forget_finished_jobs()
+            for job in candidates[:granted]:
+                self._jobs[job['job_id']] = job
+                heapq.heappush(self._render_queue, (job['priority'], next(self._queue_order), job['job_id']))
+            self._wakeup.notify()
+            queued = len(self._render_queue)
+
+        logging.info(f"Queued {granted} page animations ({queued} waiting)")
+        return story_content
+
+    def _mark_page(self, page, job):
+        if job['status'] == 'complete':
+            self._apply_page_result(page, job['result'])
+        else:
+            page.update({
+                'animation_status': job['status'],
+                'animation_job': job['job_id'],
+                'animation_started_at': job['started_at']
+            })
+
+    def attach_temp_story(self, job_id, temp_id):
+        """Tell a job which temporary story to patch when its render finishes.
+
+        Args:
+            job_id (str): Animation job ID
+            temp_id (str): Temporary story ID
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if not job:
+                return
+            job['temp_ids'].append(temp_id)
+            finished = job['status'] in ('complete', 'failed')
+        # Renders almost never beat the story to storage, but patch now if this one did
+        if finished:
+            self._patch_stories(job)
+
+    def status(self, job_id, temp_id=None):
+        """Current state of an animation job.
+
+        Jobs are polled by the worker that submitted them; any other worker
+        reads the state that has been patched into storage.
+
+        Args:
+            job_id (str): Animation job ID
+            temp_id (str, optional): Temporary story to look in if the job isn't in this process
+
+        Returns:
+            dict: job_id, status and video_path/error when finished, or None if unknown
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                return self._describe(job)
+
+        page = self._find_stored_page(job_id, temp_id)
+        if not page:
+            return None
+
+        status = {'job_id': job_id, 'status': page.get('animation_status', 'rendering')}
+        if status['status'] == 'complete':
+            status['video_path'] = page.get('animation')
+        elif status['status'] == 'failed':
+            status['error'] = page.get('animation_error')
+        elif time.time() - page.get('animation_started_at', 0) > self.max_wait:
+            # The worker polling this render went away (e.g. a restart)
+            status.update({'status': 'failed', 'error': 'Animation render was interrupted'})
+        return status
+
+    def queue_status(self):
+        """Depth of the page render queue, for monitoring."""
+        with self._lock:
+            return {
+                'queued': len(self._render_queue),
+                'rendering': self._active_renders,
+                'max_queued': self.max_queued_renders,
+                'max_concurrent': self.max_concurrent_renders
+            }
+
+    def _describe(self, job):
+        status = {
+            'job_id': job['job_id'],
+            'status': job['status'],
+            'success': job['success'],
+            'started_at': job['started_at'],
+            'elapsed_seconds': int(time.time() - job['started_at'])
+        }
+        if job['kind'] == 'summary':
+            status['summary_image'] = job['summary_image']
+            status['story_summary'] = job['story_summary']
+        if job['result']:
+            status.update(job['result'])
+        return status
+
+    def _forget_finished_jobs(self):
+        """Drop old finished jobs; their results live on in the stories they patched."""
+        cutoff = time.time() - 2 * self.max_wait
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job['status'] in ('complete', 'failed') and job['started_at'] < cutoff]:
+            del self._jobs[job_id]
+
+    def _ensure_scheduler(self):
+        """Start the polling thread once per process (workers fork after preload)."""
+        with self._lock:
+            if self._scheduler_pid == os.getpid():
+                return
+            self._scheduler_pid = os.getpid()
+        threading.Thread(target=self._run_scheduler, name='animation-jobs', daemon=True).start()
+
+    def _run_scheduler(self):
+        while True:
+            with self._lock:
+                while True:
+                    if self._render_queue and self._active_renders < self.max_concurrent_renders:
+                        _, _, job_id = heapq.heappop(self._render_queue)
+                        self._active_renders += 1
+                        step, stage, job = self._start_page_render, 'animation.submit_page', self._jobs[job_id]
+                        break
+                    if self._schedule and self._schedule[0][0] <= time.time():
+                        _, job_id = heapq.heappop(self._schedule)
+                        step, stage, job = self._poll, 'animation.poll', self._jobs.get(job_id)
+                        break
+                    timeout = self._schedule[0][0] - time.time() if self._schedule else None
+                    self._wakeup.wait(timeout)
+
+            if job:
+                try:
+                    with self.meter.story_scope(job.get('usage_id')), self.telemetry.span(stage, 'stability', kind=job['kind']):
+                        step(job)
+                except Exception as e:
+                    logging.error(f"Error running animation job {job['job_id']}: {e}")
+                    self._finish(job, {'success': False, 'error': f'Unexpected error: {str(e)}'})
+
+    def _start_page_render(self, job):
+        """Submit a queued page render and start polling it."""
+        with self._lock:
+            job['status'] = 'rendering'
+            job['started_at'] = time.time()
+
+        submitted = self.animation_service.submit_page_animation(
+            job['image_path'], job['pages'][0]['motion_intensity']
+        )
+        if not submitted['success']:
+            self._fail(job, submitted['error'])
+            return
+
+        with self._lock:
+            job['generation_id'] = submitted['generation_id']
+            heapq.heappush(self._schedule, (time.time() + job['interval'], job['job_id']))
+
+    def _poll(self, job):
+        """Check one job and either reschedule it with backoff or finish it."""
+        result = self.animation_service.fetch_animation_result(job['generation_id'])
+
+        if result['status'] == 'complete':
+            if job['kind'] == 'page':
+                saved = self.animation_service.save_page_video(result['video_data'], job['image_hash'])
+            else:
+                saved = self.animation_service.save_summary_video(result['video_data'], job['prepared'], job['job_id'])
+            if saved['success']:
+                self._finish(job, saved)
+            else:
+                self._fail(job, saved['error'])
+        elif result['status'] == 'failed':
+            self._fail(job, result['error'])
+        elif time.time() - job['started_at'] > self.max_wait:
+            self._fail(job, f'Animation did not finish within {self.max_wait} seconds')
+        else:
+            with self._lock:
+                job['interval'] = min(self.max_poll_interval, job['interval'] * 1.5)
+                heapq.heappush(self._schedule, (time.time() + job['interval'], job['job_id']))
+
+    def _fail(self, job, error):
+        """Finish a failed remote render, handing it to the local renderer if there is one."""
+        if self._can_render_locally():
+            logging.info(f"Animation job {job['job_id']} failed remotely, rendering locally: {error}")
+            self._local_renders.submit(self._render_locally, job, error)
+        else:
+            self._finish(job, {'success': False, 'error': error})
+
+    def _can_render_locally(self):
+        return self.local_renderer is not None and self.local_renderer.is_available()
+
+    def _render_locally(self, job, remote_error):
+        """Render the job's pages as a Ken Burns slideshow and finish the job with it."""
+        try:
+            motion_intensity = job['prepared']['motion_intensity'] if job['kind'] == 'summary' else 0.5
+            with self.telemetry.span('animation.local_render', kind=job['kind']):
+                rendered = self.local_renderer.render(job['pages'], motion_intensity, job['reading_mode'])
+        except Exception as e:
+            rendered = {'success': False, 'error': f'Local render failed: {str(e)}'}
+
+        if not rendered['success']:
+            self._finish(job, {'success': False, 'error': f"{remote_error}; {rendered['error']}"})
+        elif job['kind'] == 'page':
+            self._finish(job, {
+                'success': True,
+                'video_path': rendered['video_path'],
+                'duration': rendered['duration'],
+                'description': "Animated scene"
+            })
+        else:
+            prepared = job['prepared']
+            self._finish(job, {
+                'success': True,
+                'video_path': rendered['video_path'],
+                'summary_image': job['summary_image'],
+                'story_summary': prepared['story_summary'],
+                'motion_intensity': prepared['motion_intensity'],
+                'duration': rendered['duration'],
+                'description': "Story summary slideshow"
+            })
+
+    def _finish(self, job, result):
+        with self._lock:
+            if job['kind'] == 'page' and job['status'] == 'rendering':
+                # Frees a slot for the next queued page
+                self._active_renders -= 1
+                self._wakeup.notify()
+            job['status'] = 'complete' if result['success'] else 'failed'
+            job['success'] = result['success']
+            job['result'] = result
+        logging.info(f"Animation job {job['job_id']} {job['status']} after {int(time.time() - job['started_at'])}s")
+        self._patch_stories(job)
+
+    def _patch_stories(self, job):
+        """Write a finished job's result into every stored copy of its story."""
+        try:
+            # Re-read under the story's lock so other jobs and page changes finishing now aren't lost
+            for temp_id in list(job['temp_ids']):
+                self.storage_service.modify_temp_story(temp_id, lambda story: self._patch_content(story['content'], job))
+
+            # The story may have been saved to the library while it was rendering
+            for story_id in self.storage_service.find_stories_by_animation_job(job['job_id']):
+                self.storage_service.modify_story(story_id, lambda story: self._patch_content(story['content'], job))
+        except Exception as e:
+            logging.error(f"Error updating stories for animation job {job['job_id']}: {e}")
+
+    def _patch_content(self, content, job):
+        patched = False
+        for page in content:
+            if page.get('animation_job') == job['job_id']:
+                if page.get('is_summary_page'):
+                    self.animation_service.apply_animation_result(page, job['result'])
+                else:
+                    self._apply_page_result(page, job['result'])
+                patched = True
+        return patched
+
+    def _apply_page_result(self, page, result):
+        """Fill a story page in from a finished page render."""
+        if result['success']:
+            page.update({
+                'animation_status': 'complete',
+                'has_animation': True,
+                'animation': result['video_path'],
+                'animation_description': result['description'],
+                'animation_duration': result['duration']
+            })
+        else:
+            page.update({
+                'animation_status': 'failed',
+                'animation_error': result['error']
+            })
+
+    def _find_stored_page(self, job_id, temp_id):
+        stories = []
+        if temp_id:
+            stories.append(self.storage_service.get_temp_story(temp_id))
+        for story_id in self.storage_service.find_stories_by_animation_job(job_id):
+            stories.append(self.storage_service.get_story(story_id))
+
+        for story in stories:
+            for page in (story or {}).get('content', []):
+                if page.get('animation_job') == job_id:
+                    return page
+        return None
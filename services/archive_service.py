@@ -0,0 +1,301 @@
+import os
+import re
+import json
+import uuid
+import time
+import hashlib
+import logging
+import tarfile
+from datetime import datetime
+
+ARCHIVE_FORMAT = 'esme-stories/1'
+
+# Media a story page may point to, with or without the leading slash
+MEDIA_PATH = re.compile(r'^/?(static/(?:images|videos)/[A-Za-z0-9._-]+)$')
+STORY_ID = re.compile(r'^[A-Za-z0-9-]{1,64}$')
+MEDIA_NAME = re.compile(r'^media/([0-9a-f]{64})\.[A-Za-z0-9]+$')
+BLOCK_SIZE = 512
+
+
+class ArchiveService:
+    """Exports and imports saved stories, with their images and videos, as one tar archive.
+
+    The archive holds a manifest, then for each story its media files (named
+    by SHA-256, each stored once however many stories use it) followed by
+    the story row as JSON:
+
+        manifest.json
+        media/<sha256>.jpg          (original path in the esme.path PAX header)
+        stories/<story id>.json
+
+    Both directions stream: export yields the archive in small chunks while
+    reading one story and one file at a time, and import reads the upload
+    entry by entry, so memory stays flat whatever the library size. Media
+    already on disk with the same content is not written again.
+    """
+
+    def __init__(self, storage_service, root=".", chunk_size=65536):
+        """Initialize ArchiveService.
+
+        Args:
+            storage_service (StorageService): Database the stories are read from and written to
+            root (str): Directory static/images and static/videos are relative to
+            chunk_size (int): Bytes read and yielded at a time
+        """
+        self.storage_service = storage_service
+        self.root = root
+        self.chunk_size = chunk_size
+
+    def export_stories(self, story_ids=None):
+        """Stream an archive of some or all saved stories.
+
+        Args:
+            story_ids (list, optional): Stories to export (default: the whole library)
+
+        Yields:
+            bytes: The tar archive, a chunk at a time
+
+        Raises:
+            ValueError: If a requested story does not exist (before anything is yielded)
+        """
+        if story_ids is None:
+            story_ids = [story['id'] for story in self.storage_service.get_all_stories()]
+        else:
+            known = {story['id'] for story in self.storage_service.get_all_stories()}
+            missing = [story_id for story_id in story_ids if story_id not in known]
+            if missing:
+                raise ValueError(f"Unknown stories: {', '.join(missing)}")
+        return self._export(story_ids)
+
+    def _export(self, story_ids):
+        started = time.time()
+        manifest = {
+            'format': ARCHIVE_FORMAT,
+            'exported_at': datetime.now().isoformat(),
+            'story_ids': story_ids
+        }
+        yield from self._json_entry('manifest.json', manifest)
+
+        exported_media = set()
+        media_bytes = 0
+        for story_id in story_ids:
+            try:
+                story = self.storage_service.get_story(story_id)
+            except ValueError:
+                # Deleted since the export started
+                continue
+
+            story['media'] = {}
+            for path in sorted(set(media_paths(story['content']))):
+                local_path = os.path.join(self.root, path)
+                if not os.path.isfile(local_path):
+                    logging.warning(f"Story {story_id} refers to missing media {path}")
+                    continue
+                digest = _file_sha256(local_path, self.chunk_size)
+                story['media'][path] = digest
+                if digest in exported_media:
+                    continue
+                exported_media.add(digest)
+                media_bytes += os.path.getsize(local_path)
+                yield from self._file_entry(f"media/{digest}{os.path.splitext(path)[1]}", local_path, {'esme.path': path})
+
+            yield from self._json_entry(f"stories/{story_id}.json", story)
+
+        # End of archive: two zero blocks
+        yield b'\0' * (BLOCK_SIZE * 2)
+        logging.info(f"✓ Exported {len(story_ids)} stories and {len(exported_media)} media files "
+                     f"({media_bytes // 1024} KB) in {time.time() - started:.1f}s")
+
+    def import_stories(self, stream, replace=False):
+        """Import an archive made by export_stories.
+
+        Args:
+            stream: File-like object the tar archive is read from, front to back
+            replace (bool): Overwrite stories whose ID already exists instead of skipping them
+
+        Returns:
+            dict: Counts of imported, replaced and skipped stories and written/skipped media, plus errors
+
+        Raises:
+            ValueError: If the upload isn't an archive of this format
+        """
+        result = {'imported': 0, 'replaced': 0, 'skipped': 0, 'media_written': 0, 'media_skipped': 0, 'errors': []}
+        # Archive path -> path the file was stored under here, when a different file already had its name
+        renamed = {}
+        # Media hashes seen in this archive, to check each story's files arrived
+        received = set()
+
+        try:
+            archive = tarfile.open(fileobj=stream, mode='r|')
+        except tarfile.TarError as e:
+            raise ValueError(f"Not a story archive: {e}")
+
+        with archive:
+            first = True
+            try:
+                for member in archive:
+                    if first:
+                        self._check_manifest(archive, member)
+                        first = False
+                        continue
+                    if not member.isfile():
+                        continue
+                    try:
+                        if member.name.startswith('media/'):
+                            self._import_media(archive, member, result, renamed, received)
+                        elif member.name.startswith('stories/') and member.name.endswith('.json'):
+                            self._import_story(archive, member, replace, result, renamed, received)
+                    except ValueError as e:
+                        logging.warning(f"Skipping archive entry {member.name}: {e}")
+                        result['errors'].append(f"{member.name}: {e}")
+            except tarfile.TarError as e:
+                # Stories before the damage are already in; report how far it got
+                logging.error(f"✗ Story archive ended early: {e}")
+                result['errors'].append(f"Archive ended early: {e}")
+            if first:
+                raise ValueError("Not a story archive: it is empty")
+
+        logging.info(f"✓ Imported {result['imported']} stories ({result['replaced']} replaced, {result['skipped']} "
+                     f"already present), {result['media_written']} media files written, "
+                     f"{result['media_skipped']} already present")
+        return result
+
+    def _check_manifest(self, archive, member):
+        if member.name != 'manifest.json':
+            raise ValueError("Not a story archive: manifest.json must come first")
+        try:
+            manifest = json.load(archive.extractfile(member))
+        except ValueError:
+            raise ValueError("Not a story archive: unreadable manifest")
+        if manifest.get('format') != ARCHIVE_FORMAT:
+            raise ValueError(f"Unsupported archive format {manifest.get('format')!r}")
+
+    def _import_media(self, archive, member, result, renamed, received):
+        """Write one media file unless identical content already exists."""
+        match = MEDIA_PATH.match(member.pax_headers.get('esme.path', ''))
+        if not match:
+            raise ValueError("missing or unsafe esme.path")
+        name = MEDIA_NAME.match(member.name)
+        if not name:
+            raise ValueError("media is not named by its hash")
+        path = match.group(1)
+        digest = name.group(1)
+
+        target = os.path.join(self.root, path)
+        if os.path.isfile(target):
+            if os.path.getsize(target) == member.size and _file_sha256(target, self.chunk_size) == digest:
+                received.add(digest)
+                result['media_skipped'] += 1
+                return
+            # A different file already has this name; keep both
+            stem, extension = os.path.splitext(path)
+            path = f"{stem}-{digest[:12]}{extension}"
+            target = os.path.join(self.root, path)
+            renamed[match.group(1)] = path
+            if os.path.isfile(target):
+                received.add(digest)
+                result['media_skipped'] += 1
+                return
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # Write then rename, so a failed upload never leaves half a file under the real name
+        partial_path = f"{target}.{uuid.uuid4().hex}.tmp"
+        sha256 = hashlib.sha256()
+        try:
+            source = archive.extractfile(member)
+            with open(partial_path, 'wb') as f:
+                for chunk in iter(lambda: source.read(self.chunk_size), b''):
+                    sha256.update(chunk)
+                    f.write(chunk)
+            if sha256.hexdigest() != digest:
+                raise ValueError("content does not match its hash")
+            os.replace(partial_path, target)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        received.add(digest)
+        result['media_written'] += 1
+
+    def _import_story(self, archive, member, replace, result, renamed, received):
+        try:
+            story = json.load(archive.extractfile(member))
+        except ValueError:
+            raise ValueError("unreadable story")
+        if not STORY_ID.match(str(story.get('id', ''))):
+            raise ValueError("missing or invalid story id")
+
+        media = story.pop('media', {})
+        missing = [path for path, digest in media.items()
+                   if digest not in received and not os.path.isfile(os.path.join(self.root, path))]
+        if missing:
+            logging.warning(f"Story {story['id']} is missing media: {', '.join(missing)}")
+
+        if renamed:
+            story['content'] = _rewrite_media_paths(story.get('content', []), renamed)
+        outcome = self.storage_service.import_story(story, replace=replace)
+        result[outcome] += 1
+
+    def _json_entry(self, name, data):
+        payload = json.dumps(data, indent=1).encode('utf-8')
+        info = tarfile.TarInfo(name)
+        info.size = len(payload)
+        info.mtime = int(time.time())
+        yield info.tobuf(tarfile.PAX_FORMAT)
+        yield payload + _padding(len(payload))
+
+    def _file_entry(self, name, path, pax_headers):
+        """Header, then the file in chunks; never the whole file in memory."""
+        info = tarfile.TarInfo(name)
+        info.size = os.path.getsize(path)
+        info.mtime = int(os.path.getmtime(path))
+        info.pax_headers = pax_headers
+        yield info.tobuf(tarfile.PAX_FORMAT)
+
+        remaining = info.size
+        with open(path, 'rb') as f:
+            while remaining > 0:
+                chunk = f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    raise IOError(f"{path} shrank while it was being exported")
+                remaining -= len(chunk)
+                yield chunk
+        yield _padding(info.size)
+
+
+def media_paths(value):
+    """Every static/images or static/videos path referenced anywhere in a story's content."""
+    if isinstance(value, dict):
+        for item in value.values():
+            yield from media_paths(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from media_paths(item)
+    elif isinstance(value, str):
+        match = MEDIA_PATH.match(value)
+        if match:
+            yield match.group(1)
+
+
+def _padding(size):
+    return b'\0' * (-size % BLOCK_SIZE)
+
+
+def _file_sha256(path, chunk_size=65536):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def _rewrite_media_paths(value, renamed):
+    """Point references at files that were stored under a new name."""
+    if isinstance(value, dict):
+        return {key: _rewrite_media_paths(item, renamed) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_rewrite_media_paths(item, renamed) for item in value]
+    if isinstance(value, str):
+        match = MEDIA_PATH.match(value)
+        if match and match.group(1) in renamed:
+            return value.replace(match.group(1), renamed[match.group(1)])
+    return value
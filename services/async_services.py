@@ -0,0 +1,490 @@
+import asyncio
+import logging
+import time
+
+import httpx
+
+from services.story_service import StoryService
+from services.image_service import ImageService
+from services.speech_service import SpeechService
+from services.resilience_service import UpstreamUnavailable
+from services.story_parser import StoryParser, StructuredStoryParser, clean_story_text
+from services.story_pipeline_service import StoryPipelineService
+
+
+def create_async_client(max_connections=500):
+    """Create the shared httpx client used by every async service.
+
+    One pooled client per process keeps upstream connections warm across
+    requests instead of opening a new TLS session for every call.
+    """
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=50),
+        timeout=httpx.Timeout(30.0)
+    )
+
+
+class AsyncStoryService(StoryService):
+    """StoryService variant whose Claude calls run on an httpx.AsyncClient."""
+
+    def __init__(self, api_key, client):
+        """Initialize with API key and a shared httpx.AsyncClient."""
+        super().__init__(api_key)
+        self.client = client
+
+    async def generate_story_with_template(self, description, character_description, template_type="adventure"):
+        """Generate story using template guidance"""
+        with self.telemetry.span('story.draft', 'claude'):
+            initial_story = await self._call_claude_api(
+                self._build_story_prompt(description, character_description, template_type)
+            )
+
+        if initial_story:
+            initial_story = clean_story_text(initial_story)
+
+        # Simple self-critique (just one improvement pass)
+        if initial_story and self._critique_allowed():
+            with self.telemetry.span('story.critique', 'claude'):
+                improved_story = await self._call_claude_api(self._build_critique_prompt(initial_story))
+            if improved_story:
+                return clean_story_text(improved_story)
+
+        return initial_story
+
+    async def stream_story_with_template(self, description, character_description, template_type="adventure", parser=None):
+        """Generate a story, yielding each page as soon as its stanza has streamed in."""
+        parser = parser if parser is not None else StoryParser(min_pages=3)
+
+        with self.telemetry.span('story.draft', 'claude'):
+            initial_story = await self._call_claude_api(
+                self._build_story_prompt(description, character_description, template_type)
+            )
+        if not initial_story:
+            return
+        initial_story = clean_story_text(initial_story)
+
+        if self._critique_allowed():
+            with self.telemetry.span('story.critique', 'claude'):
+                async for chunk in self._stream_claude_api(self._build_critique_prompt(initial_story)):
+                    for page in parser.feed(chunk):
+                        yield page
+
+        # No improved version came back (or the critique was skipped); keep the draft
+        if not parser.text.strip():
+            for page in parser.feed(initial_story):
+                yield page
+        for page in parser.finish():
+            yield page
+
+    async def stream_structured_story(self, description, character_description, template_type="adventure", parser=None):
+        """Write the story, its simplified version and image descriptions in one streamed call."""
+        parser = parser if parser is not None else StructuredStoryParser()
+        prompt = self._build_structured_story_prompt(description, character_description, template_type)
+
+        with self.telemetry.span('story.structured', 'claude'):
+            async for chunk in self._stream_claude_api(prompt, unescape=False, max_tokens=4000):
+                for page in parser.feed(chunk):
+                    yield page
+        for page in parser.finish():
+            yield page
+
+    async def generate_story(self, description, character_description=None):
+        """Main entry point - use template method"""
+        return await self.generate_story_with_template(description, character_description, "adventure")
+
+    async def generate_simplified_story(self, original_story):
+        """Simplified version for beginning readers"""
+        clean_original = clean_story_text(original_story)
+
+        with self.telemetry.span('story.simplified', 'claude'):
+            simplified = await self._call_claude_api(self._build_simplified_prompt(clean_original))
+        if simplified:
+            return clean_story_text(simplified)
+
+        return self._create_basic_fallback(clean_original)
+
+    async def generate_image_descriptions(self, stanzas, character_description=""):
+        """Generate enhanced image descriptions with character consistency."""
+        try:
+            with self.telemetry.span('story.image_descriptions', 'claude'):
+                response = await self._call_claude_api(self._build_image_descriptions_prompt(stanzas, character_description))
+            return self._parse_image_descriptions(response)
+        except Exception as e:
+            logging.error(f"Error generating image descriptions: {e}")
+            return []
+
+    async def _call_claude_api(self, prompt, max_retries=3):
+        """Call Claude API with retry logic, yielding the event loop while waiting."""
+        for attempt in range(max_retries):
+            try:
+                if attempt > 0:
+                    await asyncio.sleep(2 ** attempt)  # Exponential backoff
+
+                started = time.monotonic()
+                async with self.upstream.async_call() as outcome:
+                    response = await self.client.post(
+                        self.api_url,
+                        json=self._build_claude_payload(prompt),
+                        headers=self._claude_headers(),
+                        timeout=30
+                    )
+                    outcome.record_status(response.status_code)
+
+                if response.status_code == 200:
+                    response_data = response.json()
+                    self._record_usage('messages', started, 200, response_data.get('usage'))
+                    return self._extract_claude_text(response_data)
+                self._record_usage('messages', started, response.status_code)
+                if outcome.overloaded:
+                    raise UpstreamUnavailable('claude', f'overloaded ({response.status_code})')
+                response.raise_for_status()
+
+            except UpstreamUnavailable as e:
+                logging.warning(f"Not retrying Claude call: {e}")
+                raise
+            except Exception as e:
+                if attempt == max_retries - 1:
+                    logging.error(f"Claude API call failed after {max_retries} attempts: {e}")
+                    raise
+                logging.warning(f"Attempt {attempt + 1} failed: {e}")
+
+        return None
+
+
+    async def _stream_claude_api(self, prompt, max_retries=3, unescape=True, max_tokens=1500):
+        """Stream a Claude response as text deltas over server-sent events.
+
+        The Claude concurrency slot is held until the stream has been read to
+        the end or closed.
+        """
+        for attempt in range(max_retries):
+            streaming = False
+            try:
+                if attempt > 0:
+                    await asyncio.sleep(2 ** attempt)  # Exponential backoff
+
+                request = self.client.build_request(
+                    "POST", self.api_url,
+                    json=self._build_claude_payload(prompt, stream=True, max_tokens=max_tokens),
+                    headers=self._claude_headers(),
+                    timeout=httpx.Timeout(30.0)
+                )
+                started = time.monotonic()
+                async with self.upstream.async_call() as outcome:
+                    response = await self.client.send(request, stream=True)
+                    outcome.record_status(response.status_code)
+
+                    if response.status_code == 200:
+                        streaming = True
+                        stream = self._read_claude_stream(response, started, unescape)
+                        try:
+                            async for text in stream:
+                                yield text
+                        finally:
+                            # Closing this generator early must close the response too
+                            await stream.aclose()
+                        return
+
+                await response.aclose()
+                self._record_usage('messages-stream', started, response.status_code)
+                if outcome.overloaded:
+                    raise UpstreamUnavailable('claude', f'overloaded ({response.status_code})')
+                response.raise_for_status()
+
+            except UpstreamUnavailable as e:
+                logging.warning(f"Not retrying Claude call: {e}")
+                raise
+            except Exception as e:
+                if streaming:
+                    raise
+                if attempt == max_retries - 1:
+                    logging.error(f"Claude API stream failed after {max_retries} attempts: {e}")
+                    raise
+                logging.warning(f"Attempt {attempt + 1} failed: {e}")
+
+    async def _read_claude_stream(self, response, started, unescape):
+        """Text deltas of a successful streaming response, metered once it ends."""
+        usage = {}
+        try:
+            pending = ''
+            async for line in response.aiter_lines():
+                text = self._parse_stream_line(line, usage)
+                if text and unescape:
+                    text, pending = self._unescape_delta(pending, text)
+                if text:
+                    yield text
+            if pending:
+                yield pending
+        finally:
+            await response.aclose()
+            self._record_usage('messages-stream', started, 200, usage)
+
+
+class AsyncStoryPipelineService(StoryPipelineService):
+    """StoryPipelineService variant that illustrates pages as asyncio tasks."""
+
+    async def generate(self, description, character_description, template_type="adventure"):
+        """Write and illustrate a story (see StoryPipelineService.generate)."""
+        started = time.monotonic()
+        illustrations = {}
+        story = None
+
+        def schedule(*args):
+            return asyncio.create_task(self._illustrate(*args, template_type))
+
+        async def illustrate(pages):
+            streamed = []
+            async for page in pages:
+                streamed.append(page)
+                self._illustrate_pages(streamed, illustrations, character_description, started, schedule)
+
+        self.image_service.generate_character_profile(character_description)
+
+        try:
+            if self.structured:
+                parser = StructuredStoryParser()
+                try:
+                    await illustrate(self.story_service.stream_structured_story(
+                        description, character_description, template_type, parser=parser
+                    ))
+                except UpstreamUnavailable:
+                    raise
+                except Exception as e:
+                    logging.warning(f"Structured story generation failed: {e}")
+
+                if parser.valid:
+                    story = self._story(parser.story_text, parser.simplified_text, parser.pages)
+                else:
+                    logging.warning("Structured story was incomplete, falling back to step-by-step generation")
+                    self._discard(illustrations)
+
+            if story is None:
+                parser = StoryParser(min_pages=3)
+                await illustrate(self.story_service.stream_story_with_template(
+                    description, character_description, template_type, parser=parser
+                ))
+                if not parser.pages:
+                    return self._story(None, None, [])
+
+                # Minimal filtering can change the page list after streaming; illustrate anything new
+                self._illustrate_pages(parser.pages, illustrations, character_description, started, schedule)
+
+                story_text = clean_story_text(parser.text)
+                simplified_story_text = await self.story_service.generate_simplified_story(story_text)
+                story = self._story(story_text, simplified_story_text, parser.pages)
+
+            illustrated = await asyncio.gather(*[illustrations[text] for text in story['pages']])
+        finally:
+            # Don't leave orphaned renders running if the story failed part way
+            for task in illustrations.values():
+                task.cancel()
+
+        logging.info(f"✓ Story written and illustrated in {time.monotonic() - started:.1f}s ({len(story['pages'])} pages)")
+        story['image_descriptions'] = [image_description for image_description, _ in illustrated]
+        story['image_urls'] = [image_url for _, image_url in illustrated]
+        return story
+
+    async def _illustrate(self, page, character_description, story_context, template_type="adventure"):
+        """Describe one page (unless the structured story already did) and generate its image."""
+        image_description = page.get('image_description')
+        if not image_description:
+            descriptions = await self.story_service.generate_image_descriptions([page['text']], character_description)
+            image_description = descriptions[0] if descriptions else page['text']
+        image_url = self._pooled_image(template_type, image_description)
+        if image_url is None:
+            try:
+                image_url = await self.image_service.generate_story_image(image_description, page['page'], story_context)
+            except UpstreamUnavailable:
+                image_url = self._pooled_image(template_type, image_description, unavailable=True)
+                if image_url is None:
+                    raise
+        return image_description, image_url
+
+
+class AsyncImageService(ImageService):
+    """ImageService variant whose Stability calls run on an httpx.AsyncClient."""
+
+    def __init__(self, api_key, client):
+        """Initialize with API key and a shared httpx.AsyncClient."""
+        super().__init__(api_key)
+        self.client = client
+
+    async def generate_story_image(self, scene_description, page_number, story_context=""):
+        """Main method that chooses photo or text generation"""
+        with self.telemetry.span('image.generate', 'stability', page=page_number):
+            if self.has_reference_photo():
+                return await self.generate_story_image_with_photo(scene_description, page_number, story_context)
+            else:
+                return await self.generate_story_image_text_only(scene_description, page_number, story_context)
+
+    async def generate_story_image_with_photo(self, scene_description, page_number, story_context=""):
+        """Generate image using photo reference, falling back to text-only generation"""
+        if not self.has_reference_photo():
+            logging.info("No photo reference found, using text-only generation")
+            return await self.generate_story_image_text_only(scene_description, page_number, story_context)
+
+        try:
+            logging.info(f"Using photo reference for page {page_number}")
+
+            payload = await asyncio.to_thread(self._build_photo_payload, scene_description)
+            started = time.monotonic()
+            async with self.upstream.async_call() as outcome:
+                response = await self.client.post(
+                    self.image_to_image_url,
+                    headers=self._stability_headers(),
+                    json=payload,
+                    timeout=60
+                )
+                outcome.record_status(response.status_code)
+            self._record_usage('image-to-image', started, response.status_code)
+
+            if response.status_code == 200:
+                image_url = await asyncio.to_thread(
+                    self._store_generated_image, response.json(), scene_description, page_number
+                )
+                logging.info(f"✓ Generated image with photo reference for page {page_number}")
+                return image_url
+            elif outcome.overloaded or outcome.failed:
+                # Stability itself is struggling - a text-to-image retry would only double the load
+                raise UpstreamUnavailable('stability', f'image-to-image returned {response.status_code}')
+            else:
+                logging.warning(f"Photo-based generation failed: {response.status_code} - {response.text}")
+                return await self.generate_story_image_text_only(scene_description, page_number, story_context)
+
+        except (UpstreamUnavailable, httpx.TransportError) as e:
+            logging.error(f"Photo reference generation failed, not falling back: {e}")
+            raise
+        except Exception as e:
+            logging.error(f"Photo reference generation failed: {e}")
+            return await self.generate_story_image_text_only(scene_description, page_number, story_context)
+
+    async def generate_story_image_text_only(self, scene_description, page_number, story_context=""):
+        """Text-only generation with the character consistency prompt"""
+        try:
+            started = time.monotonic()
+            async with self.upstream.async_call() as outcome:
+                response = await self.client.post(
+                    self.text_to_image_url,
+                    headers=self._stability_headers(),
+                    json=self._build_text_only_payload(scene_description),
+                    timeout=60
+                )
+                outcome.record_status(response.status_code)
+            self._record_usage('text-to-image', started, response.status_code)
+
+            if response.status_code == 200:
+                image_url = await asyncio.to_thread(
+                    self._store_generated_image, response.json(), scene_description, page_number
+                )
+                logging.info(f"✓ Generated text-only image for page {page_number}")
+                return image_url
+            else:
+                error_text = response.text[:200] if response.text else "Unknown error"
+                raise Exception(f"Image generation failed: {response.status_code} - {error_text}")
+
+        except Exception as e:
+            logging.error(f"Text-only generation failed: {e}")
+            raise
+
+
+class AsyncSpeechService(SpeechService):
+    """SpeechService variant that streams ElevenLabs audio without a thread per request."""
+
+    def __init__(self, api_key, reading_settings, client, first_chunk_size=4096, stream_chunk_size=32768):
+        """Initialize with API key, reading settings and a shared httpx.AsyncClient."""
+        super().__init__(api_key, reading_settings, first_chunk_size, stream_chunk_size)
+        self.client = client
+
+    async def get_voices(self):
+        """Get available voices with enhanced filtering for children's content."""
+        if not self.api_key:
+            logging.warning("ElevenLabs API key not set")
+            return []
+
+        try:
+            async with self.upstream.async_call() as outcome:
+                response = await self.client.get(
+                    f"{self.base_url}/voices",
+                    headers={"Accept": "application/json", "xi-api-key": self.api_key},
+                    timeout=15
+                )
+                outcome.record_status(response.status_code)
+            response.raise_for_status()
+            return self._prioritize_voices(response.json())
+
+        except Exception as e:
+            logging.error(f"Error fetching voices: {e}")
+            return []
+
+    async def generate_speech(self, text, voice_id, reading_mode="normal", reading_speed=None):
+        """Generate speech with enhanced timing prediction.
+
+        Returns:
+            tuple: (async iterator of MP3 bytes, response headers)
+        """
+        if not self.api_key:
+            logging.error("ElevenLabs API key not set")
+            raise Exception("ElevenLabs API key not configured")
+
+        async def empty_generator():
+            yield b""
+
+        try:
+            url, headers, data, response_headers = self._prepare_speech_request(text, voice_id, reading_mode)
+
+            request_started = time.monotonic()
+            request = self.client.build_request(
+                "POST", url, headers=headers, json=data,
+                timeout=httpx.Timeout(30.0, read=None)
+            )
+            with self.telemetry.span('speech.first_audio', 'elevenlabs'):
+                async with self.upstream.async_call() as outcome:
+                    response = await self.client.send(request, stream=True)
+                    outcome.record_status(response.status_code)
+                    if response.status_code == 200:
+                        chunks = self._rechunk(response.aiter_bytes())
+                        try:
+                            first_chunk = await chunks.__anext__()
+                        except StopAsyncIteration:
+                            first_chunk = b""
+            self._record_usage(request_started, response, data)
+
+            if response.status_code != 200:
+                await response.aread()
+                error_message = self._describe_speech_error(response.status_code, response)
+                await response.aclose()
+
+                logging.error(error_message)
+                response_headers['X-Error'] = error_message
+                return empty_generator(), response_headers
+
+            self._add_streaming_headers(response_headers, request_started, first_chunk)
+
+            async def generate():
+                try:
+                    if first_chunk:
+                        yield first_chunk
+                    async for chunk in chunks:
+                        yield chunk
+                finally:
+                    await response.aclose()
+
+            return generate(), response_headers
+
+        except Exception as e:
+            logging.error(f"Error generating speech: {e}")
+            return empty_generator(), {'X-Error': f"Failed to generate speech: {str(e)}"}
+
+    async def _rechunk(self, byte_iterator):
+        """Regroup upstream bytes: a small first chunk, then stream_chunk_size chunks."""
+        buffer = bytearray()
+        target = self.first_chunk_size
+        async for data in byte_iterator:
+            buffer.extend(data)
+            if len(buffer) >= target:
+                yield bytes(buffer)
+                buffer.clear()
+                target = self.stream_chunk_size
+        if buffer:
+            yield bytes(buffer)
+
@@ -0,0 +1,392 @@
+import os
+import re
+import json
+import time
+import uuid
+import random
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+
+from services.resilience_service import get_upstream
+from services.prompt_registry import get_prompt_registry
+from services.metering_service import get_meter
+from services.telemetry_service import get_telemetry
+
+try:
+    import fcntl
+except ImportError:  # Windows has no flock; every process then fills and writes the pool on its own
+    fcntl = None
+
+POOL_MODES = ('off', 'fallback', 'prefer')
+
+# Recurring settings of each story template: tag -> (scene drawn for the pool, words that mean a page is set there)
+TEMPLATE_SCENES = {
+    'adventure': {
+        'forest': ("Esme walking along a sunny path through a friendly forest with tall trees",
+                   ('forest', 'woods', 'tree', 'trees', 'path')),
+        'beach': ("Esme on a bright sandy beach with gentle waves and seashells",
+                  ('beach', 'sand', 'sea', 'ocean', 'waves', 'shore', 'seashells')),
+        'cave': ("Esme peeking into a glowing, cosy cave with sparkly rocks",
+                 ('cave', 'tunnel', 'rocks', 'crystals')),
+        'mountain': ("Esme on a grassy hilltop looking out over mountains and valleys",
+                     ('mountain', 'mountains', 'hill', 'hilltop', 'valley', 'cliff')),
+    },
+    'mystery': {
+        'attic': ("Esme in a dusty attic full of old trunks, boxes and soft light",
+                  ('attic', 'trunk', 'boxes', 'dusty')),
+        'library': ("Esme in a quiet library between tall shelves of colourful books",
+                    ('library', 'books', 'book', 'shelves', 'shelf')),
+        'garden': ("Esme searching a garden full of flowers, bushes and stepping stones",
+                   ('garden', 'flowers', 'bushes', 'hedge', 'footprints')),
+        'house': ("Esme exploring a cosy house with a long hallway and many doors",
+                  ('house', 'hallway', 'room', 'door', 'doors', 'stairs')),
+    },
+    'friendship': {
+        'playground': ("Esme at a colourful playground with swings and a slide",
+                       ('playground', 'swing', 'swings', 'slide', 'sandpit')),
+        'park': ("Esme in a green park with a pond, ducks and a picnic blanket",
+                 ('park', 'pond', 'ducks', 'picnic', 'bench', 'grass')),
+        'school': ("Esme in a bright classroom with paintings on the walls",
+                   ('school', 'classroom', 'teacher', 'desk', 'nursery')),
+        'beach': ("Esme building sandcastles on a sunny beach",
+                  ('beach', 'sand', 'sandcastle', 'sandcastles', 'sea', 'shore')),
+    },
+    'problem_solving': {
+        'kitchen': ("Esme in a warm kitchen with mixing bowls and ingredients on the table",
+                    ('kitchen', 'baking', 'cake', 'bowl', 'cookies', 'oven')),
+        'bedroom': ("Esme in her bedroom surrounded by toys, blocks and books",
+                    ('bedroom', 'toys', 'blocks', 'bed', 'toy')),
+        'garden': ("Esme in a vegetable garden with a watering can and a wheelbarrow",
+                   ('garden', 'vegetables', 'watering', 'wheelbarrow', 'plants', 'seeds')),
+        'river': ("Esme beside a gentle river with a little wooden bridge",
+                  ('river', 'stream', 'bridge', 'water', 'stepping')),
+    },
+}
+
+WORD = re.compile(r"[a-z]+")
+
+
+class BackgroundPoolService:
+    """Keeps a pool of ready-made illustrations of each template's recurring settings.
+
+    Stories of the same template keep returning to the same places: caves
+    and forests for adventures, playgrounds for friendship stories. While the
+    worker is idle (no tracked requests for idle_seconds and Stability
+    healthy), a background thread draws a few pictures of Esme in each of
+    those settings, tagged by scene, and keeps them on disk with an index.
+
+    A page whose image description mentions a scene can then be given a
+    pooled picture instead of waiting for Stability. In 'prefer' mode that
+    happens whenever a picture matches; in 'fallback' mode only when
+    Stability is refusing calls or already at its concurrency limit, so
+    quiet hours still get a fresh picture for every page. "New picture" on a
+    page always draws a fresh one.
+
+    Pictures drawn before the prompt templates changed, or before a
+    reference photo was added or removed, are not handed out; they are
+    deleted and drawn again.
+
+    Workers share the pool through the index. The thread is started per
+    worker (start, or the first pick), and only the worker holding the lock
+    on <index>.owner fills it. Idle means idle across all workers: each one
+    touches <index>.activity while it has requests in flight, Stability is
+    refusing it or it is illustrating pages, and the filling worker waits
+    until that file is idle_seconds old. Every change to the index re-reads it under
+    <index>.lock, and the other workers reload it when it changes. A page is
+    given its own hard link to the pooled picture, so pictures deleted from
+    the pool stay in the stories that used them.
+    """
+
+    def __init__(self, image_service, lifecycle_service, mode="off", per_scene=2, idle_seconds=300,
+                 poll_interval=15, index_path="background_pool.json"):
+        """Initialize BackgroundPoolService.
+
+        Args:
+            image_service (ImageService): Draws the pooled pictures
+            lifecycle_service (LifecycleService): Tells whether this worker is busy
+            mode (str): 'off', 'fallback' or 'prefer' (see the class docstring)
+            per_scene (int): Pictures kept per template and scene
+            idle_seconds (float): Quiet time before the pool is filled
+            poll_interval (float): Seconds between idle checks
+            index_path (str): JSON index of the pooled pictures
+        """
+        if mode not in POOL_MODES:
+            raise ValueError(f"Unknown background pool mode {mode!r}, expected one of {', '.join(POOL_MODES)}")
+        self.image_service = image_service
+        self.lifecycle_service = lifecycle_service
+        self.mode = mode
+        self.per_scene = per_scene
+        self.idle_seconds = idle_seconds
+        self.poll_interval = poll_interval
+        self.index_path = index_path
+        self.upstream = get_upstream('stability')
+        self.prompts = get_prompt_registry()
+        self.meter = get_meter()
+        self.telemetry = get_telemetry()
+
+        self._lock = threading.Lock()
+        self._index_lock_fallback = threading.Lock()
+        self._worker_pid = None
+        self._owner_file = None
+        self._served = 0
+        # Picture URL -> story it was last handed to, and when (this worker)
+        self._served_to = {}
+        self._last_served = {}
+        # template -> tag -> [{'url', 'style', 'seed', 'created_at'}]
+        self._pool = {}
+        self._index_mtime = None
+        self._reload()
+
+    def start(self):
+        """Start the fill thread once per process.
+
+        Call it in each worker once the server has forked, never at import:
+        under gunicorn's preload the thread would run in the master.
+        """
+        if self.mode == 'off' or self._worker_pid == os.getpid():
+            return
+        with self._lock:
+            if self._worker_pid == os.getpid():
+                return
+            self._worker_pid = os.getpid()
+        threading.Thread(target=self._fill_loop, name='background-pool', daemon=True).start()
+        logging.info(f"Background pool started in {self.mode} mode ({self.per_scene} pictures per scene)")
+
+    def pick(self, template_type, image_description, unavailable=False):
+        """A pooled picture for a page, if the mode allows one now and a scene matches.
+
+        Args:
+            template_type (str): The story's template
+            image_description (str): What the page's picture should show
+            unavailable (bool): Stability just refused the page's own picture
+
+        Returns:
+            str: Image URL, or None to draw the page's own picture
+        """
+        if self.mode == 'off':
+            return None
+        self.start()
+        # A page is being illustrated, so no worker should fill the pool now
+        self._mark_active()
+        if self.mode == 'fallback' and not unavailable and not self._stability_busy():
+            return None
+
+        template_type, tag = self.match(template_type, image_description)
+        if tag is None:
+            return None
+        style = self._style()
+        story = self.meter.current_usage_id()
+        self._reload()
+        with self._lock:
+            # A story never gets the same picture twice; its other pages in that scene are drawn
+            assets = [asset for asset in self._pool.get(template_type, {}).get(tag, [])
+                      if asset['style'] == style and (story is None or self._served_to.get(asset['url']) != story)
+                      and os.path.isfile(asset['url'].lstrip('/'))]
+            if not assets:
+                return None
+            asset = min(assets, key=lambda item: self._last_served.get(item['url'], 0))
+            self._last_served[asset['url']] = time.time()
+            self._served_to[asset['url']] = story
+            self._served += 1
+        try:
+            image_url = self._page_copy(asset['url'])
+        except OSError as e:
+            # Deleted by the filling worker since it was listed
+            logging.warning(f"Pooled picture {asset['url']} could not be used: {e}")
+            return None
+        logging.info(f"✓ Using pooled {template_type}/{tag} picture {asset['url']}")
+        return image_url
+
+    def match(self, template_type, image_description):
+        """The scene an image description is set in: the template's own scenes first, then any template's.
+
+        Returns:
+            tuple: (template, tag), tag None if no scene matches
+        """
+        words = set(WORD.findall(image_description.lower()))
+        candidates = [template_type] + [name for name in TEMPLATE_SCENES if name != template_type]
+        for name in candidates:
+            scenes = TEMPLATE_SCENES.get(name, {})
+            scored = [(len(words.intersection(keywords)), tag) for tag, (_, keywords) in scenes.items()]
+            score, tag = max(scored, default=(0, None))
+            if score:
+                return name, tag
+        return template_type, None
+
+    def fill(self, template_type, tag):
+        """Draw one more picture of a scene and add it to the pool.
+
+        Returns:
+            str: URL of the new picture
+        """
+        scene_description = TEMPLATE_SCENES[template_type][tag][0]
+        seed = random.randrange(1, 4294967295)
+        style = self._style()
+        with self.meter.story_scope('background-pool'), \
+                self.telemetry.span('pool.fill', template=template_type, tag=tag):
+            image_url = self.image_service.generate_story_image(scene_description, 0, seed=seed)
+
+        with self._index_lock():
+            pool = self._load()
+            pool.setdefault(template_type, {}).setdefault(tag, []).append({
+                'url': image_url, 'style': style, 'seed': seed, 'created_at': time.time()
+            })
+            self._save(pool)
+        logging.info(f"✓ Added {template_type}/{tag} picture to the background pool")
+        return image_url
+
+    def status(self):
+        """Usable pictures per template and pages served from the pool, for /metrics."""
+        style = self._style()
+        self._reload()
+        with self._lock:
+            assets = {
+                template_type: sum(1 for tag in scenes for asset in self._pool.get(template_type, {}).get(tag, [])
+                                   if asset['style'] == style)
+                for template_type, scenes in TEMPLATE_SCENES.items()
+            }
+            return {'mode': self.mode, 'assets': assets, 'served': self._served}
+
+    def _next_scene(self):
+        """The template and scene with the fewest usable pictures, or None when the pool is full."""
+        style = self._style()
+        dropped = []
+        with self._index_lock():
+            pool = self._load()
+            # Pictures of an old style are never served again; drop them before counting
+            for scenes in pool.values():
+                for tag in scenes:
+                    dropped += [asset for asset in scenes[tag] if asset['style'] != style]
+                    scenes[tag] = [asset for asset in scenes[tag] if asset['style'] == style]
+            if dropped:
+                self._save(pool)
+        for asset in dropped:
+            try:
+                os.remove(asset['url'].lstrip('/'))
+            except OSError:
+                pass
+        if dropped:
+            logging.info(f"Removed {len(dropped)} background pool pictures drawn with old prompts or photo")
+
+        counts = [(len(pool.get(template_type, {}).get(tag, [])), template_type, tag)
+                  for template_type, scenes in TEMPLATE_SCENES.items() for tag in scenes]
+        count, template_type, tag = min(counts)
+        return (template_type, tag) if count < self.per_scene else None
+
+    def _fill_loop(self):
+        # Wall-clock time, so it compares with the activity file's mtime
+        active_at = time.time()
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                # Every worker reports its own activity; only the owner acts on everyone's
+                busy = any(self.lifecycle_service.status()['in_flight'].values())
+                if busy or not self.upstream.is_available():
+                    self._mark_active()
+                    active_at = time.time()
+                if not self._own_fill():
+                    continue
+                active_at = max(active_at, self._last_active())
+                if time.time() - active_at < self.idle_seconds or self.meter.over_budget():
+                    continue
+                scene = self._next_scene()
+                if scene:
+                    self.fill(*scene)
+            except Exception as e:
+                logging.warning(f"Background pool fill failed: {e}")
+
+    def _mark_active(self):
+        """Tell the filling worker this worker is busy (touches <index>.activity)."""
+        path = f"{self.index_path}.activity"
+        try:
+            with open(path, 'a'):
+                os.utime(path, None)
+        except OSError as e:
+            logging.warning(f"Could not record background pool activity: {e}")
+
+    def _last_active(self):
+        """When any worker last reported activity, 0 if none has."""
+        try:
+            return os.stat(f"{self.index_path}.activity").st_mtime
+        except OSError:
+            return 0
+
+    def _own_fill(self):
+        """Whether this process fills the pool: the first to lock <index>.owner keeps it until it exits."""
+        if fcntl is None or self._owner_file is not None:
+            return True
+        owner_file = open(f"{self.index_path}.owner", 'a')
+        try:
+            fcntl.flock(owner_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            owner_file.close()
+            return False
+        self._owner_file = owner_file
+        logging.info(f"This worker (pid {os.getpid()}) fills the background pool")
+        return True
+
+    def _stability_busy(self):
+        """Whether a new Stability call would have to wait or be refused (circuit open, calls queued or every slot taken)."""
+        concurrency = self.upstream.status()['concurrency']
+        return (not self.upstream.is_available() or concurrency['queued'] > 0
+                or concurrency['in_flight'] >= concurrency['limit'])
+
+    def _page_copy(self, url):
+        """URL of a page's own link to a pooled picture, so the pool can delete its copy later."""
+        path = url.lstrip('/')
+        root, extension = os.path.splitext(path)
+        copy_path = f"{root}_page_{uuid.uuid4().hex[:8]}{extension}"
+        try:
+            os.link(path, copy_path)
+        except OSError:
+            # No hard links on this filesystem
+            shutil.copyfile(path, copy_path)
+        return f"/{copy_path}"
+
+    def _style(self):
+        """Pictures only match pages drawn with the same image prompts and reference photo setting."""
+        photo = 'photo' if os.path.exists(self.image_service.reference_photo_path) else 'text'
+        return f"{self.prompts.version}:{photo}"
+
+    @contextmanager
+    def _index_lock(self):
+        """Serialize read-modify-write of the index across threads and workers."""
+        if fcntl is None:
+            with self._index_lock_fallback:
+                yield
+            return
+        with open(f"{self.index_path}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _reload(self):
+        """Pick up pictures another worker added or removed since the index was last read."""
+        try:
+            mtime = os.stat(self.index_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime != self._index_mtime:
+            pool = self._load()
+            with self._lock:
+                self._pool, self._index_mtime = pool, mtime
+
+    def _load(self):
+        try:
+            with open(self.index_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, pool):
+        # Write then rename so a crash never leaves half an index (index lock held)
+        partial_path = f"{self.index_path}.{uuid.uuid4().hex}.tmp"
+        with open(partial_path, 'w') as f:
+            json.dump(pool, f, indent=1)
+        os.replace(partial_path, self.index_path)
+        with self._lock:
+            self._pool, self._index_mtime = pool, os.stat(self.index_path).st_mtime_ns
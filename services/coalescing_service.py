@@ -0,0 +1,134 @@
+import time
+import threading
+
+
+class RequestCoalescer:
+    """Runs identical concurrent requests once and hands every caller the same result.
+
+    The first request for a key becomes the leader and does the work; any
+    request with the same key that arrives meanwhile waits for the leader's
+    result instead of repeating it. A result can also be kept for a while
+    after it completes, so a request repeated with the same idempotency key
+    (a page refresh resubmitting the form) gets the stored result back.
+
+    Each key has a fingerprint of what was asked for. Reusing a key for a
+    different request is refused rather than answered with someone else's
+    result.
+
+    Coalescing is per process: with several server workers, identical
+    requests that land on different workers still run separately.
+    """
+
+    def __init__(self, ttl=600, max_results=256):
+        """Initialize RequestCoalescer.
+
+        Args:
+            ttl (float): Seconds a kept result is replayed for
+            max_results (int): Kept results held at most (oldest dropped first)
+        """
+        self.ttl = ttl
+        self.max_results = max_results
+        self._lock = threading.Lock()
+        # key -> {'fingerprint', 'done' (Event), 'result', 'error', 'expires_at'}
+        self._entries = {}
+        self._shared = 0
+
+    def begin(self, key, fingerprint):
+        """Join the request for key, or start it.
+
+        Args:
+            key (str): What identical requests have in common
+            fingerprint (str): Hash of the request's parameters
+
+        Returns:
+            tuple: (entry, leader); the leader must call finish(), everyone else wait()
+
+        Raises:
+            ValueError: If key is in use by a request with different parameters
+        """
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry['fingerprint'] != fingerprint:
+                    raise ValueError("This idempotency key was already used for a different request")
+                self._shared += 1
+                return entry, False
+
+            entry = {'fingerprint': fingerprint, 'done': threading.Event(), 'result': None, 'error': None,
+                     'expires_at': None}
+            self._entries[key] = entry
+            return entry, True
+
+    def finish(self, key, entry, result=None, error=None, keep=False):
+        """Publish the leader's result (or exception) to everyone waiting on it.
+
+        Args:
+            key (str): Key passed to begin()
+            entry (dict): Entry returned by begin()
+            result: What the waiting requests receive
+            error (Exception, optional): Raised in the waiting requests instead
+            keep (bool): Replay the result to later requests with the same key for ttl seconds
+        """
+        with self._lock:
+            entry['result'] = result
+            entry['error'] = error
+            if keep and error is None:
+                entry['expires_at'] = time.monotonic() + self.ttl
+            elif self._entries.get(key) is entry:
+                del self._entries[key]
+            entry['done'].set()
+
+    def wait(self, entry, timeout=None):
+        """Block until the leader finishes, then return its result.
+
+        Raises:
+            TimeoutError: If the leader is still working after timeout seconds
+            Exception: Whatever the leader failed with
+        """
+        if not entry['done'].wait(timeout):
+            raise TimeoutError("The identical request in progress did not finish in time")
+        if entry['error'] is not None:
+            raise entry['error']
+        return entry['result']
+
+    def run(self, key, fingerprint, work, keep=lambda result: False, timeout=None):
+        """Run work() once per key, or wait for the run already in progress.
+
+        Args:
+            key (str): What identical requests have in common
+            fingerprint (str): Hash of the request's parameters
+            work (callable): Produces the result
+            keep (callable): keep(result) -> whether to replay the result for ttl seconds
+            timeout (float, optional): Longest a follower waits
+
+        Returns:
+            tuple: (result, shared), shared being True if another request produced it
+        """
+        entry, leader = self.begin(key, fingerprint)
+        if not leader:
+            return self.wait(entry, timeout), True
+        try:
+            result = work()
+        except Exception as e:
+            self.finish(key, entry, error=e)
+            raise
+        self.finish(key, entry, result, keep=keep(result))
+        return result, False
+
+    def status(self):
+        """Requests running and results kept, and how many requests were answered by another's work."""
+        with self._lock:
+            self._expire()
+            running = sum(1 for entry in self._entries.values() if not entry['done'].is_set())
+            return {'in_flight': running, 'kept': len(self._entries) - running, 'shared': self._shared}
+
+    def _expire(self):
+        """Drop kept results past their ttl, and the oldest beyond max_results (lock held)."""
+        now = time.monotonic()
+        kept = sorted(((entry['expires_at'], key) for key, entry in self._entries.items()
+                       if entry['expires_at'] is not None))
+        expired = [key for expires_at, key in kept if expires_at <= now]
+        expired += [key for _, key in kept[len(expired):len(kept) - self.max_results]]
+        for key in expired:
+            del self._entries[key]
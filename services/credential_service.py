@@ -0,0 +1,140 @@
+import os
+import threading
+import logging
+import time
+import requests
+
+# Overridable so benchmarks can point every Stability caller at a local stand-in
+STABILITY_API_HOST = os.getenv('STABILITY_API_HOST', 'https://api.stability.ai')
+
+# Only these mean the key itself was refused; anything else is a failed check, not a verdict
+KEY_REJECTED_STATUS_CODES = {401, 403}
+
+class CredentialService:
+    """Validates the Stability AI API key once and keeps account/credit info fresh in the background."""
+
+    def __init__(self, api_key, api_host=STABILITY_API_HOST, ttl=900):
+        """Initialize CredentialService.
+
+        Args:
+            api_key (str): Stability AI API key
+            api_host (str): Stability API host
+            ttl (int): Seconds a validation result stays fresh
+        """
+        self.api_key = api_key
+        self.account_url = f"{api_host}/v1/user/account"
+        self.balance_url = f"{api_host}/v1/user/balance"
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._status = None
+        self._refresh_pid = None
+
+    def validate(self):
+        """Get the cached key status, checking the API only when nothing is cached yet.
+
+        Returns:
+            dict: valid (True/False/None if unknown), status_code, account, credits, checked_at
+        """
+        self._ensure_background_refresh()
+
+        with self._lock:
+            status = self._status
+        # Also re-check inline if the background refresh has fallen well behind
+        if status is None or time.time() - status['checked_at'] > 2 * self.ttl:
+            status = self.refresh()
+        return status
+
+    def is_key_rejected(self):
+        """True only when the API explicitly rejected the key (not on network errors)."""
+        return self.validate()['valid'] is False
+
+    def refresh(self):
+        """Check the key and fetch account and credit info now."""
+        if not self.api_key:
+            status = self._build_status(False, None, error='No Stability AI API key configured')
+        else:
+            status = self._check_account()
+
+        with self._lock:
+            self._status = status
+        return status
+
+    def _check_account(self):
+        headers = {'Authorization': f'Bearer {self.api_key}'}
+        try:
+            response = requests.get(self.account_url, headers=headers, timeout=10)
+        except Exception as e:
+            logging.warning(f"Stability key check failed: {e}")
+            # A network blip doesn't make the key invalid
+            return self._previous_status(f'API connection failed: {str(e)}')
+
+        if response.status_code in KEY_REJECTED_STATUS_CODES:
+            logging.warning(f"Stability key check returned {response.status_code}")
+            return self._build_status(False, response.status_code, error=f'Invalid API key (status: {response.status_code})')
+        if response.status_code != 200:
+            logging.warning(f"Stability key check returned {response.status_code}, keeping the last verdict")
+            # Rate limits and outages say nothing about the key
+            return self._previous_status(f'Key check failed (status: {response.status_code})', response.status_code)
+
+        account_data = response.json()
+        account = {
+            'id': account_data.get('id'),
+            'email': account_data.get('email'),
+            'organizations': [org.get('name') for org in account_data.get('organizations', [])]
+        }
+        credits = None
+        try:
+            balance = requests.get(self.balance_url, headers=headers, timeout=10)
+            if balance.status_code == 200:
+                credits = balance.json().get('credits')
+        except Exception as e:
+            logging.warning(f"Could not fetch Stability credit balance: {e}")
+
+        logging.info(f"Stability key validated (credits: {credits})")
+        return self._build_status(True, 200, account=account, credits=credits)
+
+    def _previous_status(self, error, status_code=None):
+        """The last known verdict, account and credits, with the error of a check that couldn't decide."""
+        previous = self._status
+        return self._build_status(
+            previous['valid'] if previous else None,
+            status_code or (previous['status_code'] if previous else None),
+            account=previous['account'] if previous else None,
+            credits=previous['credits'] if previous else None,
+            error=error
+        )
+
+    def _build_status(self, valid, status_code, account=None, credits=None, error=None):
+        return {
+            'valid': valid,
+            'status_code': status_code,
+            'account': account,
+            'credits': credits,
+            'error': error,
+            'checked_at': time.time()
+        }
+
+    def _ensure_background_refresh(self):
+        """Start the refresh thread once per process (workers fork after preload)."""
+        if not self.api_key or self._refresh_pid == os.getpid():
+            return
+        with self._lock:
+            if self._refresh_pid == os.getpid():
+                return
+            self._refresh_pid = os.getpid()
+        threading.Thread(target=self._refresh_loop, name='stability-credentials', daemon=True).start()
+
+    def _refresh_loop(self):
+        while True:
+            time.sleep(self.ttl)
+            try:
+                self.refresh()
+            except Exception as e:
+                logging.error(f"Background credential refresh failed: {e}")
+
+    def status(self):
+        """Account and credit info for the /account_status endpoint."""
+        status = dict(self.validate())
+        status['age_seconds'] = int(time.time() - status['checked_at'])
+        return status
@@ -6,6 +6,11 @@ import time
 import io
 import logging
 from PIL import Image
+from services.resilience_service import get_upstream, UpstreamUnavailable
+from services.prompt_registry import get_prompt_registry
+from services.metering_service import get_meter, STABILITY_CREDITS
+from services.telemetry_service import get_telemetry
+from services.credential_service import STABILITY_API_HOST
 
 class ImageService:
     """Complete image service with photo reference support and character diversity."""
@@ -14,6 +19,16 @@ class ImageService:
         self.api_key = api_key
         self.character_profile = None
         self.reference_photo_path = "static/images/esme_reference.jpg"  # Path to uploaded photo
+        self.api_host = STABILITY_API_HOST
+        self.image_to_image_url = f"{self.api_host}/v1/generation/stable-diffusion-xl-1024-v1-0/image-to-image"
+        self.text_to_image_url = f"{self.api_host}/v1/generation/stable-diffusion-xl-1024-v1-0/text-to-image"
+        # Circuit breaker and concurrency limit shared by every Stability caller
+        self.upstream = get_upstream('stability')
+        # Prompt templates from prompts/, compiled once and reloaded when edited
+        self.prompts = get_prompt_registry()
+        # Credits used per image, for cost accounting
+        self.meter = get_meter()
+        self.telemetry = get_telemetry()
 
     def has_reference_photo(self):
         """Check if reference photo exists"""
@@ -32,171 +47,164 @@ class ImageService:
         logging.info(f"Character profile created. Photo reference: {self.has_reference_photo()}")
         return self.character_profile
 
-    def generate_story_image_with_photo(self, scene_description, page_number, story_context=""):
+    def generate_story_image_with_photo(self, scene_description, page_number, story_context="", seed=None):
         """Generate image using photo reference for better consistency - FIXED VERSION with correct API format"""
 
         if not self.has_reference_photo():
             # Fallback to text-only generation
             logging.info("No photo reference found, using text-only generation")
-            return self.generate_story_image_text_only(scene_description, page_number, story_context)
+            return self.generate_story_image_text_only(scene_description, page_number, story_context, seed)
 
         try:
             logging.info(f"Using photo reference for page {page_number}")
 
-            # Create enhanced prompt for image-to-image with character diversity
-            prompt = f"""Create a cinematic children's book illustration showing: {scene_description}
-
-CHARACTER REQUIREMENTS:
-- Esme: Keep her facial features, hair, and appearance EXACTLY the same as in the reference photo
-- Other characters (if present): Make them clearly different from Esme
-  * Parents: Adult height, different hair colors, mature faces
-  * Other children: Different hair (blonde, black, red), different clothing, different facial features
-  * Animals: Cute kawaii style but each species distinct
-
-STYLE REQUIREMENTS:
-- Soft pastel children's book art style
-- Cinematic composition with dynamic angles
-- Rich environmental details
-- Professional illustration quality
-- Whimsical, magical storybook environment
-
-SCENE: {scene_description}
-
-Maintain Esme's exact appearance while ensuring all other characters look distinctly different."""
-
-            negative_prompt = "realistic photography, adult features on child, all characters looking identical, scary, dark, blurry, distorted face, extra limbs"
-
-            # Read and encode the reference photo
-            with open(self.reference_photo_path, 'rb') as image_file:
-                image_data = base64.b64encode(image_file.read()).decode()
-
-            # FIXED: Use correct JSON format for image-to-image endpoint
-            payload = {
-                "init_image": image_data,
-                "text_prompts": [
-                    {"text": prompt, "weight": 1.0},
-                    {"text": negative_prompt, "weight": -1.0}
-                ],
-                "image_strength": 0.35,  # How much to change from original
-                "cfg_scale": 7,
-                "height": 1024,
-                "width": 1024,
-                "samples": 1,
-                "steps": 25
-            }
-
-            headers = {
-                'Authorization': f'Bearer {self.api_key}',
-                'Content-Type': 'application/json',
-                'Accept': 'application/json'
-            }
-
-            response = requests.post(
-                "https://api.stability.ai/v1/generation/stable-diffusion-xl-1024-v1-0/image-to-image",
-                headers=headers,
-                json=payload,
-                timeout=60
-            )
+            payload = self._build_photo_payload(scene_description, seed)
+            started = time.monotonic()
+            with self.upstream.call() as outcome:
+                response = requests.post(
+                    self.image_to_image_url,
+                    headers=self._stability_headers(),
+                    json=payload,
+                    timeout=60
+                )
+                outcome.record_status(response.status_code)
+            self._record_usage('image-to-image', started, response.status_code)
 
             if response.status_code == 200:
-                image_data = response.json()["artifacts"][0]["base64"]
-
-                # Save the generated image
-                image_hash = hashlib.md5(scene_description.encode()).hexdigest()
-                image_path = f"static/images/story_page_{page_number}_{image_hash[:8]}.jpg"
-                self._save_and_compress_image(image_data, image_path)
-
+                image_url = self._store_generated_image(response.json(), scene_description, page_number, seed)
                 logging.info(f"✓ Generated image with photo reference for page {page_number}")
-                return f"/{image_path}"
+                return image_url
+            elif outcome.overloaded or outcome.failed:
+                # Stability itself is struggling - a text-to-image retry would only double the load
+                raise UpstreamUnavailable('stability', f'image-to-image returned {response.status_code}')
             else:
                 error_text = response.text
                 logging.warning(f"Photo-based generation failed: {response.status_code} - {error_text}")
                 # Fallback to text-only
-                return self.generate_story_image_text_only(scene_description, page_number, story_context)
+                return self.generate_story_image_text_only(scene_description, page_number, story_context, seed)
 
+        except (UpstreamUnavailable, requests.exceptions.RequestException) as e:
+            logging.error(f"Photo reference generation failed, not falling back: {e}")
+            raise
         except Exception as e:
             logging.error(f"Photo reference generation failed: {e}")
             # Fallback to text-only generation
-            return self.generate_story_image_text_only(scene_description, page_number, story_context)
+            return self.generate_story_image_text_only(scene_description, page_number, story_context, seed)
+
+    def _build_photo_payload(self, scene_description, seed=None):
+        """Build the image-to-image request body seeded with the reference photo.
+
+        A seed asks for a different variation of the same scene; without one
+        Stability picks a random seed.
+        """
+
+        prompt = self.prompts.render('image_photo_prompt', scene_description=scene_description)
+
+        negative_prompt = "realistic photography, adult features on child, all characters looking identical, scary, dark, blurry, distorted face, extra limbs"
+
+        # Read and encode the reference photo
+        with open(self.reference_photo_path, 'rb') as image_file:
+            image_data = base64.b64encode(image_file.read()).decode()
+
+        # FIXED: Use correct JSON format for image-to-image endpoint
+        payload = {
+            "init_image": image_data,
+            "text_prompts": [
+                {"text": prompt, "weight": 1.0},
+                {"text": negative_prompt, "weight": -1.0}
+            ],
+            "image_strength": 0.35,  # How much to change from original
+            "cfg_scale": 7,
+            "height": 1024,
+            "width": 1024,
+            "samples": 1,
+            "steps": 25
+        }
+        if seed is not None:
+            payload["seed"] = seed
+        return payload
 
-    def generate_story_image_text_only(self, scene_description, page_number, story_context=""):
+    def generate_story_image_text_only(self, scene_description, page_number, story_context="", seed=None):
         """Enhanced text-only generation with better character consistency"""
 
-        character_desc = self.character_profile['description'] if self.character_profile else "4 years old, curly brown hair, light skin, blue-green eyes"
+        try:
+            started = time.monotonic()
+            with self.upstream.call() as outcome:
+                response = requests.post(
+                    self.text_to_image_url,
+                    headers=self._stability_headers(),
+                    json=self._build_text_only_payload(scene_description, seed),
+                    timeout=60
+                )
+                outcome.record_status(response.status_code)
+            self._record_usage('text-to-image', started, response.status_code)
 
-        # Enhanced prompt with much stronger character consistency
-        prompt = f"""Cinematic children's book illustration: {scene_description}
+            if response.status_code == 200:
+                image_url = self._store_generated_image(response.json(), scene_description, page_number, seed)
+                logging.info(f"✓ Generated text-only image for page {page_number}")
+                return image_url
+            else:
+                error_text = response.text[:200] if response.text else "Unknown error"
+                raise Exception(f"Image generation failed: {response.status_code} - {error_text}")
 
-MAIN CHARACTER - Esme (CRITICAL CONSISTENCY):
-- EXACTLY: {character_desc}
-- She must appear IDENTICAL in every image: same face shape, exact hair texture and color, same eye color, same skin tone
-- Always the focal point and most detailed character
-- Consistent proportions and facial features
+        except Exception as e:
+            logging.error(f"Text-only generation failed: {e}")
+            raise
 
-OTHER CHARACTERS (if present):
-- Parents: Adult height, clearly different hair colors from Esme, mature faces
-- Dad: Tall adult man, different hair color (brown/black), kind expression
-- Mom: Adult woman, different hair style from Esme (straight/wavy), warm smile
-- Other children: Clearly different - if Esme has curly brown hair, give others straight blonde, black braids, red pigtails, etc.
-- Animals: Cute kawaii style, large eyes, but each species distinct
+    def _build_text_only_payload(self, scene_description, seed=None):
+        """Build the text-to-image request body with the character consistency prompt.
 
-VISUAL STYLE:
-- Cinematic composition with dynamic camera angles
-- Rich environmental storytelling
-- Soft pastel colors with vibrant accents
-- Professional children's book quality
-- Whimsical, magical atmosphere
+        Every page shares one seed so Esme looks the same throughout; a
+        different seed gives a new variation of the scene.
+        """
 
-CHARACTER CONSISTENCY SEED: Use consistent visual elements for Esme across all scenes.
+        character_desc = self.character_profile['description'] if self.character_profile else "4 years old, curly brown hair, light skin, blue-green eyes"
 
-Make sure Esme looks exactly the same as previous illustrations - same face, hair, and overall appearance."""
+        prompt = self.prompts.render(
+            'image_prompt', scene_description=scene_description, character_description=character_desc
+        )
 
         negative_prompt = "realistic photography, all characters looking identical, adult features on child, scary, dark, blurry, multiple faces, distorted anatomy, extra limbs"
 
-        try:
-            # FIXED: Use correct JSON format for text-to-image endpoint
-            payload = {
-                "text_prompts": [
-                    {"text": prompt, "weight": 1.0},
-                    {"text": negative_prompt, "weight": -1.0}
-                ],
-                "cfg_scale": 7,
-                "height": 1024,
-                "width": 1024,
-                "samples": 1,
-                "steps": 30,
-                "seed": 12345  # Consistent seed for character consistency
-            }
-
-            headers = {
-                'Authorization': f'Bearer {self.api_key}',
-                'Content-Type': 'application/json',
-                'Accept': 'application/json'
-            }
-
-            response = requests.post(
-                "https://api.stability.ai/v1/generation/stable-diffusion-xl-1024-v1-0/text-to-image",
-                headers=headers,
-                json=payload,
-                timeout=60
-            )
+        # FIXED: Use correct JSON format for text-to-image endpoint
+        return {
+            "text_prompts": [
+                {"text": prompt, "weight": 1.0},
+                {"text": negative_prompt, "weight": -1.0}
+            ],
+            "cfg_scale": 7,
+            "height": 1024,
+            "width": 1024,
+            "samples": 1,
+            "steps": 30,
+            "seed": 12345 if seed is None else seed  # Consistent seed for character consistency
+        }
 
-            if response.status_code == 200:
-                image_data = response.json()["artifacts"][0]["base64"]
+    def _record_usage(self, operation, started, status):
+        """Meter one generation call; Stability doesn't report credits, so successful calls use list prices."""
+        credits = STABILITY_CREDITS[operation] if status == 200 else 0
+        self.meter.record('stability', operation, time.monotonic() - started, status, credits=credits)
 
-                image_hash = hashlib.md5(scene_description.encode()).hexdigest()
-                image_path = f"static/images/story_page_{page_number}_{image_hash[:8]}.jpg"
-                self._save_and_compress_image(image_data, image_path)
+    def _stability_headers(self):
+        """Headers for the Stability generation endpoints."""
+        return {
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json',
+            'Accept': 'application/json'
+        }
 
-                logging.info(f"✓ Generated text-only image for page {page_number}")
-                return f"/{image_path}"
-            else:
-                error_text = response.text[:200] if response.text else "Unknown error"
-                raise Exception(f"Image generation failed: {response.status_code} - {error_text}")
+    def _store_generated_image(self, response_data, scene_description, page_number, seed=None):
+        """Save the first artifact of a generation response and return its URL."""
+        image_data = response_data["artifacts"][0]["base64"]
 
-        except Exception as e:
-            logging.error(f"Text-only generation failed: {e}")
-            raise
+        with self.telemetry.span('image.store'):
+            # A variation gets its own file, so the page's URL changes and browsers fetch the new image
+            image_key = scene_description if seed is None else f"{scene_description}\n{seed}"
+            image_hash = hashlib.md5(image_key.encode()).hexdigest()
+            image_path = f"static/images/story_page_{page_number}_{image_hash[:8]}.jpg"
+            self._save_and_compress_image(image_data, image_path)
+
+        return f"/{image_path}"
 
     def _save_and_compress_image(self, image_data, output_path, quality=85):
         """Save and compress image"""
@@ -227,12 +235,13 @@ Make sure Esme looks exactly the same as previous illustrations - same face, hai
             logging.info("No photo found, generating reference image")
             return self.generate_story_image_text_only(f"Portrait of Esme - {scene}", 0)
 
-    def generate_story_image(self, scene_description, page_number, story_context=""):
+    def generate_story_image(self, scene_description, page_number, story_context="", seed=None):
         """Main method that chooses photo or text generation"""
-        if self.has_reference_photo():
-            return self.generate_story_image_with_photo(scene_description, page_number, story_context)
-        else:
-            return self.generate_story_image_text_only(scene_description, page_number, story_context)
+        with self.telemetry.span('image.generate', 'stability', page=page_number):
+            if self.has_reference_photo():
+                return self.generate_story_image_with_photo(scene_description, page_number, story_context, seed)
+            else:
+                return self.generate_story_image_text_only(scene_description, page_number, story_context, seed)
 
     def get_character_consistency_summary(self):
         """Get summary of character consistency approach"""
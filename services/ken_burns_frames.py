@@ -0,0 +1,105 @@
+"""Frame drawing for KenBurnsService's slideshow renders.
+
+Runs in KenBurnsService's worker processes. Spawned workers import this
+module on its own, so it must only need Pillow and NumPy, never app.py or
+the other services.
+"""
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageOps
+
+try:
+    import numpy as np
+except ImportError:  # KenBurnsService.is_available() is False without it
+    np = None
+
+
+# Page images most recently drawn from; about one video's worth, since the workers live on between renders
+SOURCE_CACHE_SIZE = 8
+
+# Per-process cache of page images, filled lazily in each pool worker (or the web process on one CPU)
+_source_images = OrderedDict()
+_source_lock = threading.Lock()
+
+
+def _load_source(image_path, size):
+    """Page image cropped to the output aspect with headroom for the zoom."""
+    key = (image_path, size)
+    with _source_lock:
+        if key in _source_images:
+            _source_images.move_to_end(key)
+            return _source_images[key]
+    with Image.open(image_path) as img:
+        headroom = (int(size[0] * 1.5), int(size[1] * 1.5))
+        source = ImageOps.fit(img.convert('RGB'), headroom, Image.LANCZOS)
+    with _source_lock:
+        _source_images[key] = source
+        while len(_source_images) > SOURCE_CACHE_SIZE:
+            _source_images.popitem(last=False)
+    return source
+
+
+def _ease(t):
+    return t * t * (3 - 2 * t)
+
+
+def _segment_frame(segment, position, size):
+    """One frame of a page's pan/zoom as a PIL image.
+
+    Args:
+        segment (dict): Camera move for the page
+        position (float): 0-1 progress through the page
+        size (tuple): Output (width, height)
+    """
+    source = _load_source(segment['image_path'], size)
+    src_width, src_height = source.size
+    t = _ease(position)
+
+    zoom = segment['zoom'][0] + (segment['zoom'][1] - segment['zoom'][0]) * t
+    box_width, box_height = src_width / zoom, src_height / zoom
+
+    # Drift the crop center within the slack the zoom leaves
+    slack_x, slack_y = (src_width - box_width) / 2, (src_height - box_height) / 2
+    center_x = src_width / 2 + segment['drift'][0] * slack_x * (2 * t - 1)
+    center_y = src_height / 2 + segment['drift'][1] * slack_y * (2 * t - 1)
+
+    box = (center_x - box_width / 2, center_y - box_height / 2,
+           center_x + box_width / 2, center_y + box_height / 2)
+    return source.resize(size, Image.BILINEAR, box=box)
+
+
+def render_frames(task):
+    """Render a batch of (plan, frame indices) as raw RGB bytes."""
+    plan, frame_indices = task
+    segment_frames, fade_frames = plan['segment_frames'], plan['fade_frames']
+    output = bytearray()
+
+    for frame_index in frame_indices:
+        layers = []
+        for segment in plan['segments']:
+            offset = frame_index - segment['start']
+            if not 0 <= offset < segment_frames:
+                continue
+
+            # Fade in over the overlap with the previous page, out over the next
+            weight = 1.0
+            if fade_frames and segment['start'] > 0 and offset < fade_frames:
+                weight = (offset + 1) / (fade_frames + 1)
+            if fade_frames and segment is not plan['segments'][-1] and offset >= segment_frames - fade_frames:
+                weight = (segment_frames - offset) / (fade_frames + 1)
+
+            layers.append((_segment_frame(segment, offset / (segment_frames - 1), plan['size']), weight))
+
+        if len(layers) == 1:
+            output += layers[0][0].tobytes()
+            continue
+
+        # Crossfade the two overlapping pages in 8.8 fixed point (weights sum to 1)
+        (outgoing, _), (incoming, incoming_weight) = layers
+        alpha = int(round(incoming_weight * 256))
+        frame = np.asarray(outgoing, dtype=np.uint16) * (256 - alpha)
+        frame += np.asarray(incoming, dtype=np.uint16) * alpha
+        output += (frame >> 8).astype(np.uint8).tobytes()
+
+    return bytes(output)
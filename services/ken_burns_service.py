@@ -0,0 +1,222 @@
+import os
+import shutil
+import hashlib
+import logging
+import subprocess
+import multiprocessing
+import uuid
+import time
+import threading
+
+from services.ken_burns_frames import render_frames, np
+
+try:
+    import imageio_ffmpeg
+except ImportError:
+    imageio_ffmpeg = None
+
+
+class KenBurnsService:
+    """Renders a pan/zoom slideshow MP4 of the story pages locally on CPU.
+
+    Used for the summary animation when there is no Stability key or the
+    remote image-to-video render fails. Frames are drawn in a process pool
+    and streamed as raw RGB into ffmpeg, so no intermediate files are written.
+
+    The pool is started once per process (see start) and shared by every
+    render. Its workers only import services.ken_burns_frames, not the app.
+    With a single CPU the frames are drawn in the rendering thread instead.
+    """
+
+    def __init__(self, reading_speed_settings, output_dir="static/videos", size=(1024, 576), fps=24,
+                 seconds_per_page=3.0, crossfade_seconds=0.75, max_pages=8, processes=None):
+        """Initialize KenBurnsService.
+
+        Args:
+            reading_speed_settings (dict): Reading speed configuration from app.py
+            output_dir (str): Where rendered videos are written
+            size (tuple): Output (width, height)
+            fps (int): Frames per second
+            seconds_per_page (float): Time on each page at normal reading speed
+            crossfade_seconds (float): Overlap between consecutive pages
+            max_pages (int): Most pages included in one video
+            processes (int, optional): Frame rendering processes (default: CPUs, at most 4)
+        """
+        self.reading_speed_settings = reading_speed_settings
+        self.output_dir = output_dir
+        self.size = size
+        self.fps = fps
+        self.seconds_per_page = seconds_per_page
+        self.crossfade_seconds = crossfade_seconds
+        self.max_pages = max_pages
+        self.processes = processes or min(4, multiprocessing.cpu_count())
+
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+
+    def start(self):
+        """Start the frame rendering pool in this process, if rendering needs one.
+
+        Call it in each worker once the server has forked (a pool started in
+        gunicorn's preloading master would belong to the master); render
+        starts it on first use otherwise.
+        """
+        if self.processes <= 1 or not self.is_available() or self._pool_pid == os.getpid():
+            return
+        with self._lock:
+            if self._pool_pid == os.getpid():
+                return
+            # Spawned workers don't inherit this process's threads or open connections
+            self._pool = multiprocessing.get_context('spawn').Pool(self.processes)
+            self._pool_pid = os.getpid()
+        logging.info(f"Started {self.processes} local video rendering processes")
+
+    def stop(self):
+        """Shut the frame rendering pool down (server shutdown)."""
+        with self._lock:
+            pool, self._pool, self._pool_pid = self._pool, None, None
+        if pool is not None:
+            pool.terminate()
+
+    def is_available(self):
+        """Whether NumPy and an ffmpeg binary are installed."""
+        return np is not None and self._ffmpeg_path() is not None
+
+    def render(self, story_content, motion_intensity=0.5, reading_mode="normal"):
+        """Render the story pages into a Ken Burns slideshow.
+
+        Args:
+            story_content (list): List of story page data; a page's own motion_intensity overrides the default
+            motion_intensity (float): 0.2-0.8, how far each page pans and zooms
+            reading_mode (str): Slower reading modes hold each page longer
+
+        Returns:
+            dict: video_path and duration, or error
+        """
+        if not self.is_available():
+            return {
+                'success': False,
+                'error': 'Local video rendering needs numpy and ffmpeg'
+            }
+
+        shots = []
+        for page in story_content:
+            image_path = page.get('image', '').lstrip('/')
+            if not page.get('is_summary_page') and image_path and os.path.exists(image_path):
+                shots.append((image_path, page.get('motion_intensity', motion_intensity)))
+        shots = shots[:self.max_pages]
+
+        if not shots:
+            return {
+                'success': False,
+                'error': 'No page images to animate'
+            }
+
+        playback_rate = self.reading_speed_settings.get(reading_mode, {}).get('playback_rate', 1.0)
+        plan = self._plan(shots, self.seconds_per_page / playback_rate)
+
+        video_path = os.path.join(self.output_dir, f"story_summary_local_{plan['key'][:16]}.mp4")
+        if os.path.exists(video_path):
+            logging.info(f"Reusing local summary video: {video_path}")
+            return self._result(video_path, plan)
+
+        try:
+            started = time.monotonic()
+            self._encode(plan, video_path)
+            logging.info(f"✓ Rendered local summary video: {video_path} "
+                         f"({plan['total_frames']} frames in {time.monotonic() - started:.1f}s)")
+            return self._result(video_path, plan)
+        except Exception as e:
+            logging.error(f"Local summary video render failed: {e}")
+            return {
+                'success': False,
+                'error': f'Local render failed: {str(e)}'
+            }
+
+    def _result(self, video_path, plan):
+        return {
+            'success': True,
+            'video_path': f"/{video_path}",
+            'duration': round(plan['total_frames'] / self.fps, 1)
+        }
+
+    def _plan(self, shots, seconds_per_page):
+        """Timeline and camera moves for every (image_path, motion_intensity) shot, plus a content key."""
+        segment_frames = max(2, int(round(seconds_per_page * self.fps)))
+        fade_frames = min(segment_frames // 2, int(round(self.crossfade_seconds * self.fps)))
+
+        digest = hashlib.sha256()
+        digest.update(f"{self.size}:{self.fps}:{segment_frames}:{fade_frames}".encode())
+        segments = []
+        for index, (image_path, motion_intensity) in enumerate(shots):
+            with open(image_path, 'rb') as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+            digest.update(f":{motion_intensity:.3f}".encode())
+
+            # Livelier pages zoom and drift further; alternate direction each page
+            zoom = 1.0 + 0.3 * motion_intensity
+            zoom_in = index % 2 == 0
+            drift = [(-1, -1), (1, 1), (1, -1), (-1, 1)][index % 4]
+            segments.append({
+                'image_path': image_path,
+                'start': index * (segment_frames - fade_frames),
+                'zoom': (1.0, zoom) if zoom_in else (zoom, 1.0),
+                'drift': (drift[0] * motion_intensity * 0.5, drift[1] * motion_intensity * 0.5)
+            })
+
+        return {
+            'key': digest.hexdigest(),
+            'size': self.size,
+            'segment_frames': segment_frames,
+            'fade_frames': fade_frames,
+            'segments': segments,
+            'total_frames': segments[-1]['start'] + segment_frames
+        }
+
+    def _encode(self, plan, video_path):
+        """Stream frames from the process pool (or this thread) into ffmpeg in order."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        partial_path = f"{video_path}.{uuid.uuid4().hex}.mp4"
+        width, height = self.size
+
+        command = [
+            self._ffmpeg_path(), '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', f'{width}x{height}', '-r', str(self.fps), '-i', '-',
+            '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p', '-movflags', '+faststart',
+            partial_path
+        ]
+
+        # A batch of frames per task keeps inter-process traffic reasonable
+        batch = max(1, self.fps // 2)
+        tasks = [(plan, list(range(start, min(start + batch, plan['total_frames']))))
+                 for start in range(0, plan['total_frames'], batch)]
+
+        self.start()
+        # One CPU: a pool would only add process hops to the same core
+        frame_batches = self._pool.imap(render_frames, tasks) if self._pool else map(render_frames, tasks)
+
+        encoder = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        try:
+            for frames in frame_batches:
+                encoder.stdin.write(frames)
+            encoder.stdin.close()
+            if encoder.wait() != 0:
+                raise RuntimeError(f"ffmpeg exited with {encoder.returncode}: {encoder.stderr.read().decode(errors='replace')[:200]}")
+            os.replace(partial_path, video_path)
+        finally:
+            if encoder.poll() is None:
+                encoder.kill()
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+    def _ffmpeg_path(self):
+        system_ffmpeg = shutil.which('ffmpeg')
+        if system_ffmpeg:
+            return system_ffmpeg
+        if imageio_ffmpeg is not None:
+            try:
+                return imageio_ffmpeg.get_ffmpeg_exe()
+            except RuntimeError:
+                return None
+        return None
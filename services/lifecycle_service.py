@@ -0,0 +1,76 @@
+import threading
+import logging
+import time
+from contextlib import contextmanager
+
+class LifecycleService:
+    """Tracks in-flight generations so a worker can report readiness and drain on shutdown."""
+
+    def __init__(self):
+        """Initialize LifecycleService with no work in flight."""
+        self._lock = threading.Lock()
+        self._drained = threading.Condition(self._lock)
+        self._in_flight = {}
+        self._draining = False
+        self.started_at = time.time()
+
+    @contextmanager
+    def track(self, name):
+        """Count a piece of work (e.g. a /generate request) as in flight while the block runs.
+
+        Args:
+            name (str): Kind of work, used for the readiness report
+        """
+        with self._lock:
+            self._in_flight[name] = self._in_flight.get(name, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight[name] -= 1
+                if self.in_flight_total() == 0:
+                    self._drained.notify_all()
+
+    def in_flight_total(self):
+        """Total number of tracked requests currently running."""
+        return sum(self._in_flight.values())
+
+    def is_draining(self):
+        """Whether shutdown has started and new work should be refused."""
+        return self._draining
+
+    def begin_shutdown(self):
+        """Stop reporting ready so load balancers route new requests elsewhere."""
+        with self._lock:
+            if not self._draining:
+                logging.info(f"Shutdown requested with {self.in_flight_total()} generations in flight")
+            self._draining = True
+
+    def wait_for_drain(self, timeout):
+        """Block until all tracked work finishes or the timeout expires.
+
+        Args:
+            timeout (float): Maximum seconds to wait
+
+        Returns:
+            bool: True if everything finished in time
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self.in_flight_total() > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    logging.warning(f"Drain timed out with {self.in_flight_total()} generations still running")
+                    return False
+                self._drained.wait(remaining)
+        logging.info("All in-flight generations finished")
+        return True
+
+    def status(self):
+        """Readiness report for the /ready endpoint."""
+        with self._lock:
+            return {
+                'status': 'draining' if self._draining else 'ready',
+                'in_flight': dict(self._in_flight),
+                'uptime_seconds': int(time.time() - self.started_at)
+            }
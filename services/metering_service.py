@@ -0,0 +1,259 @@
+import os
+import sqlite3
+import threading
+import logging
+import time
+import contextvars
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+# Which story the calls on this thread/task are for (copied into worker threads and asyncio tasks)
+_usage_id = contextvars.ContextVar('usage_id', default=None)
+
+# Estimated USD per unit; adjust to your plans. Stability and ElevenLabs bill in credits/characters.
+UNIT_PRICES = {
+    'claude': {'input_tokens': 3.0 / 1_000_000, 'output_tokens': 15.0 / 1_000_000},
+    'stability': {'credits': 0.01},
+    'elevenlabs': {'characters': 0.0003},
+}
+
+# Stability's v1 generation and v2beta video responses don't report credits; these are list prices
+STABILITY_CREDITS = {
+    'text-to-image': 0.6,
+    'image-to-image': 0.6,
+    'image-to-video': 20,
+}
+
+USAGE_COLUMNS = ['input_tokens', 'output_tokens', 'credits', 'characters']
+
+
+class MeteringService:
+    """Records what every remote API call used and what it cost, per story and per day.
+
+    Services call record() after each upstream request. Rows are queued in
+    memory and written to SQLite in batches by a background thread, so a
+    request (or the event loop) never waits on the database.
+
+    When daily_budget_usd is set and today's estimated spend reaches it,
+    over_budget() turns true and optional stages (self-critique, animation)
+    are skipped until the next day.
+    """
+
+    def __init__(self, db_path="stories.db", daily_budget_usd=None, flush_interval=1.0, budget_cache_seconds=30):
+        """Initialize MeteringService.
+
+        Args:
+            db_path (str): SQLite database for the usage table
+            daily_budget_usd (float, optional): Estimated spend per day before optional stages are skipped
+            flush_interval (float): Seconds between batched writes
+            budget_cache_seconds (float): How long today's spend is cached for over_budget()
+        """
+        self.db_path = db_path
+        self.daily_budget_usd = daily_budget_usd
+        self.flush_interval = flush_interval
+        self.budget_cache_seconds = budget_cache_seconds
+
+        self._lock = threading.Lock()
+        self._pending = []
+        self._writer_pid = None
+        self._spend_cache = (None, 0.0, 0.0)  # (day, spend, checked_at)
+        self._init_table()
+
+    def _init_table(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            conn.execute('''
+            CREATE TABLE IF NOT EXISTS usage (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL,
+                day TEXT,
+                usage_id TEXT,
+                upstream TEXT,
+                operation TEXT,
+                status INTEGER,
+                latency_ms INTEGER,
+                input_tokens INTEGER DEFAULT 0,
+                output_tokens INTEGER DEFAULT 0,
+                credits REAL DEFAULT 0,
+                characters INTEGER DEFAULT 0,
+                cost_usd REAL DEFAULT 0
+            )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS usage_day ON usage (day)')
+            conn.execute('CREATE INDEX IF NOT EXISTS usage_story ON usage (usage_id)')
+            conn.commit()
+        finally:
+            conn.close()
+
+    @contextmanager
+    def story_scope(self, usage_id):
+        """Attribute the calls made inside the block to a story."""
+        token = _usage_id.set(usage_id)
+        try:
+            yield
+        finally:
+            _usage_id.reset(token)
+
+    def current_usage_id(self):
+        """The story calls are currently attributed to, if any."""
+        return _usage_id.get()
+
+    def record(self, upstream, operation, latency, status=None, **units):
+        """Queue one call's usage.
+
+        Args:
+            upstream (str): 'claude', 'stability' or 'elevenlabs'
+            operation (str): Endpoint or call type
+            latency (float): Seconds the call took
+            status (int, optional): HTTP status
+            **units: input_tokens, output_tokens, credits and/or characters
+        """
+        prices = UNIT_PRICES.get(upstream, {})
+        cost = sum(units.get(unit, 0) * price for unit, price in prices.items())
+        row = (
+            time.time(), date.today().isoformat(), _usage_id.get(), upstream, operation, status,
+            int(latency * 1000), *(units.get(column, 0) for column in USAGE_COLUMNS), cost
+        )
+        self._ensure_writer()
+        with self._lock:
+            self._pending.append(row)
+            # Keep the budget check current between database reads
+            day, spend, checked_at = self._spend_cache
+            if day == row[1]:
+                self._spend_cache = (day, spend + cost, checked_at)
+
+    def over_budget(self):
+        """Whether today's estimated spend has reached the daily budget."""
+        if not self.daily_budget_usd:
+            return False
+        return self.spend_today() >= self.daily_budget_usd
+
+    def spend_today(self):
+        """Estimated USD spent today, cached for budget_cache_seconds."""
+        today = date.today().isoformat()
+        with self._lock:
+            day, spend, checked_at = self._spend_cache
+            if day == today and time.monotonic() - checked_at < self.budget_cache_seconds:
+                return spend
+
+        self.flush()
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            spend = conn.execute('SELECT COALESCE(SUM(cost_usd), 0) FROM usage WHERE day = ?', (today,)).fetchone()[0]
+        finally:
+            conn.close()
+        with self._lock:
+            self._spend_cache = (today, spend, time.monotonic())
+        return spend
+
+    def daily_summary(self, days=7):
+        """Usage per day and upstream for the last few days.
+
+        Returns:
+            dict: today, budget and per-day totals by upstream
+        """
+        since = (date.today() - timedelta(days=days - 1)).isoformat()
+        rows = self._aggregate('day, upstream', 'day >= ?', (since,))
+
+        by_day = {}
+        for row in rows:
+            day = by_day.setdefault(row.pop('day'), {'cost_usd': 0.0, 'upstreams': {}})
+            day['cost_usd'] = round(day['cost_usd'] + row['cost_usd'], 4)
+            day['upstreams'][row.pop('upstream')] = row
+
+        return {
+            'today': date.today().isoformat(),
+            'budget': {
+                'daily_usd': self.daily_budget_usd,
+                'spent_today_usd': round(self.spend_today(), 4),
+                'over_budget': self.over_budget()
+            },
+            'days': by_day
+        }
+
+    def story_summary(self, usage_id):
+        """Usage of one story by upstream and operation."""
+        rows = self._aggregate('upstream, operation', 'usage_id = ?', (usage_id,))
+        return {
+            'usage_id': usage_id,
+            'cost_usd': round(sum(row['cost_usd'] for row in rows), 4),
+            'calls': rows
+        }
+
+    def _aggregate(self, group_by, where, params):
+        self.flush()
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            rows = conn.execute(f'''
+                SELECT {group_by}, COUNT(*) AS calls,
+                       SUM(input_tokens) AS input_tokens, SUM(output_tokens) AS output_tokens,
+                       SUM(credits) AS credits, SUM(characters) AS characters,
+                       SUM(cost_usd) AS cost_usd, AVG(latency_ms) AS avg_latency_ms,
+                       SUM(CASE WHEN status IS NULL OR status >= 400 THEN 1 ELSE 0 END) AS errors
+                FROM usage WHERE {where} GROUP BY {group_by} ORDER BY {group_by}
+            ''', params).fetchall()
+        finally:
+            conn.close()
+
+        results = []
+        for row in rows:
+            row = dict(row)
+            row['cost_usd'] = round(row['cost_usd'], 4)
+            row['avg_latency_ms'] = int(row['avg_latency_ms'])
+            results.append(row)
+        return results
+
+    def flush(self):
+        """Write queued rows now."""
+        with self._lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=10)
+            try:
+                conn.executemany(f'''
+                    INSERT INTO usage (created_at, day, usage_id, upstream, operation, status, latency_ms,
+                                       {', '.join(USAGE_COLUMNS)}, cost_usd)
+                    VALUES ({', '.join('?' * (8 + len(USAGE_COLUMNS)))})
+                ''', rows)
+                conn.commit()
+            finally:
+                conn.close()
+        except Exception as e:
+            logging.error(f"✗ Could not write {len(rows)} usage records: {e}")
+
+    def _ensure_writer(self):
+        """Start the writer thread once per process (workers fork after preload)."""
+        if self._writer_pid == os.getpid():
+            return
+        with self._lock:
+            if self._writer_pid == os.getpid():
+                return
+            self._writer_pid = os.getpid()
+            # Rows queued before a fork belong to the parent
+            self._pending = []
+        threading.Thread(target=self._write_loop, name='metering', daemon=True).start()
+
+    def _write_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+
+_meter = None
+_meter_lock = threading.Lock()
+
+
+def get_meter():
+    """Get the shared metering service, creating it on first use."""
+    global _meter
+    with _meter_lock:
+        if _meter is None:
+            budget = os.getenv('DAILY_BUDGET_USD')
+            _meter = MeteringService(
+                os.getenv('METERING_DB', 'stories.db'),
+                daily_budget_usd=float(budget) if budget else None
+            )
+        return _meter
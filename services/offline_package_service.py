@@ -0,0 +1,224 @@
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from services.archive_service import media_paths
+from services.telemetry_service import get_telemetry
+
+# Shared files every story page loads; cached with each package
+PAGE_ASSETS = ['static/css/main.css', 'static/css/reader.css', 'static/js/main.js', 'static/js/reader.js',
+               'static/js/offline.js']
+# Third-party scripts the page loads; cached as opaque responses where the browser allows it
+EXTERNAL_ASSETS = ['https://cdnjs.cloudflare.com/ajax/libs/annyang/2.6.1/annyang.min.js']
+
+STORY_ID = re.compile(r'^[A-Za-z0-9-]{1,64}$')
+
+
+class OfflinePackageService:
+    """Builds a self-contained copy of a saved story for reading without a server.
+
+    A package lives in static/offline/<story id>/ and holds the story page
+    rendered to HTML, narration for every stanza in the chosen voice (both
+    reading modes) with its word timing, and a manifest listing every URL the
+    page needs: the HTML, the narration, the story's images and videos and
+    the shared CSS/JS. The story service worker caches the files the
+    manifest lists, so a reopened package loads entirely from the browser
+    cache.
+
+    Narration files are named by a hash of voice, mode and text, so
+    rebuilding a package after an edit only synthesizes the stanzas that
+    changed.
+    """
+
+    def __init__(self, storage_service, speech_service, package_dir="static/offline", max_workers=3):
+        """Initialize OfflinePackageService.
+
+        Args:
+            storage_service (StorageService): Where saved stories are read from
+            speech_service (SpeechService): Narrates the stanzas
+            package_dir (str): Directory packages are written to (must be under static/)
+            max_workers (int): Stanzas narrated at once per package
+        """
+        self.storage_service = storage_service
+        self.speech_service = speech_service
+        self.package_dir = package_dir
+        self.max_workers = max_workers
+        self.telemetry = get_telemetry()
+
+    def build_package(self, story_id, voice_id, render_page, voice_name=None):
+        """Narrate and render a saved story into its offline package.
+
+        Args:
+            story_id (str): Saved story ID
+            voice_id (str): ElevenLabs voice for the narration
+            render_page (callable): render_page(story, offline) -> HTML of the story page
+            voice_name (str, optional): Voice name shown on the offline page
+
+        Returns:
+            dict: The package manifest, plus 'missing_narration' (stanzas that could not be narrated)
+
+        Raises:
+            ValueError: If the story does not exist
+        """
+        with self.telemetry.span('offline.build_package'):
+            started = time.time()
+            if not STORY_ID.match(story_id):
+                raise ValueError(f"Invalid story ID {story_id!r}")
+            story = self.storage_service.get_story(story_id)
+            package_path = os.path.join(self.package_dir, story_id)
+            os.makedirs(os.path.join(package_path, 'narration'), exist_ok=True)
+
+            stanzas = list(self._stanzas(story['content']))
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='narrate') as pool:
+                # Each task runs in a copy of this context so its calls are metered to the package
+                futures = {
+                    stanza_id: pool.submit(contextvars.copy_context().run, self._narrate, package_path, voice_id, mode, text)
+                    for stanza_id, mode, text in stanzas
+                }
+                narration = {stanza_id: future.result() for stanza_id, future in futures.items()}
+            missing = [stanza_id for stanza_id, entry in narration.items() if entry is None]
+            narration = {stanza_id: entry for stanza_id, entry in narration.items() if entry is not None}
+            self._remove_unused_narration(package_path, narration)
+
+            base_url = f"/{package_path.replace(os.sep, '/')}"
+            files = [f"/{path}" for path in sorted(set(media_paths(story['content'])))
+                     if os.path.isfile(path)]
+            files += [f"/{path}" for path in PAGE_ASSETS if os.path.isfile(path)]
+            files += sorted({entry['url'] for entry in narration.values()})
+
+            # Known before the page is rendered, so the page can tell the worker which version it is
+            version = self._version(story, narration, files)
+            offline = {
+                'story_id': story_id,
+                'version': version,
+                'manifest_url': f"{base_url}/manifest.json",
+                'voice_id': voice_id,
+                'voice_name': voice_name or voice_id,
+                'narration': narration
+            }
+            self._write(os.path.join(package_path, 'index.html'), render_page(story, offline).encode('utf-8'))
+
+            manifest = {
+                'story_id': story_id,
+                'title': story.get('title'),
+                'version': version,
+                'built_at': datetime.now().isoformat(),
+                'voice_id': voice_id,
+                'url': f"{base_url}/index.html",
+                'files': [f"{base_url}/index.html"] + files,
+                'external': EXTERNAL_ASSETS
+            }
+            self._write(os.path.join(package_path, 'manifest.json'), json.dumps(manifest, indent=1).encode('utf-8'))
+
+            logging.info(f"✓ Built offline package for story {story_id} in {time.time() - started:.1f}s: "
+                         f"{len(narration)} narrated stanzas, {len(missing)} missing, {len(manifest['files'])} files")
+            return {**manifest, 'missing_narration': missing}
+
+    def get_package(self, story_id):
+        """The manifest of a story's package, or None if it has none."""
+        if not STORY_ID.match(story_id):
+            return None
+        try:
+            with open(os.path.join(self.package_dir, story_id, 'manifest.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def mark_stale(self, story_id):
+        """Flag a story's package as out of date after the story changed.
+
+        The package keeps working offline as it was; building it again brings
+        it up to date (only changed stanzas are narrated again).
+
+        Returns:
+            bool: Whether the story has a package
+        """
+        manifest = self.get_package(story_id)
+        if not manifest:
+            return False
+        manifest['stale'] = True
+        self._write(os.path.join(self.package_dir, story_id, 'manifest.json'), json.dumps(manifest, indent=1).encode('utf-8'))
+        logging.info(f"Offline package of story {story_id} is out of date")
+        return True
+
+    def delete_package(self, story_id):
+        """Remove a story's package, e.g. when the story is deleted."""
+        if STORY_ID.match(story_id):
+            shutil.rmtree(os.path.join(self.package_dir, story_id), ignore_errors=True)
+
+    def _stanzas(self, content):
+        """(element id, reading mode, text) for every stanza, as story.html numbers and reader.js reads them."""
+        for page in content:
+            for key, prefix, mode in (('stanzas', 'stanza', 'normal'), ('simplified_stanzas', 'simple-stanza', 'learning')):
+                for stanza in page.get(key) or []:
+                    # reader.js joins the stanza's word spans with single spaces
+                    text = ' '.join(word for line in stanza.get('lines', []) for word in line.split())
+                    if text:
+                        yield f"{prefix}-{page['page']}-{stanza['index']}", mode, text
+
+    def _narrate(self, package_path, voice_id, mode, text):
+        """Narration file and word timing for one stanza, or None if it could not be synthesized."""
+        key = hashlib.sha256(f"{voice_id}\n{mode}\n{text}".encode('utf-8')).hexdigest()[:16]
+        path = os.path.join(package_path, 'narration', f"{key}.mp3")
+        timing = self.speech_service.analyze_text_for_timing(text, mode)
+
+        if not os.path.isfile(path):
+            try:
+                audio_stream, headers = self.speech_service.generate_speech(text, voice_id, mode)
+                partial_path = f"{path}.{uuid.uuid4().hex}.tmp"
+                with open(partial_path, 'wb') as f:
+                    for chunk in audio_stream:
+                        f.write(chunk)
+                if headers.get('X-Error') or os.path.getsize(partial_path) == 0:
+                    os.remove(partial_path)
+                    logging.warning(f"No narration for stanza in {mode} mode: {headers.get('X-Error', 'empty audio')}")
+                    return None
+                os.replace(partial_path, path)
+            except Exception as e:
+                logging.error(f"✗ Narration failed for stanza in {mode} mode: {e}")
+                return None
+
+        mode_settings = self.speech_service.reading_settings.get(mode, self.speech_service.reading_settings['normal'])
+        return {
+            'url': f"/{path.replace(os.sep, '/')}",
+            'mode': mode,
+            'playback_rate': mode_settings['playback_rate'],
+            'estimated_duration': timing['total_estimated_duration'],
+            'word_count': timing['word_count'],
+            'word_timings': [
+                {'word': word['word'], 'start_time': word['start_time'], 'duration': word['duration']}
+                for word in timing['word_timings']
+            ]
+        }
+
+    def _remove_unused_narration(self, package_path, narration):
+        """Delete narration left over from an earlier build of the package."""
+        used = {os.path.basename(entry['url']) for entry in narration.values()}
+        narration_dir = os.path.join(package_path, 'narration')
+        for name in os.listdir(narration_dir):
+            if name not in used and not name.endswith('.tmp'):
+                os.remove(os.path.join(narration_dir, name))
+
+    def _version(self, story, narration, files):
+        """Changes whenever the story, its narration or any file the page loads does."""
+        digest = hashlib.sha256()
+        digest.update(json.dumps([story.get('title'), story['content'], narration], sort_keys=True).encode('utf-8'))
+        for url in files:
+            stat = os.stat(url.lstrip('/'))
+            digest.update(f"{url}:{stat.st_size}:{stat.st_mtime_ns};".encode('utf-8'))
+        return digest.hexdigest()[:16]
+
+    def _write(self, path, data):
+        # Write then rename so the page and manifest never disagree mid-rebuild
+        partial_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(partial_path, 'wb') as f:
+            f.write(data)
+        os.replace(partial_path, path)
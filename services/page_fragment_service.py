@@ -0,0 +1,98 @@
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from services.telemetry_service import get_telemetry
+
+
+class PageFragmentService:
+    """Renders story pages to HTML once and reuses the markup.
+
+    Each page becomes one HTML fragment (templates/_story_page.html), cached
+    under the story's key, the page's position and a hash of the page's
+    content. Re-opening a story is then a cache hit for every page, while an
+    edited page (a finished animation, a regenerated illustration) gets a
+    new hash and is rendered again on its own.
+
+    The cache is bounded by total size, least recently used first.
+    """
+
+    def __init__(self, render_fragment, max_bytes=32 * 1024 * 1024):
+        """Initialize PageFragmentService.
+
+        Args:
+            render_fragment (callable): render_fragment(page, is_last) -> HTML of one page
+            max_bytes (int): Total size of the cached fragments
+        """
+        self.render_fragment = render_fragment
+        self.max_bytes = max_bytes
+        self.telemetry = get_telemetry()
+
+        self._fragments = OrderedDict()
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def render_pages(self, story_key, content, start=0, stop=None):
+        """HTML of a range of a story's pages.
+
+        Args:
+            story_key (str): Saved or temporary story ID
+            content (list): The story's pages
+            start (int): Index of the first page
+            stop (int, optional): Index after the last page (default: to the end)
+
+        Returns:
+            list: One HTML string per page
+        """
+        stop = len(content) if stop is None else min(stop, len(content))
+        return [self.render_page(story_key, content, index) for index in range(start, stop)]
+
+    def render_page(self, story_key, content, index):
+        """HTML of one page, from the cache when the page hasn't changed.
+
+        Raises:
+            IndexError: If the story has no such page
+        """
+        page = content[index]
+        is_last = index == len(content) - 1
+        cache_key = (story_key, index, is_last, self.content_version(page))
+
+        with self._lock:
+            fragment = self._fragments.get(cache_key)
+            if fragment is not None:
+                self._fragments.move_to_end(cache_key)
+                self._hits += 1
+                return fragment
+            self._misses += 1
+
+        with self.telemetry.span('fragments.render'):
+            fragment = self.render_fragment(page, is_last)
+
+        with self._lock:
+            if cache_key not in self._fragments:
+                self._fragments[cache_key] = fragment
+                self._size += len(fragment)
+            while self._size > self.max_bytes and self._fragments:
+                _, evicted = self._fragments.popitem(last=False)
+                self._size -= len(evicted)
+        return fragment
+
+    def content_version(self, page):
+        """Changes whenever anything the page template reads from the page does."""
+        return hashlib.sha256(json.dumps(page, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+    def invalidate(self, story_key):
+        """Forget every fragment of a story, e.g. when it is deleted."""
+        with self._lock:
+            for cache_key in [key for key in self._fragments if key[0] == story_key]:
+                self._size -= len(self._fragments.pop(cache_key))
+        logging.debug(f"Dropped cached page fragments of story {story_key}")
+
+    def status(self):
+        """Cache size and hit counts, for /metrics."""
+        with self._lock:
+            return {'fragments': len(self._fragments), 'bytes': self._size, 'hits': self._hits, 'misses': self._misses}
@@ -0,0 +1,136 @@
+import time
+import random
+import logging
+
+from services.story_parser import SECTION_BREAK
+from services.telemetry_service import get_telemetry
+
+REGENERATE_PARTS = ('image', 'text', 'both')
+
+# Fields of a page animation; the clip shows the old illustration, so they go with it
+PAGE_ANIMATION_FIELDS = ('has_animation', 'animation', 'animation_action', 'animation_description',
+                         'animation_duration', 'animation_error', 'animation_status', 'animation_job',
+                         'animation_started_at')
+
+
+class PageVariationService:
+    """Regenerates one page of a stored story instead of the whole story.
+
+    A new illustration is one Stability call: the page's stored image
+    description is drawn again with a fresh seed. New text is one Claude call
+    that rewrites the stanza, its simplified version and its image
+    description together, with the rest of the story as context. The stored
+    story is updated (the session's temporary copy or the saved row), and the
+    full story text, simplified text and image descriptions are kept in step
+    with the pages.
+    """
+
+    def __init__(self, story_service, image_service, reader_service, storage_service, context_length=300):
+        """Initialize PageVariationService.
+
+        Args:
+            story_service (StoryService): Rewrites stanzas
+            image_service (ImageService): Draws illustrations
+            reader_service (ReaderService): Re-analyzes rewritten text for reading
+            storage_service (StorageService): Where the story is read from and written back to
+            context_length (int): Characters of earlier pages passed to the image as context
+        """
+        self.story_service = story_service
+        self.image_service = image_service
+        self.reader_service = reader_service
+        self.storage_service = storage_service
+        self.context_length = context_length
+        self.telemetry = get_telemetry()
+
+    def regenerate_page(self, story_id, story, index, part="image", instructions="", temp=False):
+        """Regenerate a page's illustration, text or both, and store the story.
+
+        The Claude and Stability calls work from the story as read at the
+        start; the results are then written into a fresh copy of the story
+        under its storage lock, so animations and other pages finished in the
+        meantime are kept.
+
+        Args:
+            story_id (str): Saved or temporary story ID
+            story (dict): The story, as returned by get_story or get_temp_story
+            index (int): Position of the page in the story's content
+            part (str): 'image', 'text' or 'both'
+            instructions (str, optional): What to change in the text
+            temp (bool): Whether story_id is a temporary story
+
+        Returns:
+            dict: The story as stored afterwards
+
+        Raises:
+            ValueError: If the part is unknown or the page can't be regenerated
+        """
+        if part not in REGENERATE_PARTS:
+            raise ValueError(f"Unknown part {part!r}, expected one of {', '.join(REGENERATE_PARTS)}")
+
+        content = story['content']
+        page = content[index]
+        if page.get('is_summary_page'):
+            raise ValueError("The summary page is made from the other pages and can't be regenerated on its own")
+        if part != 'text' and page.get('animation_status') in ('queued', 'rendering'):
+            raise ValueError("This page is still being animated; try again when the animation is finished")
+
+        started = time.monotonic()
+        character_description = story.get('character_description', '')
+        changes = {}
+        image_description = (story.get('image_descriptions') or [])[index:index + 1]
+        image_description = image_description[0] if image_description else ''
+
+        with self.telemetry.span('variation.regenerate_page', part=part):
+            if part in ('text', 'both'):
+                rewrite = self.story_service.rewrite_page(
+                    story.get('story_text') or page['text'], page['text'], page['page'],
+                    character_description, instructions
+                )
+                changes.update({
+                    'text': rewrite['text'],
+                    'stanzas': self.reader_service.process_story_text(rewrite['text']),
+                    'simplified_text': rewrite['simplified'],
+                    'simplified_stanzas': self.reader_service.process_story_text(rewrite['simplified'])
+                })
+                image_description = rewrite['image_description'] or image_description
+
+            if part in ('image', 'both'):
+                story_context = ' '.join(earlier['text'] for earlier in content[:index])[-self.context_length:]
+                self.image_service.generate_character_profile(character_description)
+                # A fresh seed, or Stability would draw the same picture again
+                changes['image'] = self.image_service.generate_story_image(
+                    image_description or changes.get('text', page['text']), page['page'], story_context,
+                    seed=random.randrange(1, 4294967295)
+                )
+
+        def apply(stored):
+            stored_page = stored['content'][index]
+            if 'image' in changes:
+                # The clip shows the old illustration
+                for field in PAGE_ANIMATION_FIELDS:
+                    stored_page.pop(field, None)
+                stored_page['has_animation'] = False
+            stored_page.update(changes)
+
+            image_descriptions = list(stored.get('image_descriptions') or [])
+            # Older stories may have fewer descriptions than pages
+            image_descriptions += [''] * (len(stored['content']) - len(image_descriptions))
+            if image_description:
+                image_descriptions[index] = image_description
+
+            story_pages = [item for item in stored['content'] if not item.get('is_summary_page')]
+            stored['story_text'] = SECTION_BREAK.join(item['text'] for item in story_pages)
+            stored['simplified_text'] = SECTION_BREAK.join(item.get('simplified_text', '') for item in story_pages)
+            stored['image_descriptions'] = image_descriptions
+            return True
+
+        if temp:
+            stored = self.storage_service.modify_temp_story(story_id, apply)
+            if stored is None:
+                raise ValueError("This story has expired; please make it again")
+        else:
+            stored = self.storage_service.modify_story(story_id, apply)
+
+        logging.info(f"✓ Regenerated the {part} of page {page['page']} of story {story_id} "
+                     f"in {time.monotonic() - started:.1f}s")
+        return stored
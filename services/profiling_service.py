@@ -0,0 +1,342 @@
+import os
+import re
+import sys
+import json
+import hmac
+import uuid
+import time
+import pstats
+import cProfile
+import threading
+import logging
+from collections import Counter
+from contextlib import contextmanager
+from urllib.parse import parse_qs
+
+PROFILE_MODES = ('cprofile', 'sample')
+
+# Profile files are named <id>.<extension>; ids are generated here, never taken from a URL as-is
+PROFILE_ID = re.compile(r'^[0-9a-f]{16}$')
+EXTENSIONS = {'cprofile': 'pstats', 'sample': 'folded'}
+
+
+class StackSampler(threading.Thread):
+    """Records the call stack of one thread every few milliseconds.
+
+    Stacks are kept in the folded format ('outer;inner;leaf count') read by
+    flamegraph.pl, speedscope and inferno. Sampling only reads the target
+    thread's frames, so the request itself runs at full speed.
+    """
+
+    def __init__(self, thread_id, interval=0.005):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+class ProfilingService:
+    """Profiles selected live requests and keeps the results as downloadable files.
+
+    A request is profiled when it carries the admin token (X-Profile-Token
+    header or profile_token query parameter), or as one in every
+    sample_every requests to the sampled routes. Admin requests use cProfile
+    by default and are saved as .pstats files; sampled requests use the
+    low-overhead stack sampler and are saved as folded stacks for flame
+    graphs. Either can be asked for with X-Profile-Mode / profile_mode.
+
+    Both profilers follow the request's own thread (on the ASGI event loop,
+    everything else the loop runs meanwhile is included). Work handed to
+    pipeline threads shows up as the time spent waiting for it.
+    """
+
+    def __init__(self, profile_dir="profiles", token=None, sample_every=0,
+                 sampled_routes=('/generate', '/read'), keep=200, sample_interval=0.005):
+        """Initialize ProfilingService.
+
+        Args:
+            profile_dir (str): Directory for profile files and their metadata
+            token (str, optional): Admin token that turns profiling on for a request
+            sample_every (int): Profile one in this many requests to sampled_routes (0 disables)
+            sampled_routes (tuple): Paths eligible for sampling
+            keep (int): Newest profiles kept on disk
+            sample_interval (float): Seconds between stack samples
+        """
+        self.profile_dir = profile_dir
+        self.token = token
+        self.sample_every = sample_every
+        self.sampled_routes = sampled_routes
+        self.keep = keep
+        self.sample_interval = sample_interval
+
+        self._lock = threading.Lock()
+        self._requests_seen = 0
+        # cProfile hooks the whole thread; only one profile per thread at a time
+        self._local = threading.local()
+
+    @property
+    def enabled(self):
+        return bool(self.token) or self.sample_every > 0
+
+    def is_admin(self, token):
+        """Whether token matches the admin token."""
+        return bool(self.token) and bool(token) and hmac.compare_digest(token, self.token)
+
+    def choose_mode(self, path, token=None, mode=None):
+        """Decide whether to profile a request, and how.
+
+        Args:
+            path (str): Request path
+            token (str, optional): Token sent with the request
+            mode (str, optional): Profiler asked for ('cprofile' or 'sample')
+
+        Returns:
+            str: 'cprofile' or 'sample', or None to leave the request alone
+        """
+        if not self.enabled or path.startswith('/profiles'):
+            return None
+        if self.is_admin(token):
+            return mode if mode in PROFILE_MODES else 'cprofile'
+        if self.sample_every > 0 and path in self.sampled_routes:
+            with self._lock:
+                self._requests_seen += 1
+                if self._requests_seen % self.sample_every == 0:
+                    return 'sample'
+        return None
+
+    def start(self, route, mode):
+        """Start profiling the current thread.
+
+        Args:
+            route (str): Label for the index, e.g. 'POST /generate'
+            mode (str): 'cprofile' or 'sample'
+
+        Returns:
+            dict: The session to pass to finish()
+        """
+        if mode == 'cprofile' and getattr(self._local, 'profiling', False):
+            # Another request on this thread (an event loop) already holds the profiler hook
+            mode = 'sample'
+
+        session = {
+            'id': uuid.uuid4().hex[:16],
+            'route': route,
+            'mode': mode,
+            'created_at': time.time(),
+            'started': time.perf_counter()
+        }
+        if mode == 'cprofile':
+            self._local.profiling = True
+            session['profiler'] = cProfile.Profile()
+            session['profiler'].enable()
+        else:
+            session['sampler'] = StackSampler(threading.get_ident(), self.sample_interval)
+            session['sampler'].start()
+        return session
+
+    def finish(self, session, status=None):
+        """Stop profiling and write the profile and its index entry.
+
+        Args:
+            session (dict): From start()
+            status (int, optional): HTTP status of the response
+        """
+        duration = time.perf_counter() - session['started']
+        if session['mode'] == 'cprofile':
+            session['profiler'].disable()
+            self._local.profiling = False
+        else:
+            session['sampler'].stop()
+
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            path = self._path(session['id'], session['mode'])
+            if session['mode'] == 'cprofile':
+                session['profiler'].dump_stats(path)
+                top = self._top_functions(session['profiler'])
+            else:
+                stacks = session['sampler'].stacks
+                with open(path, 'w', encoding='utf-8') as f:
+                    f.writelines(f"{stack} {count}\n" for stack, count in stacks.most_common())
+                top = self._top_frames(stacks)
+
+            metadata = {
+                'id': session['id'],
+                'route': session['route'],
+                'mode': session['mode'],
+                'status': status,
+                'duration_ms': int(duration * 1000),
+                'created_at': session['created_at'],
+                'file': os.path.basename(path),
+                'top': top
+            }
+            with open(os.path.join(self.profile_dir, f"{session['id']}.json"), 'w', encoding='utf-8') as f:
+                json.dump(metadata, f)
+            logging.info(f"✓ Profiled {session['route']} ({session['mode']}, {duration:.2f}s) as {session['id']}")
+            self._prune()
+        except Exception as e:
+            logging.error(f"✗ Could not save profile of {session['route']}: {e}")
+
+    @contextmanager
+    def profile(self, route, mode):
+        """Profile the block; for handlers that finish their response inside it."""
+        session = self.start(route, mode)
+        try:
+            yield session
+        finally:
+            self.finish(session)
+
+    def list_profiles(self, limit=50):
+        """Index entries of the newest profiles, newest first."""
+        entries = []
+        for name in self._metadata_files()[:limit]:
+            try:
+                with open(os.path.join(self.profile_dir, name), encoding='utf-8') as f:
+                    entries.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return entries
+
+    def profile_file(self, profile_id):
+        """Path of a stored profile, or None if there is no such profile."""
+        if not PROFILE_ID.match(profile_id):
+            return None
+        for mode in PROFILE_MODES:
+            path = self._path(profile_id, mode)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def _path(self, profile_id, mode):
+        return os.path.join(self.profile_dir, f"{profile_id}.{EXTENSIONS[mode]}")
+
+    def _metadata_files(self):
+        """Index files, newest first."""
+        try:
+            names = [name for name in os.listdir(self.profile_dir) if name.endswith('.json')]
+        except FileNotFoundError:
+            return []
+        paths = {name: os.path.join(self.profile_dir, name) for name in names}
+        return sorted(names, key=lambda name: os.path.getmtime(paths[name]) if os.path.exists(paths[name]) else 0,
+                      reverse=True)
+
+    def _prune(self):
+        """Delete profiles beyond the newest keep."""
+        for name in self._metadata_files()[self.keep:]:
+            profile_id = name[:-len('.json')]
+            for path in [os.path.join(self.profile_dir, name)] + [self._path(profile_id, mode) for mode in PROFILE_MODES]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def _top_functions(self, profiler, count=10):
+        """Functions with the most time of their own (excluding callees), for the index."""
+        stats = pstats.Stats(profiler).stats
+        ranked = sorted(stats.items(), key=lambda item: -item[1][2])[:count]
+        return [
+            {'function': f"{name} ({os.path.basename(filename)}:{line})", 'calls': calls,
+             'self_s': round(own, 4), 'cumulative_s': round(cumulative, 4)}
+            for (filename, line, name), (_, calls, own, cumulative, _) in ranked
+        ]
+
+    def _top_frames(self, stacks, count=10):
+        """Innermost frames seen most often, for the index."""
+        leaves = Counter()
+        for stack, samples in stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += samples
+        total = sum(leaves.values()) or 1
+        return [
+            {'function': frame, 'samples': samples, 'share': round(samples / total, 3)}
+            for frame, samples in leaves.most_common(count)
+        ]
+
+
+class ProfilingMiddleware:
+    """WSGI middleware that profiles requests chosen by a ProfilingService.
+
+    The profile stays open until the server closes the response, so streamed
+    bodies (the /read audio) are included. Profiled responses carry an
+    X-Profile-Id header naming the profile.
+    """
+
+    def __init__(self, wsgi_app, profiler):
+        self.wsgi_app = wsgi_app
+        self.profiler = profiler
+
+    def __call__(self, environ, start_response):
+        query = parse_qs(environ.get('QUERY_STRING', ''))
+        path = environ.get('PATH_INFO', '')
+        mode = self.profiler.choose_mode(
+            path,
+            environ.get('HTTP_X_PROFILE_TOKEN') or query.get('profile_token', [None])[0],
+            environ.get('HTTP_X_PROFILE_MODE') or query.get('profile_mode', [None])[0]
+        )
+        if mode is None:
+            return self.wsgi_app(environ, start_response)
+
+        session = self.profiler.start(f"{environ.get('REQUEST_METHOD', 'GET')} {path}", mode)
+        response_status = {}
+
+        def profiled_start_response(status, headers, exc_info=None):
+            response_status['code'] = int(status.split(' ', 1)[0])
+            return start_response(status, headers + [('X-Profile-Id', session['id'])], exc_info)
+
+        try:
+            body = self.wsgi_app(environ, profiled_start_response)
+        except Exception:
+            self.profiler.finish(session, 500)
+            raise
+        return _ProfiledBody(body, lambda: self.profiler.finish(session, response_status.get('code')))
+
+
+class _ProfiledBody:
+    """Response iterable that ends the profile when the server closes it."""
+
+    def __init__(self, body, on_close):
+        self.body = body
+        self.on_close = on_close
+
+    def __iter__(self):
+        return iter(self.body)
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            self.on_close()
+
+
+_profiler = None
+_profiler_lock = threading.Lock()
+
+
+def get_profiler():
+    """Get the shared profiling service, creating it on first use."""
+    global _profiler
+    with _profiler_lock:
+        if _profiler is None:
+            _profiler = ProfilingService(
+                os.getenv('PROFILE_DIR', 'profiles'),
+                token=os.getenv('PROFILE_TOKEN'),
+                sample_every=int(os.getenv('PROFILE_SAMPLE_EVERY', 0))
+            )
+        return _profiler
@@ -0,0 +1,168 @@
+import os
+import hashlib
+import threading
+import logging
+import time
+from jinja2 import Environment, StrictUndefined, TemplateSyntaxError, meta
+
+class PromptRegistry:
+    """Loads the prompt templates in prompts/ once and renders them on demand.
+
+    Templates use Jinja syntax ({{ description }}, {% for %}) and are
+    compiled when loaded. Each template may only use the variables its
+    caller passes in (PROMPT_VARIABLES), so a typo fails at startup instead
+    of on the first story. Files are re-checked at most every check_interval
+    seconds and recompiled when their mtime changes; a broken edit is logged
+    and the previous version keeps serving.
+
+    template_hash(name) changes whenever a template's text does, so caches of
+    model output can include it in their keys.
+    """
+
+    def __init__(self, prompt_dir="prompts", variables=None, check_interval=2.0):
+        """Initialize PromptRegistry and load every template.
+
+        Args:
+            prompt_dir (str): Directory of *.txt templates
+            variables (dict): Template name -> variables it may use (default: PROMPT_VARIABLES)
+            check_interval (float): Seconds between mtime checks (0 checks on every render)
+
+        Raises:
+            ValueError: If a template is missing, does not compile or uses an unknown variable
+        """
+        self.prompt_dir = prompt_dir
+        self.variables = variables if variables is not None else PROMPT_VARIABLES
+        self.check_interval = check_interval
+
+        self._environment = Environment(undefined=StrictUndefined, autoescape=False)
+        self._lock = threading.Lock()
+        self._templates = {}
+        self._checked_at = 0.0
+
+        for name in self.variables:
+            self._templates[name] = self._load(name)
+        self._checked_at = time.monotonic()
+        logging.info(f"Loaded {len(self._templates)} prompt templates (version {self.version})")
+
+    def render(self, name, **variables):
+        """Render a template.
+
+        Args:
+            name (str): Template name (file name without .txt)
+            **variables: Values for the template's variables
+
+        Returns:
+            str: The prompt
+        """
+        self._reload_if_changed()
+        with self._lock:
+            template = self._templates[name]
+        return template['compiled'].render(**variables)
+
+    def template_hash(self, name):
+        """Short content hash of one template."""
+        self._reload_if_changed()
+        with self._lock:
+            return self._templates[name]['hash']
+
+    @property
+    def version(self):
+        """Short hash over every template, for keys that depend on all of them."""
+        with self._lock:
+            digest = hashlib.sha256()
+            for name in sorted(self._templates):
+                digest.update(f"{name}:{self._templates[name]['hash']};".encode())
+        return digest.hexdigest()[:16]
+
+    def status(self):
+        """Hash and load time of every template."""
+        self._reload_if_changed()
+        with self._lock:
+            return {
+                name: {'hash': template['hash'], 'loaded_at': template['loaded_at']}
+                for name, template in self._templates.items()
+            }
+
+    def _path(self, name):
+        return os.path.join(self.prompt_dir, f"{name}.txt")
+
+    def _load(self, name):
+        """Read, compile and validate one template."""
+        path = self._path(name)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            with open(path, encoding='utf-8') as f:
+                source = f.read()
+        except OSError as e:
+            raise ValueError(f"Prompt template {name} could not be read: {e}")
+
+        try:
+            used = meta.find_undeclared_variables(self._environment.parse(source))
+            compiled = self._environment.from_string(source)
+        except TemplateSyntaxError as e:
+            raise ValueError(f"Prompt template {name} has a syntax error on line {e.lineno}: {e.message}")
+
+        unknown = used - set(self.variables[name])
+        if unknown:
+            raise ValueError(f"Prompt template {name} uses unknown variables: {', '.join(sorted(unknown))}")
+
+        return {
+            'compiled': compiled,
+            'hash': hashlib.sha256(source.encode()).hexdigest()[:16],
+            'mtime': mtime,
+            'loaded_at': time.time()
+        }
+
+    def _reload_if_changed(self):
+        """Recompile templates whose file changed since they were loaded."""
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+            stale = []
+            for name, template in self._templates.items():
+                try:
+                    if os.stat(self._path(name)).st_mtime_ns != template['mtime']:
+                        stale.append(name)
+                except OSError:
+                    pass
+
+        for name in stale:
+            try:
+                template = self._load(name)
+            except ValueError as e:
+                logging.error(f"✗ Keeping previous prompt template: {e}")
+                # Don't retry the broken file until it changes again
+                with self._lock:
+                    self._templates[name]['mtime'] = os.stat(self._path(name)).st_mtime_ns
+                continue
+            with self._lock:
+                self._templates[name] = template
+            logging.info(f"✓ Reloaded prompt template {name} ({template['hash']})")
+
+
+# Variables each template is rendered with; templates may use any subset
+PROMPT_VARIABLES = {
+    'story_prompt': ['description', 'character_description', 'template_type', 'template_guidance'],
+    'story_critique_prompt': ['story'],
+    'structured_story_prompt': ['description', 'character_description', 'template_type', 'template_guidance'],
+    'simplified_story_prompt': ['original_story'],
+    'image_description_prompt': ['stanzas', 'character_description'],
+    'image_prompt': ['scene_description', 'character_description'],
+    'image_photo_prompt': ['scene_description'],
+    'reader_prompt': ['text'],
+    'page_rewrite_prompt': ['story', 'stanza', 'page_number', 'instructions', 'character_description'],
+}
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_prompt_registry():
+    """Get the shared prompt registry, loading the templates on first use."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = PromptRegistry(os.getenv('PROMPT_DIR', 'prompts'))
+        return _registry
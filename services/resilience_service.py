@@ -0,0 +1,356 @@
+import asyncio
+import threading
+import logging
+import time
+from contextlib import contextmanager, asynccontextmanager
+from services.telemetry_service import get_telemetry
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling an upstream whose breaker is open or whose call queue is full or too slow."""
+
+    def __init__(self, upstream, reason):
+        super().__init__(f"{upstream} temporarily unavailable: {reason}")
+        self.upstream = upstream
+        self.reason = reason
+
+
+class CircuitBreaker:
+    """Per-upstream circuit breaker.
+
+    closed: calls go through; consecutive failures are counted.
+    open: calls fail fast until reset_timeout has passed.
+    half_open: a single trial call is let through; success closes, failure re-opens.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        """Initialize CircuitBreaker.
+
+        Args:
+            name (str): Upstream name, used in errors and logs
+            failure_threshold (int): Consecutive failures before opening
+            reset_timeout (float): Seconds to stay open before a trial call
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = 'closed'
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_progress = False
+
+    @property
+    def state(self):
+        with self._lock:
+            self._refresh_state()
+            return self._state
+
+    def _refresh_state(self):
+        if self._state == 'open' and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = 'half_open'
+            self._trial_in_progress = False
+
+    def allow_request(self):
+        """Whether a call may go to the upstream right now."""
+        with self._lock:
+            self._refresh_state()
+            if self._state == 'closed':
+                return True
+            if self._state == 'half_open' and not self._trial_in_progress:
+                self._trial_in_progress = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != 'closed':
+                logging.info(f"Circuit for {self.name} closed again")
+            self._state = 'closed'
+            self._failures = 0
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == 'half_open' or self._failures >= self.failure_threshold:
+                if self._state != 'open':
+                    logging.warning(f"Circuit for {self.name} opened after {self._failures} failures")
+                self._state = 'open'
+                self._opened_at = time.monotonic()
+                self._trial_in_progress = False
+
+    def status(self):
+        with self._lock:
+            self._refresh_state()
+            return {'state': self._state, 'consecutive_failures': self._failures}
+
+
+class AIMDLimiter:
+    """Adaptive concurrency limit: additive increase on success, multiplicative decrease on overload.
+
+    A call that finds every slot taken waits for one in a bounded queue. It
+    is shed only when max_queue calls are already waiting or no slot frees
+    up within queue_timeout seconds, so a short burst queues instead of
+    failing while a struggling upstream still can't park request threads
+    forever.
+    """
+
+    def __init__(self, name, initial_limit=8, min_limit=1, max_limit=64, backoff_ratio=0.5, max_queue=64,
+                 queue_timeout=30):
+        """Initialize AIMDLimiter.
+
+        Args:
+            name (str): Upstream name, used in errors and logs
+            initial_limit (int): Starting concurrency limit
+            min_limit (int): Floor for the limit
+            max_limit (int): Ceiling for the limit
+            backoff_ratio (float): Multiplier applied to the limit on overload
+            max_queue (int): Calls that may wait for a slot at once
+            queue_timeout (float): Longest a call waits for a slot
+        """
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff_ratio = backoff_ratio
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+        self._limit = float(initial_limit)
+        self._in_flight = 0
+        self._queued = 0
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    def try_acquire(self):
+        """Take a slot if one is free, without waiting."""
+        with self._lock:
+            return self._take_slot()
+
+    def acquire(self):
+        """Take a slot, waiting in the queue for one if necessary.
+
+        Raises:
+            UpstreamUnavailable: If the queue is full or no slot freed up in time
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        with self._lock:
+            if self._take_slot():
+                return
+            self._join_queue()
+            try:
+                while not self._take_slot():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise UpstreamUnavailable(self.name, f'no call slot free within {self.queue_timeout}s')
+                    self._slot_freed.wait(remaining)
+            finally:
+                self._queued -= 1
+
+    async def acquire_async(self):
+        """acquire() for the event loop: waits with asyncio.sleep instead of blocking the thread."""
+        deadline = time.monotonic() + self.queue_timeout
+        with self._lock:
+            if self._take_slot():
+                return
+            self._join_queue()
+        try:
+            delay = 0.01
+            while True:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.1)
+                with self._lock:
+                    if self._take_slot():
+                        return
+                if time.monotonic() >= deadline:
+                    raise UpstreamUnavailable(self.name, f'no call slot free within {self.queue_timeout}s')
+        finally:
+            with self._lock:
+                self._queued -= 1
+
+    def release(self, overloaded=False, adjust=True):
+        """Free a slot.
+
+        Args:
+            overloaded (bool): The upstream said to slow down
+            adjust (bool): Let the outcome move the limit (False when the call was never sent)
+        """
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+            if adjust and overloaded:
+                self._limit = max(self.min_limit, self._limit * self.backoff_ratio)
+                logging.warning(f"{self.name} overloaded - concurrency limit lowered to {int(self._limit)}")
+            elif adjust:
+                # +1 per full window of successes
+                self._limit = min(self.max_limit, self._limit + 1.0 / max(1.0, self._limit))
+            self._slot_freed.notify_all()
+
+    def status(self):
+        with self._lock:
+            return {'limit': int(self._limit), 'in_flight': self._in_flight, 'queued': self._queued}
+
+    def _take_slot(self):
+        # Lock held
+        if self._in_flight >= int(self._limit):
+            return False
+        self._in_flight += 1
+        return True
+
+    def _join_queue(self):
+        # Lock held
+        if self._queued >= self.max_queue:
+            raise UpstreamUnavailable(self.name, f'{self._queued} calls already waiting for a slot')
+        self._queued += 1
+
+
+class Upstream:
+    """Circuit breaker and concurrency limiter guarding one remote API."""
+
+    def __init__(self, name, breaker, limiter):
+        self.name = name
+        self.breaker = breaker
+        self.limiter = limiter
+
+    def acquire(self):
+        """Reserve a call slot, waiting in the limiter's queue if every slot is taken.
+
+        Raises:
+            UpstreamUnavailable: If the circuit is open, the queue is full or no slot freed up in time
+        """
+        if not self.is_available():
+            raise UpstreamUnavailable(self.name, 'circuit open')
+        self.limiter.acquire()
+        self._admit()
+
+    async def acquire_async(self):
+        """acquire() for the event loop."""
+        if not self.is_available():
+            raise UpstreamUnavailable(self.name, 'circuit open')
+        await self.limiter.acquire_async()
+        self._admit()
+
+    def _admit(self):
+        # Asked only once a slot is held, so a half-open breaker's trial call isn't spent while queued
+        if not self.breaker.allow_request():
+            self.limiter.release(adjust=False)
+            raise UpstreamUnavailable(self.name, 'circuit open')
+
+    def release(self, success, overloaded=False):
+        """Record the outcome of a call started with acquire()."""
+        self.limiter.release(overloaded=overloaded)
+        if success:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    @contextmanager
+    def call(self):
+        """Guard a synchronous call. The body reports outcome via the yielded CallOutcome.
+
+        Exceptions raised in the body count as failures; set outcome.overloaded
+        for 429/503/529-style responses so the limiter backs off.
+        """
+        self._acquire_or_shed(self.acquire)
+        with self._guard() as outcome:
+            yield outcome
+
+    @asynccontextmanager
+    async def async_call(self):
+        """call() for coroutines: waiting for a slot doesn't block the event loop."""
+        started = time.perf_counter()
+        try:
+            await self.acquire_async()
+        except UpstreamUnavailable:
+            get_telemetry().increment('upstream_shed_total', upstream=self.name)
+            raise
+        finally:
+            get_telemetry().observe('upstream_queue_seconds', time.perf_counter() - started, upstream=self.name)
+        with self._guard() as outcome:
+            yield outcome
+
+    def _acquire_or_shed(self, acquire):
+        telemetry = get_telemetry()
+        started = time.perf_counter()
+        try:
+            acquire()
+        except UpstreamUnavailable:
+            telemetry.increment('upstream_shed_total', upstream=self.name)
+            raise
+        finally:
+            telemetry.observe('upstream_queue_seconds', time.perf_counter() - started, upstream=self.name)
+
+    @contextmanager
+    def _guard(self):
+        """Time the call and release its slot with the outcome."""
+        outcome = CallOutcome()
+        started = time.perf_counter()
+        try:
+            yield outcome
+        except Exception:
+            outcome.failed = True
+            raise
+        finally:
+            self.release(success=not outcome.failed and not outcome.overloaded, overloaded=outcome.overloaded)
+            get_telemetry().observe('upstream_request_seconds', time.perf_counter() - started,
+                                    upstream=self.name, outcome=outcome.label())
+
+    def is_available(self):
+        return self.breaker.state != 'open'
+
+    def status(self):
+        return {'circuit': self.breaker.status(), 'concurrency': self.limiter.status()}
+
+
+class CallOutcome:
+    """Mutable result flags for a guarded upstream call."""
+
+    def __init__(self):
+        self.failed = False
+        self.overloaded = False
+
+    def label(self):
+        return 'failed' if self.failed else 'overloaded' if self.overloaded else 'ok'
+
+    def record_status(self, status_code):
+        """Classify an HTTP status: overload statuses back off, 5xx count as failures."""
+        if status_code in OVERLOAD_STATUS_CODES:
+            self.overloaded = True
+        elif status_code >= 500:
+            self.failed = True
+
+
+# Statuses that mean "slow down" rather than "this request was bad"
+OVERLOAD_STATUS_CODES = {429, 503, 529}
+
+_upstreams = {}
+_upstreams_lock = threading.Lock()
+
+# Remote APIs share limits across every service that calls them
+UPSTREAM_DEFAULTS = {
+    'claude': {'initial_limit': 8, 'max_limit': 32},
+    # A story illustrates up to 3 pages at once (StoryPipelineService max_workers), so start with room
+    # for four stories in parallel; more wait in the queue
+    'stability': {'initial_limit': 12, 'max_limit': 24, 'queue_timeout': 60},
+    'elevenlabs': {'initial_limit': 16, 'max_limit': 64},
+}
+
+
+def get_upstream(name):
+    """Get the shared breaker/limiter pair for an upstream, creating it on first use."""
+    with _upstreams_lock:
+        if name not in _upstreams:
+            limits = UPSTREAM_DEFAULTS.get(name, {})
+            _upstreams[name] = Upstream(
+                name,
+                CircuitBreaker(name),
+                AIMDLimiter(name, **limits)
+            )
+        return _upstreams[name]
+
+
+def upstream_status():
+    """Breaker and limiter state for every upstream seen so far."""
+    with _upstreams_lock:
+        return {name: upstream.status() for name, upstream in _upstreams.items()}
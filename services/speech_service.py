@@ -1,17 +1,40 @@
+import os
 import requests
 import logging
 import re
 import json
+import time
 from datetime import datetime
+from services.resilience_service import get_upstream
+from services.metering_service import get_meter
+from services.telemetry_service import get_telemetry
+
+# Overridable so benchmarks can point the service at a local stand-in
+ELEVEN_LABS_API_URL = os.getenv('ELEVEN_LABS_API_URL', 'https://api.elevenlabs.io/v1')
 
 class SpeechService:
     """Enhanced service for text-to-speech with predictive timing and better synchronization."""
 
-    def __init__(self, api_key, reading_settings):
-        """Initialize SpeechService with API key and enhanced reading settings."""
+    def __init__(self, api_key, reading_settings, first_chunk_size=4096, stream_chunk_size=32768):
+        """Initialize SpeechService with API key and enhanced reading settings.
+
+        Args:
+            api_key (str): ElevenLabs API key
+            reading_settings (dict): Reading speed configuration from app.py
+            first_chunk_size (int): Bytes read before the first chunk is sent to the
+                client (~250ms of 128kbps MP3, enough for the browser to start playback)
+            stream_chunk_size (int): Bytes per chunk for the rest of the stream
+        """
         self.api_key = api_key
-        self.base_url = "https://api.elevenlabs.io/v1"
+        self.base_url = ELEVEN_LABS_API_URL
         self.reading_settings = reading_settings
+        self.first_chunk_size = first_chunk_size
+        self.stream_chunk_size = stream_chunk_size
+        # Circuit breaker and concurrency limit shared by every ElevenLabs caller
+        self.upstream = get_upstream('elevenlabs')
+        # Characters billed per request, for cost accounting
+        self.meter = get_meter()
+        self.telemetry = get_telemetry()
 
         # Enhanced timing prediction models
         self.timing_models = {
@@ -60,27 +83,30 @@ class SpeechService:
                 "xi-api-key": self.api_key
             }
 
-            response = requests.get(url, headers=headers)
+            with self.upstream.call() as outcome:
+                response = requests.get(url, headers=headers, timeout=15)
+                outcome.record_status(response.status_code)
             response.raise_for_status()
-            data = response.json()
-
-            # Filter and prioritize voices suitable for children's content
-            suitable_voices = []
-            for voice in data['voices']:
-                voice_name = voice['name'].lower()
-                # Prioritize female, young, or gentle voices for children's stories
-                if any(keyword in voice_name for keyword in ['female', 'young', 'child', 'gentle', 'sarah', 'alice', 'lily']):
-                    suitable_voices.insert(0, {"id": voice['voice_id'], "name": voice['name']})
-                else:
-                    suitable_voices.append({"id": voice['voice_id'], "name": voice['name']})
-
-            logging.info(f"Retrieved {len(suitable_voices)} voices, prioritized for children's content")
-            return suitable_voices
+            return self._prioritize_voices(response.json())
 
         except Exception as e:
             logging.error(f"Error fetching voices: {e}")
             return []
 
+    def _prioritize_voices(self, data):
+        """Filter and prioritize voices suitable for children's content."""
+        suitable_voices = []
+        for voice in data['voices']:
+            voice_name = voice['name'].lower()
+            # Prioritize female, young, or gentle voices for children's stories
+            if any(keyword in voice_name for keyword in ['female', 'young', 'child', 'gentle', 'sarah', 'alice', 'lily']):
+                suitable_voices.insert(0, {"id": voice['voice_id'], "name": voice['name']})
+            else:
+                suitable_voices.append({"id": voice['voice_id'], "name": voice['name']})
+
+        logging.info(f"Retrieved {len(suitable_voices)} voices, prioritized for children's content")
+        return suitable_voices
+
     def analyze_text_for_timing(self, text, reading_mode="normal"):
         """Analyze text to predict precise timing for word highlighting."""
 
@@ -250,69 +276,23 @@ class SpeechService:
             raise Exception("ElevenLabs API key not configured")
 
         try:
-            # Analyze text for timing prediction
-            timing_analysis = self.analyze_text_for_timing(text, reading_mode)
-
-            # Clean the text for speech synthesis
-            clean_text = ' '.join(filter(bool, [line.strip() for line in text.split('\n')]))
-
-            # Get mode-specific settings
-            mode_settings = self.reading_settings.get(reading_mode, self.reading_settings['normal'])
-
-            # Calculate optimal speech settings
-            speaking_rate = mode_settings['speaking_rate']
-            client_playback_rate = mode_settings['playback_rate']
-
-            # Adjust speaking rate based on text complexity
-            complexity_dist = timing_analysis['complexity_distribution']
-            if complexity_dist['complex'] > 30:  # If more than 30% complex words
-                speaking_rate *= 0.9  # Slow down slightly
-
-            # Ensure speaking rate is within ElevenLabs limits
-            speaking_rate = max(0.5, min(2.0, speaking_rate))
-
-            logging.info(f"Speech generation: mode={reading_mode}, estimated_duration={timing_analysis['total_estimated_duration']}ms")
-            logging.info(f"Complexity distribution: {complexity_dist}")
-
-            url = f"{self.base_url}/text-to-speech/{voice_id}/stream"
-            headers = {
-                "Accept": "application/json",
-                "Content-Type": "application/json",
-                "xi-api-key": self.api_key
-            }
-
-            data = {
-                "text": clean_text,
-                "model_id": "eleven_multilingual_v2",
-                "voice_settings": {
-                    "stability": 0.7,        # Higher stability for children
-                    "similarity_boost": 0.8,  # Better voice consistency
-                    "style": 0.1,            # Minimal style variation
-                    "use_speaker_boost": True,
-                    "speed": speaking_rate
-                }
-            }
-
-            # Enhanced response headers with timing data
-            response_headers = {
-                'X-Reading-Mode': reading_mode,
-                'X-Playback-Rate': str(client_playback_rate),
-                'X-Word-Count': str(timing_analysis['word_count']),
-                'X-Estimated-Duration': str(timing_analysis['total_estimated_duration']),
-                'X-Average-Word-Duration': str(timing_analysis['average_word_duration']),
-                'X-Complexity-Distribution': json.dumps(complexity_dist),
-                'X-Timing-Data': json.dumps(timing_analysis['word_timings'][:10])  # First 10 words for debugging
-            }
-
-            response = requests.post(url, headers=headers, json=data, stream=True)
+            url, headers, data, response_headers = self._prepare_speech_request(text, voice_id, reading_mode)
+
+            # The concurrency slot covers the upstream call up to the first
+            # audio chunk, which is where an overloaded upstream shows up
+            request_started = time.monotonic()
+            with self.telemetry.span('speech.first_audio', 'elevenlabs'), self.upstream.call() as outcome:
+                response = requests.post(url, headers=headers, json=data, stream=True, timeout=30)
+                outcome.record_status(response.status_code)
+                if response.status_code == 200:
+                    # Pull the first chunk before handing back headers so the time to
+                    # first audio can be reported, and the client can start playback
+                    # as soon as it arrives
+                    first_chunk = self._read_first_chunk(response)
+            self._record_usage(request_started, response, data)
 
             if response.status_code != 200:
-                error_message = f"ElevenLabs API error: {response.status_code}"
-                try:
-                    error_data = response.json()
-                    error_message += f" - {error_data.get('detail', 'Unknown error')}"
-                except:
-                    error_message += f" - {response.text[:100]}"
+                error_message = self._describe_speech_error(response.status_code, response)
 
                 logging.error(error_message)
                 response_headers['X-Error'] = error_message
@@ -321,10 +301,18 @@ class SpeechService:
                     yield b""
                 return empty_generator(), response_headers
 
+            self._add_streaming_headers(response_headers, request_started, first_chunk)
+
             def generate():
-                for chunk in response.iter_content(chunk_size=1024):
-                    if chunk:
+                try:
+                    if first_chunk:
+                        yield first_chunk
+                    # Keep reading through raw.read(): iter_content would re-parse the chunked
+                    # framing that the first read already consumed part of
+                    for chunk in iter(lambda: response.raw.read(self.stream_chunk_size, decode_content=True), b""):
                         yield chunk
+                finally:
+                    response.close()
 
             return generate(), response_headers
 
@@ -339,6 +327,107 @@ class SpeechService:
             }
             return empty_generator(), response_headers
 
+    def _record_usage(self, request_started, response, data):
+        """Meter one speech request, preferring the character cost ElevenLabs reports."""
+        characters = 0
+        if response.status_code == 200:
+            characters = int(response.headers.get('character-cost') or len(data.get('text', '')))
+        self.meter.record(
+            'elevenlabs', 'text-to-speech', time.monotonic() - request_started,
+            response.status_code, characters=characters
+        )
+
+    def _prepare_speech_request(self, text, voice_id, reading_mode="normal"):
+        """Build the ElevenLabs streaming request and the timing headers for the client.
+
+        Returns:
+            tuple: (url, headers, json body, response headers)
+        """
+        # Analyze text for timing prediction
+        timing_analysis = self.analyze_text_for_timing(text, reading_mode)
+
+        # Clean the text for speech synthesis
+        clean_text = ' '.join(filter(bool, [line.strip() for line in text.split('\n')]))
+
+        # Get mode-specific settings
+        mode_settings = self.reading_settings.get(reading_mode, self.reading_settings['normal'])
+
+        # Calculate optimal speech settings
+        speaking_rate = mode_settings['speaking_rate']
+        client_playback_rate = mode_settings['playback_rate']
+
+        # Adjust speaking rate based on text complexity
+        complexity_dist = timing_analysis['complexity_distribution']
+        if complexity_dist['complex'] > 30:  # If more than 30% complex words
+            speaking_rate *= 0.9  # Slow down slightly
+
+        # Ensure speaking rate is within ElevenLabs limits
+        speaking_rate = max(0.5, min(2.0, speaking_rate))
+
+        logging.info(f"Speech generation: mode={reading_mode}, estimated_duration={timing_analysis['total_estimated_duration']}ms")
+        logging.info(f"Complexity distribution: {complexity_dist}")
+
+        url = f"{self.base_url}/text-to-speech/{voice_id}/stream"
+        headers = {
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+            "xi-api-key": self.api_key
+        }
+
+        data = {
+            "text": clean_text,
+            "model_id": "eleven_multilingual_v2",
+            "voice_settings": {
+                "stability": 0.7,        # Higher stability for children
+                "similarity_boost": 0.8,  # Better voice consistency
+                "style": 0.1,            # Minimal style variation
+                "use_speaker_boost": True,
+                "speed": speaking_rate
+            }
+        }
+
+        # Enhanced response headers with timing data
+        response_headers = {
+            'X-Reading-Mode': reading_mode,
+            'X-Playback-Rate': str(client_playback_rate),
+            'X-Word-Count': str(timing_analysis['word_count']),
+            'X-Estimated-Duration': str(timing_analysis['total_estimated_duration']),
+            'X-Average-Word-Duration': str(timing_analysis['average_word_duration']),
+            'X-Complexity-Distribution': json.dumps(complexity_dist),
+            'X-Timing-Data': json.dumps(timing_analysis['word_timings'][:10])  # First 10 words for debugging
+        }
+
+        return url, headers, data, response_headers
+
+    def _describe_speech_error(self, status_code, response):
+        """Build a readable error message from a failed ElevenLabs response."""
+        error_message = f"ElevenLabs API error: {status_code}"
+        try:
+            error_data = response.json()
+            error_message += f" - {error_data.get('detail', 'Unknown error')}"
+        except:
+            error_message += f" - {response.text[:100]}"
+        return error_message
+
+    def _add_streaming_headers(self, response_headers, request_started, first_chunk):
+        """Record time to first audio and disable caching/buffering of the stream."""
+        time_to_first_audio = int((time.monotonic() - request_started) * 1000)
+        logging.info(f"Time to first audio: {time_to_first_audio}ms ({len(first_chunk)} bytes)")
+
+        response_headers['X-Time-To-First-Audio'] = str(time_to_first_audio)
+        response_headers['Server-Timing'] = f"ttfa;dur={time_to_first_audio}"
+        response_headers['Cache-Control'] = 'no-cache'
+        response_headers['X-Accel-Buffering'] = 'no'  # Don't let proxies buffer the stream
+
+    def _read_first_chunk(self, response):
+        """Read just enough of the upstream stream to start playback."""
+        try:
+            data = response.raw.read(self.first_chunk_size, decode_content=True)
+        except Exception as e:
+            logging.warning(f"Could not read first audio chunk: {e}")
+            return b""
+        return data or b""
+
     def get_timing_preview(self, text, reading_mode="normal"):
         """Get a preview of timing analysis without generating speech."""
         return self.analyze_text_for_timing(text, reading_mode)
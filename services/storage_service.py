@@ -4,7 +4,15 @@ import sqlite3
 import logging
 import uuid
 import shutil
+import threading
+from contextlib import contextmanager
 from datetime import datetime
+from services.telemetry_service import get_telemetry
+
+try:
+    import fcntl
+except ImportError:  # Windows has no flock; temporary story locks then only cover one process
+    fcntl = None
 
 class StorageService:
     """Service for handling database operations and temporary story storage."""
@@ -18,6 +26,9 @@ class StorageService:
         """
         self.db_path = db_path
         self.temp_dir = temp_dir
+        # Disk and SQLite time per operation, for /metrics
+        self.telemetry = get_telemetry()
+        self._temp_lock = threading.Lock()
 
         # Ensure temporary directory exists
         os.makedirs(temp_dir, exist_ok=True)
@@ -43,6 +54,16 @@ class StorageService:
             )
             ''')
 
+            # Page animations each user has started per day
+            c.execute('''
+            CREATE TABLE IF NOT EXISTS animation_budget (
+                user_id TEXT,
+                day TEXT,
+                used INTEGER,
+                PRIMARY KEY (user_id, day)
+            )
+            ''')
+
             conn.commit()
             conn.close()
             logging.info("Database initialized successfully")
@@ -59,31 +80,34 @@ class StorageService:
         Returns:
             str: Temporary story ID
         """
-        try:
-            temp_id = str(uuid.uuid4())
-            story_dir = os.path.join(self.temp_dir, temp_id)
-            os.makedirs(story_dir, exist_ok=True)
-
-            with open(os.path.join(story_dir, 'story_data.json'), 'w') as f:
-                data_to_store = {
-                    'description': story_data.get('description', ''),
-                    'character_description': story_data.get('character_description', ''),
-                    'story_text': story_data.get('story_text', ''),
-                    'simplified_text': story_data.get('simplified_text', ''),
-                    'image_descriptions': story_data.get('image_descriptions', []),
-                    'temp_id': temp_id,
-                    'created_at': datetime.now().isoformat()
-                }
-                json.dump(data_to_store, f)
-
-            with open(os.path.join(story_dir, 'content.json'), 'w') as f:
-                json.dump(story_data.get('content', []), f)
-
-            logging.info(f"Stored temporary story with ID: {temp_id}")
-            return temp_id
-        except Exception as e:
-            logging.error(f"Error storing temporary story: {e}")
-            return None
+        with self.telemetry.span('storage.store_temp_story'):
+            try:
+                temp_id = str(uuid.uuid4())
+                story_dir = os.path.join(self.temp_dir, temp_id)
+                os.makedirs(story_dir, exist_ok=True)
+
+                with open(os.path.join(story_dir, 'story_data.json'), 'w') as f:
+                    data_to_store = {
+                        'description': story_data.get('description', ''),
+                        'character_description': story_data.get('character_description', ''),
+                        'story_text': story_data.get('story_text', ''),
+                        'simplified_text': story_data.get('simplified_text', ''),
+                        'image_descriptions': story_data.get('image_descriptions', []),
+                        'prompt_version': story_data.get('prompt_version'),
+                        'usage_id': story_data.get('usage_id'),
+                        'temp_id': temp_id,
+                        'created_at': datetime.now().isoformat()
+                    }
+                    json.dump(data_to_store, f)
+
+                with open(os.path.join(story_dir, 'content.json'), 'w') as f:
+                    json.dump(story_data.get('content', []), f)
+
+                logging.info(f"Stored temporary story with ID: {temp_id}")
+                return temp_id
+            except Exception as e:
+                logging.error(f"Error storing temporary story: {e}")
+                return None
 
     def get_temp_story(self, temp_id):
         """Get story data from a temporary file.
@@ -94,20 +118,71 @@ class StorageService:
         Returns:
             dict: Story data
         """
-        try:
-            story_dir = os.path.join(self.temp_dir, temp_id)
+        with self.telemetry.span('storage.get_temp_story'):
+            try:
+                story_dir = os.path.join(self.temp_dir, temp_id)
 
-            with open(os.path.join(story_dir, 'story_data.json'), 'r') as f:
-                story_data = json.load(f)
+                with open(os.path.join(story_dir, 'story_data.json'), 'r') as f:
+                    story_data = json.load(f)
 
-            with open(os.path.join(story_dir, 'content.json'), 'r') as f:
-                content = json.load(f)
+                with open(os.path.join(story_dir, 'content.json'), 'r') as f:
+                    content = json.load(f)
 
-            story_data['content'] = content
-            return story_data
-        except Exception as e:
-            logging.error(f"Error retrieving temporary story {temp_id}: {e}")
+                story_data['content'] = content
+                return story_data
+            except Exception as e:
+                logging.error(f"Error retrieving temporary story {temp_id}: {e}")
+                return None
+
+    def modify_temp_story(self, temp_id, modify):
+        """Change a temporary story with no other change landing in between.
+
+        Workers and threads that patch the same story (finished animations,
+        regenerated pages) take turns on a lock file in the story's directory,
+        each re-reading the story before changing it.
+
+        Args:
+            temp_id (str): Temporary story ID
+            modify (callable): Called with the story dict; changes it in place and
+                returns True if anything needs writing
+
+        Returns:
+            dict: The story as stored afterwards, or None if it no longer exists
+        """
+        story_dir = os.path.join(self.temp_dir, temp_id)
+        if not os.path.isdir(story_dir):
             return None
+        with self.telemetry.span('storage.update_temp_story'), self._temp_story_lock(story_dir):
+            story = self.get_temp_story(temp_id)
+            if story is None or not modify(story):
+                return story
+            story_data = {key: value for key, value in story.items() if key != 'content'}
+            self._replace_json(os.path.join(story_dir, 'story_data.json'), story_data)
+            self._replace_json(os.path.join(story_dir, 'content.json'), story['content'])
+        logging.info(f"Updated temporary story {temp_id}")
+        return story
+
+    @contextmanager
+    def _temp_story_lock(self, story_dir):
+        if fcntl is None:
+            # No flock (Windows): only this process's threads are kept apart
+            with self._temp_lock:
+                yield
+            return
+        with open(os.path.join(story_dir, '.lock'), 'a') as lock_file:
+            # flock locks belong to the open file, so threads of one worker wait on each other too
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _replace_json(self, path, data):
+        # Write then rename so a concurrent reader never sees a half-written file
+        partial_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(partial_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(partial_path, path)
 
     def cleanup_temp_stories(self, max_age_hours=24):
         """Remove temporary stories older than the specified age.
@@ -159,32 +234,33 @@ class StorageService:
         Returns:
             str: Story ID
         """
-        try:
-            conn = sqlite3.connect(self.db_path)
-            c = conn.cursor()
+        with self.telemetry.span('storage.save_story'):
+            try:
+                conn = sqlite3.connect(self.db_path)
+                c = conn.cursor()
 
-            story_id = str(uuid.uuid4())
-            created_at = datetime.now().isoformat()
+                story_id = str(uuid.uuid4())
+                created_at = datetime.now().isoformat()
 
-            # Convert content to JSON string for storage
-            content_json = json.dumps(content)
+                # Convert content to JSON string for storage
+                content_json = json.dumps(content)
 
-            # Convert image_descriptions to JSON string for storage
-            image_descriptions_json = json.dumps(image_descriptions)
+                # Convert image_descriptions to JSON string for storage
+                image_descriptions_json = json.dumps(image_descriptions)
 
-            c.execute('''
-            INSERT INTO stories (id, title, description, character_description, created_at, story_text, simplified_text, image_descriptions, content)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (story_id, title, description, character_description, created_at, story_text, simplified_text, image_descriptions_json, content_json))
+                c.execute('''
+                INSERT INTO stories (id, title, description, character_description, created_at, story_text, simplified_text, image_descriptions, content)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (story_id, title, description, character_description, created_at, story_text, simplified_text, image_descriptions_json, content_json))
 
-            conn.commit()
-            conn.close()
+                conn.commit()
+                conn.close()
 
-            logging.info(f"Saved story '{title}' with ID: {story_id}")
-            return story_id
-        except Exception as e:
-            logging.error(f"Error saving story to database: {e}")
-            raise
+                logging.info(f"Saved story '{title}' with ID: {story_id}")
+                return story_id
+            except Exception as e:
+                logging.error(f"Error saving story to database: {e}")
+                raise
 
     def get_all_stories(self):
         """Get all stories from the database.
@@ -219,27 +295,130 @@ class StorageService:
         Returns:
             dict: Story data
         """
-        try:
-            conn = sqlite3.connect(self.db_path)
+        with self.telemetry.span('storage.get_story'):
+            try:
+                conn = sqlite3.connect(self.db_path)
+                conn.row_factory = sqlite3.Row
+                c = conn.cursor()
+
+                c.execute('SELECT * FROM stories WHERE id = ?', (story_id,))
+                row = c.fetchone()
+
+                if not row:
+                    raise ValueError(f"Story with ID {story_id} not found")
+
+                story = dict(row)
+
+                # Parse JSON strings back to Python objects
+                story['content'] = json.loads(story['content'])
+                story['image_descriptions'] = json.loads(story['image_descriptions'])
+
+                conn.close()
+                return story
+            except Exception as e:
+                logging.error(f"Error getting story {story_id}: {e}")
+                raise
+
+    def modify_story(self, story_id, modify):
+        """Change a saved story with no other change landing in between.
+
+        The row is read and written back inside one write transaction, so a
+        concurrent change from any worker waits for this one and then sees it.
+
+        Args:
+            story_id (str): Story ID
+            modify (callable): Called with the story dict (as returned by get_story);
+                changes it in place and returns True if anything needs writing
+
+        Returns:
+            dict: The story as stored afterwards
+
+        Raises:
+            ValueError: If the story does not exist
+        """
+        with self.telemetry.span('storage.update_story'):
+            conn = sqlite3.connect(self.db_path, isolation_level=None)
             conn.row_factory = sqlite3.Row
-            c = conn.cursor()
+            try:
+                c = conn.cursor()
+                # Take the write lock before reading so no other update slips in between
+                c.execute('BEGIN IMMEDIATE')
+                row = c.execute('SELECT * FROM stories WHERE id = ?', (story_id,)).fetchone()
+                if not row:
+                    raise ValueError(f"Story with ID {story_id} not found")
+                story = dict(row)
+                story['content'] = json.loads(story['content'])
+                story['image_descriptions'] = json.loads(story['image_descriptions'])
+
+                if modify(story):
+                    c.execute(
+                        'UPDATE stories SET story_text = ?, simplified_text = ?, image_descriptions = ?, content = ? WHERE id = ?',
+                        (story['story_text'], story['simplified_text'], json.dumps(story['image_descriptions']),
+                         json.dumps(story['content']), story_id)
+                    )
+                    logging.info(f"Updated story {story_id}")
+                c.execute('COMMIT')
+                return story
+            except Exception as e:
+                if conn.in_transaction:
+                    c.execute('ROLLBACK')
+                logging.error(f"Error updating story {story_id}: {e}")
+                raise
+            finally:
+                conn.close()
+
+    def reserve_animation_budget(self, user_id, requested, daily_limit):
+        """Take up to `requested` page animations from a user's daily budget.
 
-            c.execute('SELECT * FROM stories WHERE id = ?', (story_id,))
-            row = c.fetchone()
+        Args:
+            user_id (str): User (browser session) ID
+            requested (int): Page animations wanted
+            daily_limit (int): Page animations allowed per user per day
 
-            if not row:
-                raise ValueError(f"Story with ID {story_id} not found")
+        Returns:
+            int: How many were granted
+        """
+        if requested <= 0:
+            return 0
+        try:
+            day = datetime.now().date().isoformat()
+            conn = sqlite3.connect(self.db_path, isolation_level=None)
+            c = conn.cursor()
+            # Take the write lock first so concurrent workers can't both spend the same budget
+            c.execute('BEGIN IMMEDIATE')
+            c.execute('SELECT used FROM animation_budget WHERE user_id = ? AND day = ?', (user_id, day))
+            row = c.fetchone()
+            used = row[0] if row else 0
+            granted = max(0, min(requested, daily_limit - used))
+            c.execute('''
+            INSERT INTO animation_budget (user_id, day, used) VALUES (?, ?, ?)
+            ON CONFLICT(user_id, day) DO UPDATE SET used = excluded.used
+            ''', (user_id, day, used + granted))
+            c.execute('COMMIT')
+            conn.close()
+            return granted
+        except Exception as e:
+            logging.error(f"Error reserving animation budget for {user_id}: {e}")
+            return 0
 
-            story = dict(row)
+    def find_stories_by_animation_job(self, job_id):
+        """Find saved stories whose summary page is waiting on an animation job.
 
-            # Parse JSON strings back to Python objects
-            story['content'] = json.loads(story['content'])
-            story['image_descriptions'] = json.loads(story['image_descriptions'])
+        Args:
+            job_id (str): Animation job (Stability generation) ID
 
+        Returns:
+            list: Story IDs
+        """
+        try:
+            conn = sqlite3.connect(self.db_path)
+            c = conn.cursor()
+            c.execute('SELECT id FROM stories WHERE content LIKE ?', (f'%"animation_job": "{job_id}"%',))
+            story_ids = [row[0] for row in c.fetchall()]
             conn.close()
-            return story
+            return story_ids
         except Exception as e:
-            logging.error(f"Error getting story {story_id}: {e}")
+            logging.error(f"Error finding stories for animation job {job_id}: {e}")
             raise
 
     def delete_story(self, story_id):
@@ -257,4 +436,39 @@ class StorageService:
             logging.info(f"Deleted story with ID: {story_id}")
         except Exception as e:
             logging.error(f"Error deleting story {story_id}: {e}")
-            raise
\ No newline at end of file
+            raise
+
+    def import_story(self, story, replace=False):
+        """Insert a story from an archive, keeping its ID.
+
+        Args:
+            story (dict): All stories columns, with content and image_descriptions as Python objects
+            replace (bool): Overwrite a story that already has this ID instead of skipping it
+
+        Returns:
+            str: 'imported', 'replaced' or 'skipped'
+        """
+        with self.telemetry.span('storage.import_story'):
+            conn = sqlite3.connect(self.db_path)
+            try:
+                c = conn.cursor()
+                exists = c.execute('SELECT 1 FROM stories WHERE id = ?', (story['id'],)).fetchone() is not None
+                if exists and not replace:
+                    return 'skipped'
+
+                c.execute('''
+                INSERT OR REPLACE INTO stories (id, title, description, character_description, created_at, story_text, simplified_text, image_descriptions, content)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    story['id'], story.get('title'), story.get('description'), story.get('character_description'),
+                    story.get('created_at'), story.get('story_text'), story.get('simplified_text'),
+                    json.dumps(story.get('image_descriptions', [])), json.dumps(story.get('content', []))
+                ))
+                conn.commit()
+                logging.info(f"{'Replaced' if exists else 'Imported'} story '{story.get('title')}' with ID: {story['id']}")
+                return 'replaced' if exists else 'imported'
+            except Exception as e:
+                logging.error(f"Error importing story {story.get('id')}: {e}")
+                raise
+            finally:
+                conn.close()
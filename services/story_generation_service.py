@@ -0,0 +1,167 @@
+import logging
+
+from services.story_parser import parse_simplified_pages
+from services.metering_service import get_meter
+
+# Use photo-based character description since we have the reference photo
+CHARACTER_DESCRIPTION = "4 years old, curly brown hair, light skin, blue-green eyes"
+
+
+class StoryGenerationError(Exception):
+    """A story could not be made; the message is shown on the form."""
+
+
+class StoryGenerationService:
+    """Turns a /generate request and a written, illustrated story into the story's pages.
+
+    The Flask route and the asyncio handler only differ in how the story is
+    written and illustrated (StoryPipelineService on threads or
+    AsyncStoryPipelineService on the event loop). Reading the form, building
+    the pages, queueing page animations and adding the summary page happen
+    here for both. Everything here may block, so the asyncio handler runs it
+    in a thread.
+    """
+
+    def __init__(self, reader_service, animation_job_service, summary_animation_available):
+        """Initialize StoryGenerationService.
+
+        Args:
+            reader_service (ReaderService): Reading analysis of each page's text
+            animation_job_service (AnimationJobService): Queues page and summary animations
+            summary_animation_available (callable): Whether a summary animation can be made at all
+        """
+        self.reader_service = reader_service
+        self.animation_job_service = animation_job_service
+        self.summary_animation_available = summary_animation_available
+        self.meter = get_meter()
+
+    def request_options(self, form):
+        """What the story form asked for.
+
+        Raises:
+            StoryGenerationError: If there is no description
+        """
+        options = {
+            'description': form.get('description'),
+            'template_type': form.get('template_type', 'adventure'),
+            'enable_animation': form.get('enable_animation') == 'true',
+            'animate_pages': form.get('animate_pages') == 'true',
+            'animation_reading_mode': form.get('animation_reading_mode', 'normal'),
+            'character_description': CHARACTER_DESCRIPTION
+        }
+        if not options['description']:
+            raise StoryGenerationError("Please describe Esme's adventure!")
+
+        logging.info(f"Generating {options['template_type']} story with photo reference...")
+        if options['enable_animation']:
+            logging.info(f"Story summary animation enabled for {options['animation_reading_mode']} reading mode")
+        return options
+
+    def build_story(self, options, story, user_id):
+        """Pages of a story fresh from the pipeline, with its animations queued.
+
+        Args:
+            options (dict): From request_options
+            story (dict): From StoryPipelineService.generate
+            user_id (str): Visitor whose page animation budget is used
+
+        Returns:
+            dict: The arguments of app.render_generated_story
+
+        Raises:
+            StoryGenerationError: If the pipeline produced no usable story
+        """
+        story_text = story['story_text']
+        if not story_text:
+            raise StoryGenerationError("Story generation failed. Please try again.")
+
+        pages = story['pages']
+        if len(pages) == 0:
+            raise StoryGenerationError("Story processing failed - no valid content found. Please try again.")
+
+        simplified_story_text = story['simplified_story_text']
+        simplified_pages = parse_simplified_pages(simplified_story_text)
+
+        content = []
+        for index, text in enumerate(pages):
+            simplified_text = simplified_pages[index] if index < len(simplified_pages) else ""
+            content.append(self.build_story_page(index, text, story['image_urls'][index], simplified_text))
+
+        content = self._add_animations(content, options, user_id)
+
+        return {
+            'description': options['description'],
+            'character_description': options['character_description'],
+            'template_type': options['template_type'],
+            'story_text': story_text,
+            'simplified_story_text': simplified_story_text,
+            'image_descriptions': story['image_descriptions'],
+            'content': content,
+            'enable_animation': options['enable_animation']
+        }
+
+    def _add_animations(self, content, options, user_id):
+        """Queue page animations and append the summary page, as the form asked."""
+        enable_animation = options['enable_animation']
+        reading_mode = options['animation_reading_mode']
+        available = self.summary_animation_available()
+
+        # Video is the most expensive call; leave it out once the day's API budget is spent
+        over_budget = enable_animation and self.meter.over_budget()
+
+        # Animate the liveliest pages in the background, within the visitor's daily budget
+        if enable_animation and options['animate_pages'] and available and not over_budget:
+            content = self.animation_job_service.enqueue_page_animations(content, user_id, reading_mode)
+
+        if over_budget:
+            logging.warning("Daily API budget reached, skipping story animations")
+            content.append(self.build_end_page(content, 'Daily API budget reached'))
+
+        elif enable_animation and available:
+            logging.info(f"Adding story summary animation at the end...")
+
+            try:
+                # The video renders in the background; the page is filled in when it's ready
+                content.append(self.animation_job_service.start_summary_page(
+                    content,
+                    options['character_description'],
+                    reading_mode
+                ))
+            except Exception as e:
+                logging.error(f"Story summary animation generation failed: {e}")
+                # Add a summary page without animation
+                content.append(self.build_end_page(content, f"Animation generation failed: {str(e)}"))
+
+        elif enable_animation:
+            logging.warning("Story summary animation requested but no Stability AI API key or local renderer available")
+            # Add summary page without animation
+            content.append(self.build_end_page(content, 'No Stability AI API key configured'))
+
+        return content
+
+    def build_story_page(self, index, text, image_url, simplified_text):
+        """Build one page of story content with reading analysis for both versions."""
+        return {
+            'page': index + 1,
+            'text': text,
+            'image': image_url,
+            'stanzas': self.reader_service.process_story_text(text),
+            'simplified_text': simplified_text,
+            'simplified_stanzas': self.reader_service.process_story_text(simplified_text),
+            'has_animation': False  # Only the summary page will have animation
+        }
+
+    def build_end_page(self, content, animation_error):
+        """Build a 'The End' summary page for stories whose animation could not be made."""
+        end_stanza = [{'index': 0, 'lines': ['The End'], 'reading_analysis': {'word_count': 2, 'sight_words': 1, 'phonics_words': 0, 'complex_words': 0, 'sight_word_ratio': 50.0, 'difficulty': 'easy', 'recommended_reading_mode': 'normal'}}]
+        return {
+            'page': len(content) + 1,
+            'text': 'The End',
+            'image': content[0]['image'] if content else '/static/images/default.jpg',
+            'stanzas': end_stanza,
+            'simplified_text': 'The End',
+            'simplified_stanzas': end_stanza,
+            'is_summary_page': True,
+            'has_animation': False,
+            'animation_error': animation_error
+        }
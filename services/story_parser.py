@@ -0,0 +1,294 @@
+import re
+import json
+import logging
+
+# Only skip VERY OBVIOUS metadata - be conservative. Matched at the start of a section.
+METADATA_PREFIXES = [
+    '[The revised version includes:',  # Exact metadata headers
+    '[The improved version has:',
+    '1. More playful, bouncy rhymes',  # Exact numbered improvements
+    '2. Concrete details kids can relate to',
+    '3. Active verbs (',
+    '4. Simple but engaging language',
+    '5. More sensory details',
+    '6. Fun activities that 4-year-olds enjoy'
+]
+METADATA_PATTERN = re.compile('|'.join(re.escape(prefix) for prefix in METADATA_PREFIXES))
+
+SECTION_BREAK = '\n\n'
+BLANK_LINES = re.compile(r'\n\s*\n')
+
+
+class StoryParser:
+    """Turns Claude's story output into pages in a single pass.
+
+    Text can be fed all at once or chunk by chunk as it streams in; each
+    page is returned as soon as the blank line that ends it arrives, so
+    page 1 can be illustrated while the model is still writing page 6.
+
+    Pages are dicts with the page number, the stanza text and its lines.
+    If fewer than min_pages survive filtering, finish falls back to
+    minimal filtering (any substantial section, metadata included), as
+    the old split helpers did; streamed pages may then be superseded.
+    """
+
+    def __init__(self, min_length=10, min_pages=0, fallback_min_length=20):
+        """Initialize StoryParser.
+
+        Args:
+            min_length (int): Sections must be longer than this to become pages
+            min_pages (int): Fall back to minimal filtering below this many pages (0 disables)
+            fallback_min_length (int): Sections must be longer than this under minimal filtering
+        """
+        self.min_length = min_length
+        self.min_pages = min_pages
+        self.fallback_min_length = fallback_min_length
+
+        self.pages = []
+        self.used_fallback = False
+        self._chunks = []
+        self._buffer = ''
+        self._scan_from = 0
+        self._fallback_pages = []
+        self._sections = 0
+        self._skipped = 0
+
+    def feed(self, chunk):
+        """Add streamed text.
+
+        Args:
+            chunk (str): Next piece of the model output
+
+        Returns:
+            list: Pages completed by this chunk
+        """
+        self._chunks.append(chunk)
+        self._buffer += chunk
+        completed = []
+        while True:
+            end = self._buffer.find(SECTION_BREAK, self._scan_from)
+            if end == -1:
+                # A break may straddle the next chunk boundary
+                self._scan_from = max(0, len(self._buffer) - 1)
+                return completed
+            page = self._add_section(self._buffer[:end])
+            if page:
+                completed.append(page)
+            self._buffer = self._buffer[end + len(SECTION_BREAK):]
+            self._scan_from = 0
+
+    def finish(self):
+        """Flush the last section once the output is complete.
+
+        Returns:
+            list: Pages completed by the flush (see used_fallback for the final list)
+        """
+        page = self._add_section(self._buffer)
+        self._buffer = ''
+        completed = [page] if page else []
+
+        logging.info(f"Parsed {len(self.pages)} story pages from {self._sections} sections "
+                     f"({self._skipped} metadata sections skipped)")
+
+        if self.min_pages and len(self.pages) < self.min_pages:
+            logging.warning("Too few pages detected, using minimal filtering...")
+            self.pages = self._number(self._fallback_pages)
+            self.used_fallback = True
+            logging.info(f"Minimal filtering result: {len(self.pages)} pages")
+            return list(self.pages)
+        return completed
+
+    @property
+    def text(self):
+        """Everything fed so far, unfiltered."""
+        return ''.join(self._chunks)
+
+    def _add_section(self, section):
+        self._sections += 1
+        text = section.strip()
+        if not text:
+            return None
+
+        if len(text) > self.fallback_min_length:
+            self._fallback_pages.append(text)
+
+        if METADATA_PATTERN.match(text):
+            self._skipped += 1
+            logging.info(f"Skipped obvious metadata: {text[:50]}...")
+            return None
+
+        if len(text) <= self.min_length:
+            return None
+
+        page = self._page(len(self.pages) + 1, text)
+        self.pages.append(page)
+        return page
+
+    def _page(self, number, text):
+        return {
+            'page': number,
+            'text': text,
+            'lines': [line.strip() for line in text.split('\n') if line.strip()]
+        }
+
+    def _number(self, texts):
+        return [self._page(index + 1, text) for index, text in enumerate(texts)]
+
+
+def parse_story(story_text, **options):
+    """Parse a complete story into page dicts (see StoryParser for options)."""
+    parser = StoryParser(**options)
+    parser.feed(story_text or '')
+    parser.finish()
+    return parser.pages
+
+
+def parse_story_pages(story_text):
+    """Page texts of a story, falling back to minimal filtering for short results."""
+    return [page['text'] for page in parse_story(story_text, min_pages=3)]
+
+
+def parse_simplified_pages(simplified_story_text):
+    """Page texts of the simplified story (no minimal-filtering fallback)."""
+    return [page['text'] for page in parse_story(simplified_story_text)]
+
+
+def clean_story_text(story_text):
+    """Drop metadata and empty sections, keeping every other section of the story text."""
+    if not story_text:
+        return story_text
+    return SECTION_BREAK.join(page['text'] for page in parse_story(story_text, min_length=0))
+
+
+class StructuredStoryParser:
+    """Pulls stanzas out of a streamed JSON story document as each one closes.
+
+    Expects {"stanzas": [{"text": ..., "simplified": ..., "image_description": ...}, ...]},
+    tolerating prose or code fences around it. Each stanza object is decoded
+    the moment its closing brace arrives, so it can be illustrated while the
+    rest of the document is still being written.
+    """
+
+    def __init__(self, min_pages=3, min_length=10):
+        """Initialize StructuredStoryParser.
+
+        Args:
+            min_pages (int): Fewer complete stanzas than this makes the document invalid
+            min_length (int): Stanza text must be longer than this to become a page
+        """
+        self.min_pages = min_pages
+        self.min_length = min_length
+
+        self.pages = []
+        self.complete = False
+        self._chunks = []
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+        self._stanza = None
+
+    @property
+    def text(self):
+        """Everything fed so far, unparsed."""
+        return ''.join(self._chunks)
+
+    @property
+    def valid(self):
+        """Whether the whole document arrived with enough usable stanzas."""
+        return self.complete and len(self.pages) >= self.min_pages
+
+    @property
+    def story_text(self):
+        return SECTION_BREAK.join(page['text'] for page in self.pages)
+
+    @property
+    def simplified_text(self):
+        """One section per page, so parse_simplified_pages lines up with the pages."""
+        return SECTION_BREAK.join(self._simplified_section(page) for page in self.pages)
+
+    def _simplified_section(self, page):
+        # A stanza without a usable simplified version is read as written rather than dropped
+        simplified = page['simplified_text']
+        if len(simplified) <= self.min_length or METADATA_PATTERN.match(simplified):
+            simplified = page['text']
+        # A blank line inside the stanza would split it into two pages
+        return BLANK_LINES.sub('\n', simplified)
+
+    def feed(self, chunk):
+        """Add streamed text.
+
+        Args:
+            chunk (str): Next piece of the model output
+
+        Returns:
+            list: Pages whose stanza object closed in this chunk
+        """
+        self._chunks.append(chunk)
+        if self._stanza is not None:
+            self._stanza.append(chunk)
+
+        completed = []
+        for index, char in enumerate(chunk):
+            if self.complete:
+                break
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"' and self._stack:
+                self._in_string = True
+            elif char in '{[':
+                # Stanza objects sit at root -> "stanzas" array -> object
+                if char == '{' and self._stack == ['{', '[']:
+                    self._stanza = [chunk[index:]]
+                self._stack.append(char)
+            elif char in '}]' and self._stack:
+                self._stack.pop()
+                if char == '}' and self._stack == ['{', '['] and self._stanza is not None:
+                    page = self._close_stanza(len(chunk) - index - 1)
+                    if page:
+                        completed.append(page)
+                elif not self._stack:
+                    self.complete = True
+        return completed
+
+    def finish(self):
+        """Log the outcome once the output is complete.
+
+        Returns:
+            list: Always empty; stanzas are only emitted when they close
+        """
+        logging.info(f"Parsed {len(self.pages)} structured story pages "
+                     f"({'complete' if self.complete else 'incomplete'} document)")
+        return []
+
+    def _close_stanza(self, trailing):
+        source = ''.join(self._stanza)
+        self._stanza = None
+        if trailing:
+            source = source[:-trailing]
+
+        try:
+            stanza = json.loads(source)
+        except ValueError as e:
+            logging.warning(f"Skipping unreadable stanza in structured story: {e}")
+            return None
+
+        text = str(stanza.get('text') or '').strip()
+        if len(text) <= self.min_length or METADATA_PATTERN.match(text):
+            return None
+
+        page = {
+            'page': len(self.pages) + 1,
+            'text': text,
+            'lines': [line.strip() for line in text.split('\n') if line.strip()],
+            'simplified_text': str(stanza.get('simplified') or '').strip(),
+            'image_description': str(stanza.get('image_description') or '').strip() or None
+        }
+        self.pages.append(page)
+        return page
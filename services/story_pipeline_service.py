@@ -0,0 +1,157 @@
+import logging
+import time
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from services.resilience_service import UpstreamUnavailable
+from services.story_parser import StoryParser, StructuredStoryParser, clean_story_text
+
+class StoryPipelineService:
+    """Illustrates story pages while the rest of the story is still streaming in.
+
+    In structured mode a single Claude call streams the story, its simplified
+    version and an image description for each stanza as one JSON document.
+    If that document comes back incomplete, the step-by-step path runs
+    instead: draft, streamed critique, then a description call per page and
+    one simplified story call.
+
+    Each page is handed to a small thread pool as soon as it arrives, so
+    Claude and Stability work in parallel instead of one after the other.
+    With a background pool, a page set in one of the template's recurring
+    scenes may get a ready-made picture instead.
+    """
+
+    def __init__(self, story_service, image_service, max_workers=3, context_length=300, structured=True,
+                 background_pool=None):
+        """Initialize StoryPipelineService.
+
+        Args:
+            story_service (StoryService): Streams the story and writes image descriptions
+            image_service (ImageService): Generates page images
+            max_workers (int): Pages illustrated at once per story
+            context_length (int): Characters of earlier pages passed to each image as context
+            structured (bool): Try the single-call JSON generation first
+            background_pool (BackgroundPoolService, optional): Ready-made pictures of recurring scenes
+        """
+        self.story_service = story_service
+        self.image_service = image_service
+        self.max_workers = max_workers
+        self.context_length = context_length
+        self.structured = structured
+        self.background_pool = background_pool
+
+    def generate(self, description, character_description, template_type="adventure"):
+        """Write and illustrate a story.
+
+        Args:
+            description (str): What the story is about
+            character_description (str): How Esme looks
+            template_type (str): Story template
+
+        Returns:
+            dict: story_text, simplified_story_text, pages, image_descriptions and
+                image_urls (one per page); story_text is None if nothing was written
+        """
+        started = time.monotonic()
+        illustrations = {}
+        story = None
+
+        self.image_service.generate_character_profile(character_description)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='illustrate') as pool:
+            def illustrate(pages):
+                # Each task runs in a copy of this context so its calls are metered to the story
+                self._illustrate_pages(pages, illustrations, character_description, started,
+                                       lambda *args: pool.submit(contextvars.copy_context().run, self._illustrate, *args,
+                                                                 template_type))
+
+            if self.structured:
+                parser = StructuredStoryParser()
+                try:
+                    illustrate(self.story_service.stream_structured_story(
+                        description, character_description, template_type, parser=parser
+                    ))
+                except UpstreamUnavailable:
+                    raise
+                except Exception as e:
+                    logging.warning(f"Structured story generation failed: {e}")
+
+                if parser.valid:
+                    story = self._story(parser.story_text, parser.simplified_text, parser.pages)
+                else:
+                    logging.warning("Structured story was incomplete, falling back to step-by-step generation")
+                    self._discard(illustrations)
+
+            if story is None:
+                parser = StoryParser(min_pages=3)
+                illustrate(self.story_service.stream_story_with_template(
+                    description, character_description, template_type, parser=parser
+                ))
+                if not parser.pages:
+                    return self._story(None, None, [])
+
+                # Minimal filtering can change the page list after streaming; illustrate anything new
+                illustrate(parser.pages)
+
+                story_text = clean_story_text(parser.text)
+                story = self._story(story_text, self.story_service.generate_simplified_story(story_text), parser.pages)
+
+            illustrated = [illustrations[text].result() for text in story['pages']]
+
+        logging.info(f"✓ Story written and illustrated in {time.monotonic() - started:.1f}s ({len(story['pages'])} pages)")
+        story['image_descriptions'] = [image_description for image_description, _ in illustrated]
+        story['image_urls'] = [image_url for _, image_url in illustrated]
+        return story
+
+    def _illustrate_pages(self, pages, illustrations, character_description, started, schedule):
+        """Schedule illustration of every page not already scheduled, in page order."""
+        story_context = ""
+        for page in pages:
+            if page['text'] not in illustrations:
+                logging.info(f"Page {page['page']} ready after {time.monotonic() - started:.1f}s, illustrating")
+                illustrations[page['text']] = schedule(page, character_description, story_context)
+            story_context = self._extend_context(story_context, page['text'])
+
+    def _illustrate(self, page, character_description, story_context, template_type="adventure"):
+        """Describe one page (unless the structured story already did) and generate its image.
+
+        Returns:
+            tuple: (image description, image URL)
+        """
+        image_description = page.get('image_description')
+        if not image_description:
+            descriptions = self.story_service.generate_image_descriptions([page['text']], character_description)
+            image_description = descriptions[0] if descriptions else page['text']
+        image_url = self._pooled_image(template_type, image_description)
+        if image_url is None:
+            try:
+                image_url = self.image_service.generate_story_image(image_description, page['page'], story_context)
+            except UpstreamUnavailable:
+                image_url = self._pooled_image(template_type, image_description, unavailable=True)
+                if image_url is None:
+                    raise
+        return image_description, image_url
+
+    def _pooled_image(self, template_type, image_description, unavailable=False):
+        """A ready-made picture for the page from the background pool, or None to draw one."""
+        if self.background_pool is None:
+            return None
+        return self.background_pool.pick(template_type, image_description, unavailable)
+
+    def _discard(self, illustrations):
+        """Drop illustrations of an abandoned story, cancelling those not started yet."""
+        for pending in illustrations.values():
+            pending.cancel()
+        illustrations.clear()
+
+    def _extend_context(self, story_context, text):
+        story_context += f" {text}"
+        return story_context[-self.context_length:]
+
+    def _story(self, story_text, simplified_story_text, pages):
+        return {
+            'story_text': story_text,
+            'simplified_story_text': simplified_story_text,
+            'pages': [page['text'] for page in pages],
+            'image_descriptions': [],
+            'image_urls': []
+        }
@@ -1,9 +1,18 @@
+import os
 import requests
 import re
 import time
 import logging
 import json
 from pathlib import Path
+from services.resilience_service import get_upstream, UpstreamUnavailable
+from services.story_parser import StoryParser, StructuredStoryParser, clean_story_text
+from services.prompt_registry import get_prompt_registry
+from services.metering_service import get_meter
+from services.telemetry_service import get_telemetry
+
+# Overridable so benchmarks can point the service at a local stand-in
+CLAUDE_API_URL = os.getenv('CLAUDE_API_URL', 'https://api.anthropic.com/v1/messages')
 
 class StoryService:
     """Enhanced service for generating high-quality stories using Claude API with self-critique."""
@@ -12,6 +21,15 @@ class StoryService:
         """Initialize StoryService with API key and model name."""
         self.api_key = api_key
         self.model = "claude-3-5-sonnet-20241022"
+        self.api_url = CLAUDE_API_URL
+        # Circuit breaker and concurrency limit shared by every Claude caller
+        self.upstream = get_upstream('claude')
+        # Prompt templates from prompts/, compiled once and reloaded when edited
+        self.prompts = get_prompt_registry()
+        # Token usage per call, for cost accounting and the daily budget
+        self.meter = get_meter()
+        # Per-stage latency histograms for /metrics
+        self.telemetry = get_telemetry()
 
         # Simple story templates for different types
         self.story_templates = {
@@ -24,98 +42,119 @@ class StoryService:
     def generate_story_with_template(self, description, character_description, template_type="adventure"):
         """Generate story using template guidance"""
 
-        template_guidance = self.story_templates.get(template_type, self.story_templates['adventure'])
-
-        prompt = f"""Create a delightful 5-6 stanza rhyming story for 4-year-old Esme.
-
-Story type: {template_type}
-Template: {template_guidance}
-Description: {description}
-Character: {character_description}
-
-Requirements:
-- 5-6 stanzas of 4 lines each
-- Mix of AABB and ABCB rhyme patterns  
-- Each stanza = one clear scene for illustration
-- Age-appropriate vocabulary with 2-3 new learning words
-- Happy, engaging story that follows the {template_type} template
-
-Create the story now. Do not include any revision notes or metadata - just the story."""
+        prompt = self._build_story_prompt(description, character_description, template_type)
 
         # Generate initial story
-        initial_story = self._call_claude_api(prompt)
+        with self.telemetry.span('story.draft', 'claude'):
+            initial_story = self._call_claude_api(prompt)
 
         # Clean initial story first
         if initial_story:
-            initial_story = self._clean_story_output(initial_story)
+            initial_story = clean_story_text(initial_story)
 
         # Simple self-critique (just one improvement pass)
-        if initial_story:
-            critique_prompt = f"""Improve this children's story for better flow and engagement:
-
-{initial_story}
-
-Make it more engaging for a 4-year-old while keeping the same structure. Focus on:
-1. Better rhymes
-2. More vivid, fun descriptions  
-3. Clear action in each stanza
-4. Age-appropriate language
-
-Provide ONLY the improved story - no revision notes or explanations."""
-
-            improved_story = self._call_claude_api(critique_prompt)
+        if initial_story and self._critique_allowed():
+            with self.telemetry.span('story.critique', 'claude'):
+                improved_story = self._call_claude_api(self._build_critique_prompt(initial_story))
 
             # Clean the improved story
             if improved_story:
-                improved_story = self._clean_story_output(improved_story)
+                improved_story = clean_story_text(improved_story)
                 return improved_story
 
         return initial_story
 
-    def _clean_story_output(self, story_text):
-        """Remove metadata but keep all story content - less aggressive filtering"""
-        if not story_text:
-            return story_text
-
-        # Split into sections by double newlines
-        sections = story_text.split('\n\n')
-        cleaned_sections = []
-
-        for section in sections:
-            section = section.strip()
-
-            # Skip empty sections
-            if not section:
-                continue
-
-            # Only skip OBVIOUS metadata sections - be much more conservative
-            obvious_metadata = [
-                '[The revised version includes:',  # Exact match only
-                '[The improved version has:',
-                '1. More playful, bouncy rhymes',  # Exact numbered list items
-                '2. Concrete details kids can relate to',
-                '3. Active verbs (zoomed, bouncing, rolled, tumbled)',
-                '4. Simple but engaging language',
-                '5. More sensory details and movement',
-                '6. Fun activities that 4-year-olds enjoy]'
-            ]
-
-            # Check for exact matches of obvious metadata
-            is_obvious_metadata = False
-            for metadata_pattern in obvious_metadata:
-                if section.startswith(metadata_pattern):
-                    is_obvious_metadata = True
-                    break
-
-            # Skip only if it's obvious metadata
-            if is_obvious_metadata:
-                continue
-
-            # Keep everything else - including story titles and content
-            # Even if it mentions "Little Esme" or starts with titles
-            cleaned_sections.append(section)
-
-        return '\n\n'.join(cleaned_sections)
+    def stream_story_with_template(self, description, character_description, template_type="adventure", parser=None):
+        """Generate a story, yielding each page as soon as its stanza has streamed in.
+
+        The draft is fetched whole because the critique needs all of it; the
+        improved version is streamed, so page 1 can be illustrated while the
+        later stanzas are still being written.
+
+        Args:
+            description (str): What the story is about
+            character_description (str): How Esme looks
+            template_type (str): Story template
+            parser (StoryParser, optional): Collects the pages and raw text; read it after iterating
+
+        Yields:
+            dict: Story pages from the parser
+        """
+        parser = parser if parser is not None else StoryParser(min_pages=3)
+
+        with self.telemetry.span('story.draft', 'claude'):
+            initial_story = self._call_claude_api(
+                self._build_story_prompt(description, character_description, template_type)
+            )
+        if not initial_story:
+            return
+        initial_story = clean_story_text(initial_story)
+
+        if self._critique_allowed():
+            with self.telemetry.span('story.critique', 'claude'):
+                for chunk in self._stream_claude_api(self._build_critique_prompt(initial_story)):
+                    yield from parser.feed(chunk)
+
+        # No improved version came back (or the critique was skipped); keep the draft
+        if not parser.text.strip():
+            yield from parser.feed(initial_story)
+        yield from parser.finish()
+
+    def stream_structured_story(self, description, character_description, template_type="adventure", parser=None):
+        """Write the story, its simplified version and image descriptions in one streamed call.
+
+        Replaces the draft, critique, simplified and image description calls.
+        Check parser.valid afterwards; an incomplete document means the caller
+        should fall back to stream_story_with_template.
+
+        Args:
+            description (str): What the story is about
+            character_description (str): How Esme looks
+            template_type (str): Story template
+            parser (StructuredStoryParser, optional): Collects the pages; read it after iterating
+
+        Yields:
+            dict: Story pages with simplified_text and image_description
+        """
+        parser = parser if parser is not None else StructuredStoryParser()
+        prompt = self._build_structured_story_prompt(description, character_description, template_type)
+
+        # The JSON escapes must reach the parser untouched
+        with self.telemetry.span('story.structured', 'claude'):
+            for chunk in self._stream_claude_api(prompt, unescape=False, max_tokens=4000):
+                yield from parser.feed(chunk)
+        yield from parser.finish()
+
+    def _critique_allowed(self):
+        """The self-critique pass is optional; skip it once the daily budget is spent."""
+        if self.meter.over_budget():
+            logging.warning("Daily API budget reached, skipping the self-critique pass")
+            return False
+        return True
+
+    def _build_structured_story_prompt(self, description, character_description, template_type):
+        """Build the single-call prompt returning story, simplified story and image descriptions as JSON."""
+        return self.prompts.render(
+            'structured_story_prompt',
+            description=description,
+            character_description=character_description,
+            template_type=template_type,
+            template_guidance=self.story_templates.get(template_type, self.story_templates['adventure'])
+        )
+
+    def _build_story_prompt(self, description, character_description, template_type):
+        """Build the first-draft story prompt for a template."""
+        return self.prompts.render(
+            'story_prompt',
+            description=description,
+            character_description=character_description,
+            template_type=template_type,
+            template_guidance=self.story_templates.get(template_type, self.story_templates['adventure'])
+        )
+
+    def _build_critique_prompt(self, initial_story):
+        """Build the self-critique prompt that improves a draft story."""
+        return self.prompts.render('story_critique_prompt', story=initial_story)
 
     def generate_story(self, description, character_description=None):
         """Main entry point - use template method"""
@@ -126,99 +165,127 @@ Provide ONLY the improved story - no revision notes or explanations."""
         """Much better simplified version"""
 
         # Clean the original story first
-        clean_original = self._clean_story_output(original_story)
-
-        prompt = f"""Create a simplified version for beginning readers (ages 3-5).
-
-Original story:
-{clean_original}
-
-Rules:
-- Same number of stanzas
-- Use ONLY these words: a, and, at, can, come, do, go, has, he, her, him, I, in, is, it, me, my, no, on, see, she, the, to, up, we, you, big, cat, dog, run, sit, fun, red, mom, dad, get, let, wet, hot, not
-- 2-4 sentences per stanza, maximum 4 words per sentence
-- Keep the same story events but much simpler
-
-Example:
-Original: "Down at PlayWorld, what did she spy? A slide that stretched up to the sky!"
-Simplified: "Esme went to play. She saw a big slide. It was very high. Up she went."
+        clean_original = clean_story_text(original_story)
 
-Create ONLY the simplified version - no explanations."""
-
-        simplified = self._call_claude_api(prompt)
+        with self.telemetry.span('story.simplified', 'claude'):
+            simplified = self._call_claude_api(self._build_simplified_prompt(clean_original))
 
         # Clean the simplified version too
         if simplified:
-            simplified = self._clean_story_output(simplified)
+            simplified = clean_story_text(simplified)
             return simplified
 
         return self._create_basic_fallback(clean_original)
 
+    def _build_simplified_prompt(self, clean_original):
+        """Build the prompt for the beginning-reader version of a story."""
+        return self.prompts.render('simplified_story_prompt', original_story=clean_original)
+
     def generate_image_descriptions(self, stanzas, character_description=""):
         """Generate enhanced image descriptions with character consistency."""
-        stanzas_text = "\n\n".join([f"STANZA {i+1}:\n{stanza}" for i, stanza in enumerate(stanzas)])
-
-        prompt = f"""Create vivid, consistent image descriptions for children's book illustrations.
-
-Character consistency requirement: Esme must appear identical in every image - {character_description}
-
-For each stanza, provide a detailed description focusing on:
-1. Esme's specific action/pose/expression
-2. Key objects or environment elements
-3. Emotional tone of the scene
-4. Visual composition that tells the story
-
-Stanzas to describe:
-{stanzas_text}
-
-Format: One detailed description per stanza, 15-25 words each, focusing on specific visual elements that an illustrator could draw.
-
-Provide ONLY the descriptions - no explanations."""
-
         try:
-            response = self._call_claude_api(prompt)
-            if response:
-                descriptions = [desc.strip() for desc in response.split('\n') if desc.strip()]
-                # Clean up any numbering
-                cleaned = [re.sub(r'^(\d+\.|\*|\-)\s*', '', desc) for desc in descriptions]
-                return [desc for desc in cleaned if desc and len(desc) > 10]
-            return []
+            with self.telemetry.span('story.image_descriptions', 'claude'):
+                response = self._call_claude_api(self._build_image_descriptions_prompt(stanzas, character_description))
+            return self._parse_image_descriptions(response)
         except Exception as e:
             logging.error(f"Error generating image descriptions: {e}")
             return []
 
+    def _build_image_descriptions_prompt(self, stanzas, character_description=""):
+        """Build the prompt asking for one illustration description per stanza."""
+        return self.prompts.render(
+            'image_description_prompt', stanzas=stanzas, character_description=character_description
+        )
+
+    def rewrite_page(self, story_text, page_text, page_number, character_description="", instructions=""):
+        """Write a new version of one stanza, with its simplified text and image description, in one call.
+
+        Args:
+            story_text (str): The whole story, so the new stanza still fits
+            page_text (str): The stanza to replace
+            page_number (int): Its position in the story
+            character_description (str): How Esme looks
+            instructions (str, optional): What the reader wants changed
+
+        Returns:
+            dict: text, simplified and image_description
+
+        Raises:
+            ValueError: If the reply isn't a usable stanza
+        """
+        prompt = self.prompts.render(
+            'page_rewrite_prompt',
+            story=clean_story_text(story_text),
+            stanza=page_text,
+            page_number=page_number,
+            instructions=instructions,
+            character_description=character_description
+        )
+        with self.telemetry.span('story.rewrite_page', 'claude'):
+            response = self._call_claude_api(prompt)
+
+        match = re.search(r'\{.*\}', response or '', re.DOTALL)
+        try:
+            # _call_claude_api has already turned the JSON's \n escapes into real newlines
+            page = json.loads(match.group(0), strict=False) if match else {}
+        except json.JSONDecodeError:
+            page = {}
+        # One stanza is one page: no blank lines, or it would split in two when the story is parsed again
+        text, simplified = (
+            '\n'.join(line.strip() for line in str(page.get(key, '')).splitlines() if line.strip())
+            for key in ('text', 'simplified')
+        )
+        if len(text) < 10:
+            raise ValueError("Claude did not return a usable stanza")
+        return {
+            'text': text,
+            'simplified': simplified or self._create_basic_fallback(text),
+            'image_description': str(page.get('image_description', '')).strip()
+        }
+
+    def _parse_image_descriptions(self, response):
+        """Split a description response into one cleaned description per line."""
+        if not response:
+            return []
+        descriptions = [desc.strip() for desc in response.split('\n') if desc.strip()]
+        # Clean up any numbering
+        cleaned = [re.sub(r'^(\d+\.|\*|\-)\s*', '', desc) for desc in descriptions]
+        return [desc for desc in cleaned if desc and len(desc) > 10]
+
     def _call_claude_api(self, prompt, max_retries=3):
-        """Call Claude API with retry logic."""
+        """Call Claude API with retry logic.
+
+        Transient errors are retried with backoff. Overload responses and an
+        open circuit fail fast with UpstreamUnavailable instead of sleeping
+        on the request thread.
+        """
         for attempt in range(max_retries):
             try:
                 if attempt > 0:
                     time.sleep(2 ** attempt)  # Exponential backoff
 
-                response = requests.post(
-                    'https://api.anthropic.com/v1/messages',
-                    json={
-                        'model': self.model,
-                        'max_tokens': 1500,
-                        'messages': [{'role': 'user', 'content': prompt}]
-                    },
-                    headers={
-                        'x-api-key': self.api_key,
-                        'anthropic-version': '2023-06-01',
-                        'Content-Type': 'application/json'
-                    },
-                    timeout=30
-                )
+                started = time.monotonic()
+                with self.upstream.call() as outcome:
+                    response = requests.post(
+                        self.api_url,
+                        json=self._build_claude_payload(prompt),
+                        headers=self._claude_headers(),
+                        timeout=30
+                    )
+                    outcome.record_status(response.status_code)
 
                 if response.status_code == 200:
-                    content = response.json()['content'][0]['text']
-                    return content.replace('\\\\n', '\n').replace('\\n', '\n')
-                elif response.status_code == 529:  # Overloaded
-                    if attempt == max_retries - 1:
-                        raise Exception("Claude API overloaded")
-                    continue
-                else:
-                    response.raise_for_status()
-
+                    response_data = response.json()
+                    self._record_usage('messages', started, 200, response_data.get('usage'))
+                    return self._extract_claude_text(response_data)
+                self._record_usage('messages', started, response.status_code)
+                if outcome.overloaded:
+                    raise UpstreamUnavailable('claude', f'overloaded ({response.status_code})')
+                response.raise_for_status()
+
+            except UpstreamUnavailable as e:
+                logging.warning(f"Not retrying Claude call: {e}")
+                raise
             except Exception as e:
                 if attempt == max_retries - 1:
                     logging.error(f"Claude API call failed after {max_retries} attempts: {e}")
@@ -227,6 +294,128 @@ Provide ONLY the descriptions - no explanations."""
 
         return None
 
+    def _stream_claude_api(self, prompt, max_retries=3, unescape=True, max_tokens=1500):
+        """Stream a Claude response as text deltas over server-sent events.
+
+        Connecting is retried like _call_claude_api; once text has started
+        arriving, an error ends the stream with an exception. The call keeps
+        its Claude concurrency slot until the stream has been read to the end
+        or closed.
+        """
+        for attempt in range(max_retries):
+            streaming = False
+            try:
+                if attempt > 0:
+                    time.sleep(2 ** attempt)  # Exponential backoff
+
+                started = time.monotonic()
+                with self.upstream.call() as outcome:
+                    response = requests.post(
+                        self.api_url,
+                        json=self._build_claude_payload(prompt, stream=True, max_tokens=max_tokens),
+                        headers=self._claude_headers(),
+                        timeout=30,
+                        stream=True
+                    )
+                    outcome.record_status(response.status_code)
+
+                    if response.status_code == 200:
+                        streaming = True
+                        yield from self._read_claude_stream(response, started, unescape)
+                        return
+
+                response.close()
+                self._record_usage('messages-stream', started, response.status_code)
+                if outcome.overloaded:
+                    raise UpstreamUnavailable('claude', f'overloaded ({response.status_code})')
+                response.raise_for_status()
+
+            except UpstreamUnavailable as e:
+                logging.warning(f"Not retrying Claude call: {e}")
+                raise
+            except Exception as e:
+                if streaming:
+                    raise
+                if attempt == max_retries - 1:
+                    logging.error(f"Claude API stream failed after {max_retries} attempts: {e}")
+                    raise
+                logging.warning(f"Attempt {attempt + 1} failed: {e}")
+
+    def _read_claude_stream(self, response, started, unescape):
+        """Text deltas of a successful streaming response, metered once it ends."""
+        usage = {}
+        try:
+            with response:
+                pending = ''
+                # Decode per line ourselves; requests assumes Latin-1 for text/event-stream
+                for line in response.iter_lines():
+                    text = self._parse_stream_line(line.decode('utf-8'), usage)
+                    if text and unescape:
+                        text, pending = self._unescape_delta(pending, text)
+                    if text:
+                        yield text
+                if pending:
+                    yield pending
+        finally:
+            self._record_usage('messages-stream', started, 200, usage)
+
+    def _parse_stream_line(self, line, usage):
+        """Text carried by one server-sent event line, if any; token counts are collected into usage."""
+        if not line.startswith('data:'):
+            return None
+        event = json.loads(line[5:])
+        if event['type'] == 'content_block_delta' and event['delta'].get('type') == 'text_delta':
+            return event['delta']['text']
+        if event['type'] == 'message_start':
+            usage.update(event['message'].get('usage', {}))
+        elif event['type'] == 'message_delta':
+            usage.update(event.get('usage', {}))
+        if event['type'] == 'error':
+            raise Exception(f"Claude stream error: {event['error'].get('message')}")
+        return None
+
+    def _record_usage(self, operation, started, status, usage=None):
+        """Meter one Messages API call from its usage block."""
+        usage = usage or {}
+        self.meter.record(
+            'claude', operation, time.monotonic() - started, status,
+            input_tokens=usage.get('input_tokens', 0), output_tokens=usage.get('output_tokens', 0)
+        )
+
+    def _unescape_delta(self, pending, text):
+        """Unescape newlines in a streamed delta, holding back trailing backslashes.
+
+        Returns:
+            tuple: (unescaped text, backslashes to prepend to the next delta)
+        """
+        text = pending + text
+        kept = text.rstrip('\\')
+        return kept.replace('\\\\n', '\n').replace('\\n', '\n'), text[len(kept):]
+
+    def _build_claude_payload(self, prompt, stream=False, max_tokens=1500):
+        """Build the Messages API request body for a single-turn prompt."""
+        payload = {
+            'model': self.model,
+            'max_tokens': max_tokens,
+            'messages': [{'role': 'user', 'content': prompt}]
+        }
+        if stream:
+            payload['stream'] = True
+        return payload
+
+    def _claude_headers(self):
+        """Headers for the Messages API."""
+        return {
+            'x-api-key': self.api_key,
+            'anthropic-version': '2023-06-01',
+            'Content-Type': 'application/json'
+        }
+
+    def _extract_claude_text(self, response_data):
+        """Pull the text out of a Messages API response and unescape newlines."""
+        content = response_data['content'][0]['text']
+        return content.replace('\\\\n', '\n').replace('\\n', '\n')
+
     def _create_basic_fallback(self, original_story):
         """Enhanced fallback simplified story creation."""
         stanzas = original_story.split('\n\n')
@@ -1,23 +1,90 @@
 import requests
 import os
+import re
+import io
 import logging
 import base64
 import time
 from pathlib import Path
+from PIL import Image, ImageOps
+from services.resilience_service import get_upstream, UpstreamUnavailable, OVERLOAD_STATUS_CODES
+from services.credential_service import CredentialService, STABILITY_API_HOST
+from services.metering_service import get_meter, STABILITY_CREDITS
+from services.summary_image_service import SummaryImageService
+
+# Words that suggest how much movement a scene has
+HIGH_MOTION_WORDS = [
+    'run', 'running', 'ran', 'jump', 'jumping', 'leapt', 'slide', 'sliding', 'slid',
+    'swim', 'swimming', 'dive', 'diving', 'fly', 'flying', 'dance', 'dancing',
+    'race', 'racing', 'chase', 'chasing', 'climb', 'climbing', 'rush', 'rushing',
+    'bounce', 'bouncing', 'twirl', 'twirling', 'adventure', 'explore', 'exploring'
+]
+
+MEDIUM_MOTION_WORDS = [
+    'walk', 'walking', 'move', 'moving', 'reach', 'reaching', 'turn', 'turning',
+    'play', 'playing', 'build', 'building', 'work', 'working', 'help', 'helping',
+    'point', 'pointing', 'wave', 'waving', 'clap', 'clapping', 'skip', 'skipping',
+    'discover', 'find', 'found', 'search', 'searching'
+]
+
+LOW_MOTION_WORDS = [
+    'smile', 'smiling', 'laugh', 'laughing', 'think', 'thinking', 'wonder', 'wondering',
+    'look', 'looking', 'see', 'seeing', 'watch', 'watching', 'listen', 'listening',
+    'sit', 'sitting', 'rest', 'resting', 'yawn', 'yawning', 'sleep', 'sleeping'
+]
+
+# One dict lookup per word instead of a substring scan per keyword
+MOTION_WORD_LEVELS = {
+    **{word: 'low' for word in LOW_MOTION_WORDS},
+    **{word: 'medium' for word in MEDIUM_MOTION_WORDS},
+    **{word: 'high' for word in HIGH_MOTION_WORDS},
+}
+
+WORD_PATTERN = re.compile(r"[a-z]+")
+
+# Endings stripped to find a keyword in an inflected word, and what replaces them
+MOTION_WORD_SUFFIXES = [('ies', 'y'), ('ied', 'y'), ('ing', ''), ('ed', ''), ('es', ''), ('s', '')]
+
+
+def motion_keyword(word):
+    """The motion keyword a word is a form of (jumped -> jump, danced -> dance, clapped -> clap), or None."""
+    if word in MOTION_WORD_LEVELS:
+        return word
+    for suffix, replacement in MOTION_WORD_SUFFIXES:
+        if not word.endswith(suffix) or len(word) - len(suffix) < 2:
+            continue
+        stem = word[:-len(suffix)] + replacement
+        # As written, with the dropped final e put back, or with a doubled final consonant undone
+        candidates = [stem] if stem.endswith('e') else [stem, stem + 'e']
+        if len(stem) > 2 and stem[-1] == stem[-2]:
+            candidates.append(stem[:-1])
+        for candidate in candidates:
+            if candidate in MOTION_WORD_LEVELS:
+                return candidate
+    return None
 
 class StorySummaryAnimationService:
     """Service for generating a single story summary animation at the end of the story."""
 
-    def __init__(self, api_key, reading_speed_settings):
+    def __init__(self, api_key, reading_speed_settings, credential_service=None, summary_image_service=None):
         """Initialize with API key and reading speed settings.
 
         Args:
             api_key (str): Stability AI API key
             reading_speed_settings (dict): Reading speed configuration from your app.py
+            credential_service (CredentialService, optional): Shared cached key validation
+            summary_image_service (SummaryImageService, optional): Builds the summary keyframe
         """
         self.api_key = api_key
-        self.base_url = "https://api.stability.ai/v2beta/image-to-video"
+        self.api_host = STABILITY_API_HOST
+        self.base_url = f"{self.api_host}/v2beta/image-to-video"
+        self.result_url = f"{self.base_url}/result"
+        self.credentials = credential_service or CredentialService(api_key, self.api_host)
+        # Shares its circuit breaker and concurrency limit with ImageService
+        self.upstream = get_upstream('stability')
+        self.meter = get_meter()
         self.reading_speed_settings = reading_speed_settings
+        self.summary_images = summary_image_service or SummaryImageService()
 
     def create_story_summary_image(self, story_content, character_description):
         """Create a composite summary image from the best story scenes.
@@ -30,34 +97,17 @@ class StorySummaryAnimationService:
             str: Path to the summary image, or None if failed
         """
         try:
-            # For now, use the first story image as the base for animation
-            # In the future, you could create a composite image here
-            if story_content and len(story_content) > 0:
-                # Use the most action-packed scene (middle of story usually has most action)
-                middle_index = len(story_content) // 2
-                best_scene = story_content[middle_index]
-
-                # Copy the image to use as summary base
-                source_image = best_scene['image'].lstrip('/')
-                if os.path.exists(source_image):
-                    summary_image_path = f"static/images/story_summary_{int(time.time())}.jpg"
-
-                    # For now, just copy the existing image
-                    # In the future, you could generate a new composite image here
-                    import shutil
-                    shutil.copy2(source_image, summary_image_path)
-
-                    logging.info(f"Created story summary base image: {summary_image_path}")
-                    return summary_image_path
-
-            return None
-
+            return self.summary_images.create_summary_image(story_content)
         except Exception as e:
             logging.error(f"Error creating story summary image: {e}")
             return None
 
-    def generate_story_summary_animation(self, story_content, character_description, reading_mode="normal"):
-        """Generate a single animation summarizing the entire story.
+    def submit_story_summary_animation(self, story_content, character_description, reading_mode="normal"):
+        """Start rendering a single animation summarizing the entire story.
+
+        Stability renders image-to-video asynchronously: this uploads the
+        summary image and returns the generation id to poll with
+        fetch_animation_result.
 
         Args:
             story_content (list): List of story page data
@@ -65,7 +115,7 @@ class StorySummaryAnimationService:
             reading_mode (str): Reading mode for duration synchronization
 
         Returns:
-            dict: Animation result with video path or error
+            dict: generation_id and the prepared summary data, or error
         """
         try:
             if not self.api_key:
@@ -74,131 +124,324 @@ class StorySummaryAnimationService:
                     'error': 'No Stability AI API key configured'
                 }
 
-            # Test API key
-            try:
-                test_response = requests.get(
-                    "https://api.stability.ai/v1/user/account", 
-                    headers={'Authorization': f'Bearer {self.api_key}'},
-                    timeout=10
-                )
-                if test_response.status_code != 200:
-                    return {
-                        'success': False,
-                        'error': f'Invalid API key (status: {test_response.status_code})'
-                    }
-            except Exception as e:
+            # Key validity comes from the cached credential check, not a round trip per video
+            key_error = self._key_check_error()
+            if key_error:
                 return {
                     'success': False,
-                    'error': f'API connection failed: {str(e)}'
+                    'error': key_error
                 }
 
-            logging.info("Creating story summary animation...")
+            logging.info("Submitting story summary animation...")
 
-            # Create or get summary image
-            summary_image_path = self.create_story_summary_image(story_content, character_description)
-            if not summary_image_path:
+            prepared = self.prepare_summary_animation(story_content, character_description)
+            if 'error' in prepared:
                 return {
                     'success': False,
-                    'error': 'Could not create summary image'
+                    'error': prepared['error']
                 }
 
-            # Create story summary text
-            story_summary = self._create_story_summary(story_content)
+            # Upload the summary image; the render itself happens on Stability's side
+            with open(prepared['summary_image_path'], 'rb') as image_file:
+                submitted = self._submit_render(image_file, prepared['motion_intensity'])
 
-            # Analyze overall story motion
-            motion_intensity = self._analyze_story_motion(story_content)
+            if submitted['success']:
+                logging.info(f"✓ Story summary animation submitted: {submitted['generation_id']}")
+                submitted['prepared'] = prepared
+            return submitted
 
-            logging.info(f"Story summary: {story_summary[:100]}...")
-            logging.info(f"Overall motion intensity: {motion_intensity}")
+        except UpstreamUnavailable as e:
+            logging.warning(f"Skipping story summary animation: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+        except Exception as e:
+            logging.error(f"Unexpected error submitting story summary animation: {e}")
+            return {
+                'success': False,
+                'error': f'Unexpected error: {str(e)}'
+            }
 
-            # Generate animation using the summary image
-            with open(summary_image_path, 'rb') as image_file:
-                files = {
-                    'image': ('story_summary.jpg', image_file, 'image/jpeg'),
-                }
+    def submit_page_animation(self, image_path, motion_intensity):
+        """Start rendering an animation of a single story page illustration.
 
-                # Parameters for story summary animation
-                data = {
-                    'seed': 123,  # Different seed for story summary
-                    'cfg_scale': 1.5,  # Slightly lower for more faithful animation
-                    'motion_bucket_id': int(motion_intensity * 127),
-                }
+        Args:
+            image_path (str): Page image on disk
+            motion_intensity (float): The page's own motion intensity
 
-                headers = {
-                    'Authorization': f'Bearer {self.api_key}',
-                    'Accept': 'video/*'
+        Returns:
+            dict: generation_id, or error
+        """
+        try:
+            if not self.api_key:
+                return {
+                    'success': False,
+                    'error': 'No Stability AI API key configured'
                 }
 
-                logging.info(f"Generating story summary video with motion_bucket_id: {int(motion_intensity * 127)}")
-
-                response = requests.post(
-                    self.base_url,
-                    headers=headers,
-                    files=files,
-                    data=data,
-                    timeout=180
-                )
-
-            if response.status_code == 200:
-                video_data = response.content
-
-                if not video_data:
-                    return {
-                        'success': False,
-                        'error': 'Received empty video data from API'
-                    }
-
-                # Save story summary video
-                video_filename = f"story_summary_animation_{int(time.time())}.mp4"
-                video_path = f"static/videos/{video_filename}"
-                os.makedirs("static/videos", exist_ok=True)
-
-                with open(video_path, 'wb') as f:
-                    f.write(video_data)
-
-                # Verify file was saved
-                if os.path.exists(video_path) and os.path.getsize(video_path) > 0:
-                    file_size = os.path.getsize(video_path)
-                    logging.info(f"✓ Story summary animation saved: {video_path} ({file_size // 1024}KB)")
-
-                    return {
-                        'success': True,
-                        'video_path': f"/{video_path}",
-                        'summary_image': f"/{summary_image_path}",
-                        'story_summary': story_summary,
-                        'motion_intensity': motion_intensity,
-                        'duration': 4.0,
-                        'description': "Complete story summary animation"
-                    }
-                else:
-                    return {
-                        'success': False,
-                        'error': 'Video file was not saved properly'
-                    }
-            else:
-                error_msg = f"API error: {response.status_code}"
-                try:
-                    error_data = response.json()
-                    if 'message' in error_data:
-                        error_msg += f" - {error_data['message']}"
-                    elif 'errors' in error_data:
-                        error_msg += f" - {', '.join(error_data['errors'])}"
-                except:
-                    error_msg += f" - {response.text[:200]}"
-
-                logging.error(f"Story summary animation failed: {error_msg}")
+            key_error = self._key_check_error()
+            if key_error:
                 return {
                     'success': False,
-                    'error': error_msg
+                    'error': key_error
                 }
 
+            # Square page illustrations go up at the square size image-to-video accepts
+            with Image.open(image_path) as img:
+                frame = ImageOps.fit(img.convert('RGB'), (768, 768), Image.LANCZOS)
+            image_file = io.BytesIO()
+            frame.save(image_file, 'JPEG', quality=90)
+            image_file.seek(0)
+
+            submitted = self._submit_render(image_file, motion_intensity)
+            if submitted['success']:
+                logging.info(f"✓ Page animation submitted for {image_path}: {submitted['generation_id']}")
+            return submitted
+
+        except UpstreamUnavailable as e:
+            logging.warning(f"Skipping page animation: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
         except Exception as e:
-            logging.error(f"Unexpected error generating story summary animation: {e}")
+            logging.error(f"Unexpected error submitting page animation: {e}")
             return {
                 'success': False,
                 'error': f'Unexpected error: {str(e)}'
             }
 
+    def _submit_render(self, image_file, motion_intensity):
+        """Upload an image to image-to-video and return the generation id."""
+        files = {
+            'image': ('story_summary.jpg', image_file, 'image/jpeg'),
+        }
+
+        started = time.monotonic()
+        with self.upstream.call() as outcome:
+            response = requests.post(
+                self.base_url,
+                headers=self._submit_headers(),
+                files=files,
+                data=self._video_params(motion_intensity),
+                timeout=60
+            )
+            outcome.record_status(response.status_code)
+        # Credits are charged when the render is accepted; polling the result is free
+        self.meter.record(
+            'stability', 'image-to-video', time.monotonic() - started, response.status_code,
+            credits=STABILITY_CREDITS['image-to-video'] if response.status_code == 200 else 0
+        )
+
+        if response.status_code == 200:
+            return {
+                'success': True,
+                'generation_id': response.json()['id']
+            }
+
+        error_msg = self._describe_api_error(response)
+        logging.error(f"Animation submit failed: {error_msg}")
+        return {
+            'success': False,
+            'error': error_msg
+        }
+
+    def fetch_animation_result(self, generation_id):
+        """Check once whether a submitted render has finished.
+
+        Args:
+            generation_id (str): Id returned by submit_story_summary_animation
+
+        Returns:
+            dict: status 'rendering', 'complete' (with video_data) or 'failed' (with error)
+        """
+        try:
+            with self.upstream.call() as outcome:
+                response = requests.get(
+                    f"{self.result_url}/{generation_id}",
+                    headers=self._video_headers(),
+                    timeout=30
+                )
+                outcome.record_status(response.status_code)
+        except UpstreamUnavailable as e:
+            # Stability is struggling; the render keeps going, so just check again later
+            logging.warning(f"Deferring animation poll for {generation_id}: {e}")
+            return {'status': 'rendering'}
+        except requests.RequestException as e:
+            logging.warning(f"Animation poll for {generation_id} failed: {e}")
+            return {'status': 'rendering'}
+
+        if response.status_code == 202:
+            return {'status': 'rendering'}
+        if response.status_code == 200:
+            return {'status': 'complete', 'video_data': response.content}
+        if response.status_code in OVERLOAD_STATUS_CODES or response.status_code >= 500:
+            return {'status': 'rendering'}
+
+        error_msg = self._describe_api_error(response)
+        logging.error(f"Story summary animation {generation_id} failed: {error_msg}")
+        return {'status': 'failed', 'error': error_msg}
+
+    def _key_check_error(self):
+        """Error message if the API key is known to be bad or Stability is unavailable.
+
+        Raises:
+            UpstreamUnavailable: if the Stability circuit is open
+        """
+        if self.credentials.is_key_rejected():
+            return self.credentials.validate()['error']
+        # Don't start a render while Stability is down
+        if not self.upstream.is_available():
+            raise UpstreamUnavailable('stability', 'circuit open')
+        return None
+
+    def prepare_summary_animation(self, story_content, character_description):
+        """Create the summary image and analyze the story before the video call.
+
+        Args:
+            story_content (list): List of story page data
+            character_description (str): Character description
+
+        Returns:
+            dict: summary_image_path, story_summary, motion_intensity and page_motion, or error
+        """
+        # Create or get summary image
+        summary_image_path = self.create_story_summary_image(story_content, character_description)
+        if not summary_image_path:
+            return {'error': 'Could not create summary image'}
+
+        # Create story summary text
+        story_summary = self._create_story_summary(story_content)
+
+        # Analyze per-page and overall story motion
+        page_motion = self.analyze_page_motion(story_content)
+        motion_intensity = self._analyze_story_motion(story_content, page_motion)
+
+        logging.info(f"Story summary: {story_summary[:100]}...")
+        logging.info(f"Overall motion intensity: {motion_intensity}")
+
+        return {
+            'summary_image_path': summary_image_path,
+            'story_summary': story_summary,
+            'motion_intensity': motion_intensity,
+            'page_motion': page_motion
+        }
+
+    def _submit_headers(self):
+        """Headers for submitting an image-to-video render."""
+        return {
+            'Authorization': f'Bearer {self.api_key}',
+            'Accept': 'application/json'
+        }
+
+    def _video_headers(self):
+        """Headers for fetching a finished render as MP4."""
+        return {
+            'Authorization': f'Bearer {self.api_key}',
+            'Accept': 'video/*'
+        }
+
+    def _video_params(self, motion_intensity):
+        """Form parameters for story summary animation."""
+        logging.info(f"Submitting image-to-video render with motion_bucket_id: {int(motion_intensity * 127)}")
+        return {
+            'seed': 123,  # Different seed for story summary
+            'cfg_scale': 1.5,  # Slightly lower for more faithful animation
+            'motion_bucket_id': int(motion_intensity * 127),
+        }
+
+    def save_summary_video(self, video_data, prepared, generation_id):
+        """Save a rendered summary video and build the animation result.
+
+        Args:
+            video_data (bytes): MP4 returned by the API
+            prepared (dict): Output of prepare_summary_animation
+            generation_id (str): Stability generation id, keeps concurrent renders apart
+
+        Returns:
+            dict: Animation result with video path or error
+        """
+        if not video_data:
+            return {
+                'success': False,
+                'error': 'Received empty video data from API'
+            }
+
+        # Save story summary video
+        video_filename = f"story_summary_animation_{int(time.time())}_{generation_id[:8]}.mp4"
+        video_path = f"static/videos/{video_filename}"
+        os.makedirs("static/videos", exist_ok=True)
+
+        with open(video_path, 'wb') as f:
+            f.write(video_data)
+
+        # Verify file was saved
+        if os.path.exists(video_path) and os.path.getsize(video_path) > 0:
+            file_size = os.path.getsize(video_path)
+            logging.info(f"✓ Story summary animation saved: {video_path} ({file_size // 1024}KB)")
+
+            return {
+                'success': True,
+                'video_path': f"/{video_path}",
+                'summary_image': f"/{prepared['summary_image_path']}",
+                'story_summary': prepared['story_summary'],
+                'motion_intensity': prepared['motion_intensity'],
+                'duration': 4.0,
+                'description': "Complete story summary animation"
+            }
+        else:
+            return {
+                'success': False,
+                'error': 'Video file was not saved properly'
+            }
+
+    def save_page_video(self, video_data, image_hash):
+        """Save a rendered page animation under the hash of its source image.
+
+        Args:
+            video_data (bytes): MP4 returned by the API
+            image_hash (str): SHA-256 of the page image
+
+        Returns:
+            dict: Animation result with video path or error
+        """
+        if not video_data:
+            return {
+                'success': False,
+                'error': 'Received empty video data from API'
+            }
+
+        video_path = self.page_video_path(image_hash)
+        os.makedirs(os.path.dirname(video_path), exist_ok=True)
+        with open(video_path, 'wb') as f:
+            f.write(video_data)
+
+        logging.info(f"✓ Page animation saved: {video_path} ({len(video_data) // 1024}KB)")
+        return {
+            'success': True,
+            'video_path': f"/{video_path}",
+            'duration': 4.0,
+            'description': "Animated scene"
+        }
+
+    def page_video_path(self, image_hash):
+        """Where the animation of a page image lives; identical images share one video."""
+        return f"static/videos/page_animation_{image_hash[:16]}.mp4"
+
+    def _describe_api_error(self, response):
+        """Build a readable error message from a failed Stability response."""
+        error_msg = f"API error: {response.status_code}"
+        try:
+            error_data = response.json()
+            if 'message' in error_data:
+                error_msg += f" - {error_data['message']}"
+            elif 'errors' in error_data:
+                error_msg += f" - {', '.join(error_data['errors'])}"
+        except:
+            error_msg += f" - {response.text[:200]}"
+        return error_msg
+
     def _create_story_summary(self, story_content):
         """Create a summary of the story from all pages.
 
@@ -232,86 +475,78 @@ class StorySummaryAnimationService:
 
         return summary[:200]  # Limit to 200 characters
 
-    def _analyze_story_motion(self, story_content):
-        """Analyze the overall motion level of the entire story.
+    def analyze_page_motion(self, story_content):
+        """Score the motion level of every page in a single pass over its words.
+
+        Each motion keyword counts once per page however often it (or an
+        inflected form such as "jumped") appears, as the whole-story scan did,
+        so one repeated word doesn't decide the page's motion.
 
         Args:
             story_content (list): List of story page data
 
         Returns:
-            float: Overall motion intensity (0.2-0.8)
+            list: Per page, the page number, motion_intensity (0.2-0.8) and high/medium/low keyword counts
         """
-        all_text = ""
-        for page in story_content:
-            text = page.get('text', '')
-            all_text += " " + text.lower()
-
-        # High motion words - more comprehensive list for story summary
-        high_motion_words = [
-            'run', 'running', 'ran', 'jump', 'jumping', 'leapt', 'slide', 'sliding', 'slid',
-            'swim', 'swimming', 'dive', 'diving', 'fly', 'flying', 'dance', 'dancing',
-            'race', 'racing', 'chase', 'chasing', 'climb', 'climbing', 'rush', 'rushing',
-            'bounce', 'bouncing', 'twirl', 'twirling', 'adventure', 'explore', 'exploring'
-        ]
-
-        # Medium motion words
-        medium_motion_words = [
-            'walk', 'walking', 'move', 'moving', 'reach', 'reaching', 'turn', 'turning',
-            'play', 'playing', 'build', 'building', 'work', 'working', 'help', 'helping',
-            'point', 'pointing', 'wave', 'waving', 'clap', 'clapping', 'skip', 'skipping',
-            'discover', 'find', 'found', 'search', 'searching'
-        ]
-
-        # Low motion words
-        low_motion_words = [
-            'smile', 'smiling', 'laugh', 'laughing', 'think', 'thinking', 'wonder', 'wondering',
-            'look', 'looking', 'see', 'seeing', 'watch', 'watching', 'listen', 'listening',
-            'sit', 'sitting', 'rest', 'resting', 'yawn', 'yawning', 'sleep', 'sleeping'
-        ]
-
-        # Count occurrences
-        high_count = sum(1 for word in high_motion_words if word in all_text)
-        medium_count = sum(1 for word in medium_motion_words if word in all_text)
-        low_count = sum(1 for word in low_motion_words if word in all_text)
-
-        total_motion_words = high_count + medium_count + low_count
+        page_motion = []
+        for index, page in enumerate(story_content):
+            counts = {'high': 0, 'medium': 0, 'low': 0}
+            keywords = {motion_keyword(word) for word in WORD_PATTERN.findall(page.get('text', '').lower())}
+            for keyword in keywords - {None}:
+                counts[MOTION_WORD_LEVELS[keyword]] += 1
+
+            page_motion.append({
+                'page': page.get('page', index + 1),
+                'motion_intensity': self._motion_score(counts, 0.2, 0.8),
+                **counts
+            })
+        return page_motion
 
-        if total_motion_words == 0:
-            return 0.4  # Default medium motion
+    def _analyze_story_motion(self, story_content, page_motion=None):
+        """Analyze the overall motion level of the entire story.
 
-        # Calculate weighted motion score
-        motion_score = (high_count * 0.8 + medium_count * 0.5 + low_count * 0.2) / total_motion_words
+        Args:
+            story_content (list): List of story page data
+            page_motion (list, optional): Output of analyze_page_motion, if already computed
+
+        Returns:
+            float: Overall motion intensity (0.3-0.7)
+        """
+        if page_motion is None:
+            page_motion = self.analyze_page_motion(story_content)
+
+        counts = {
+            level: sum(page[level] for page in page_motion)
+            for level in ('high', 'medium', 'low')
+        }
 
         # Ensure it's in reasonable range for story summary (slightly more dynamic)
-        motion_intensity = max(0.3, min(0.7, motion_score))
+        motion_intensity = self._motion_score(counts, 0.3, 0.7)
 
-        logging.info(f"Story motion analysis: high={high_count}, medium={medium_count}, low={low_count}, score={motion_intensity:.2f}")
+        logging.info(f"Story motion analysis: high={counts['high']}, medium={counts['medium']}, low={counts['low']}, score={motion_intensity:.2f}")
 
         return motion_intensity
 
-    def add_story_summary_page(self, story_content, character_description, reading_mode="normal"):
-        """Add a story summary animation page to the end of the story.
+    def _motion_score(self, counts, floor, ceiling):
+        """Weighted motion score for high/medium/low word counts, clamped to a range."""
+        total_motion_words = counts['high'] + counts['medium'] + counts['low']
+
+        if total_motion_words == 0:
+            return 0.4  # Default medium motion
+
+        motion_score = (counts['high'] * 0.8 + counts['medium'] * 0.5 + counts['low'] * 0.2) / total_motion_words
+        return max(floor, min(ceiling, motion_score))
+
+    def build_summary_page(self, story_content, animation_result):
+        """Build the summary page that goes at the end of the story.
 
         Args:
             story_content (list): List of story page data
-            character_description (str): Character description
-            reading_mode (str): Reading mode
+            animation_result (dict): Animation result, or a 'rendering' job still in progress
 
         Returns:
-            list: Updated story content with summary page
+            dict: Summary page
         """
-        if not story_content:
-            return story_content
-
-        logging.info("Adding story summary animation page...")
-
-        # Generate the summary animation
-        animation_result = self.generate_story_summary_animation(
-            story_content, 
-            character_description, 
-            reading_mode
-        )
-
         # Create the summary page
         summary_page = {
             'page': len(story_content) + 1,
@@ -345,11 +580,31 @@ class StorySummaryAnimationService:
                 }
             }],
             'is_summary_page': True,
-            'has_animation': animation_result['success'],
+            'has_animation': False,
         }
 
-        if animation_result['success']:
+        self.apply_animation_result(summary_page, animation_result)
+        return summary_page
+
+    def apply_animation_result(self, summary_page, animation_result):
+        """Fill a summary page in from an animation result.
+
+        Args:
+            summary_page (dict): Summary page to update in place
+            animation_result (dict): Animation result, or a 'rendering' job still in progress
+        """
+        if animation_result.get('status') == 'rendering':
+            summary_page.update({
+                'animation_status': 'rendering',
+                'animation_job': animation_result['job_id'],
+                'animation_started_at': animation_result['started_at'],
+                'story_summary': animation_result.get('story_summary', '')
+            })
+            logging.info("Story summary page created, animation still rendering")
+        elif animation_result['success']:
             summary_page.update({
+                'animation_status': 'complete',
+                'has_animation': True,
                 'animation': animation_result['video_path'],
                 'animation_description': animation_result['description'],
                 'animation_duration': animation_result['duration'],
@@ -357,11 +612,8 @@ class StorySummaryAnimationService:
             })
             logging.info("✓ Story summary animation page created successfully")
         else:
-            summary_page['animation_error'] = animation_result['error']
+            summary_page.update({
+                'animation_status': 'failed',
+                'animation_error': animation_result['error']
+            })
             logging.warning(f"✗ Story summary animation failed: {animation_result['error']}")
-
-        # Add summary page to the end
-        updated_content = story_content.copy()
-        updated_content.append(summary_page)
-
-        return updated_content
\ No newline at end of file
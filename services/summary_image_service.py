@@ -0,0 +1,127 @@
+import os
+import hashlib
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from PIL import Image, ImageOps
+
+class SummaryImageService:
+    """Builds the story summary keyframe locally from the page illustrations.
+
+    The composite is named after a hash of the source images and layout, so
+    summarizing the same story again reuses the existing file instead of
+    re-encoding it.
+    """
+
+    # Stability image-to-video accepts 1024x576, 576x1024 or 768x768
+    SIZE = (1024, 576)
+    GUTTER = 6
+    BACKGROUND = (255, 255, 255)
+    LAYOUT_VERSION = 1
+
+    def __init__(self, output_dir="static/images", max_cached_thumbnails=64):
+        """Initialize SummaryImageService.
+
+        Args:
+            output_dir (str): Where composite images are written
+            max_cached_thumbnails (int): Downsampled page images kept in memory
+        """
+        self.output_dir = output_dir
+        self.max_cached_thumbnails = max_cached_thumbnails
+        self._thumbnails = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create_summary_image(self, story_content):
+        """Composite the key page illustrations into one summary image.
+
+        Args:
+            story_content (list): List of story page data
+
+        Returns:
+            str: Path to the summary image, or None if no page has an image on disk
+        """
+        sources = []
+        for page in self._key_pages(story_content):
+            image_path = page.get('image', '').lstrip('/')
+            if image_path and os.path.exists(image_path):
+                with open(image_path, 'rb') as f:
+                    image_bytes = f.read()
+                sources.append((hashlib.sha256(image_bytes).hexdigest(), image_path))
+
+        if not sources:
+            return None
+
+        key = hashlib.sha256(
+            f"v{self.LAYOUT_VERSION}:{self.SIZE}:".encode() + ','.join(digest for digest, _ in sources).encode()
+        ).hexdigest()
+        summary_image_path = os.path.join(self.output_dir, f"story_summary_{key[:16]}.jpg")
+
+        if os.path.exists(summary_image_path):
+            logging.info(f"Reusing story summary image: {summary_image_path}")
+            return summary_image_path
+
+        canvas = Image.new('RGB', self.SIZE, self.BACKGROUND)
+        for (digest, image_path), box in zip(sources, self._layout(len(sources))):
+            left, top, width, height = box
+            canvas.paste(self._thumbnail(digest, image_path, (width, height)), (left, top))
+
+        # Encode once to a private file, then rename so concurrent workers never see a partial image
+        os.makedirs(self.output_dir, exist_ok=True)
+        partial_path = f"{summary_image_path}.{uuid.uuid4().hex}.tmp"
+        canvas.save(partial_path, 'JPEG', quality=88, optimize=True)
+        os.replace(partial_path, summary_image_path)
+
+        logging.info(f"✓ Composited story summary image from {len(sources)} pages: {summary_image_path}")
+        return summary_image_path
+
+    def _key_pages(self, story_content):
+        """Opening, middle and closing pages (the middle one is the hero frame)."""
+        pages = [page for page in story_content if not page.get('is_summary_page')]
+        if len(pages) <= 3:
+            indices = range(len(pages))
+        else:
+            indices = [len(pages) // 2, 0, len(pages) - 1]
+        return [pages[i] for i in indices]
+
+    def _layout(self, count):
+        """Boxes (left, top, width, height) for 1-3 frames on the canvas."""
+        width, height = self.SIZE
+        gutter = self.GUTTER
+
+        if count == 1:
+            return [(0, 0, width, height)]
+
+        if count == 2:
+            half = (width - gutter) // 2
+            return [(0, 0, half, height), (half + gutter, 0, width - half - gutter, height)]
+
+        # Hero frame on the left, the other two stacked on the right
+        hero_width = (width * 2) // 3
+        side_left = hero_width + gutter
+        side_width = width - side_left
+        side_height = (height - gutter) // 2
+        return [
+            (0, 0, hero_width, height),
+            (side_left, 0, side_width, side_height),
+            (side_left, side_height + gutter, side_width, height - side_height - gutter),
+        ]
+
+    def _thumbnail(self, digest, image_path, size):
+        """Downsampled, center-cropped copy of a page image, cached by content hash and size."""
+        cache_key = (digest, size)
+        with self._lock:
+            if cache_key in self._thumbnails:
+                self._thumbnails.move_to_end(cache_key)
+                return self._thumbnails[cache_key]
+
+        with Image.open(image_path) as img:
+            # Let the JPEG decoder skip detail we're about to throw away
+            img.draft('RGB', size)
+            thumbnail = ImageOps.fit(img.convert('RGB'), size, Image.LANCZOS)
+
+        with self._lock:
+            self._thumbnails[cache_key] = thumbnail
+            while len(self._thumbnails) > self.max_cached_thumbnails:
+                self._thumbnails.popitem(last=False)
+        return thumbnail
@@ -0,0 +1,271 @@
+import os
+import threading
+import logging
+import time
+import uuid
+import contextvars
+from contextlib import contextmanager
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # Exporting spans is optional; /metrics works without it
+    otel_trace = None
+
+# Innermost open span on this thread/task (copied into worker threads and asyncio tasks)
+_current_span = contextvars.ContextVar('current_span', default=None)
+
+# Upper bounds in seconds; stages range from a disk write to a five minute video render
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+METRICS = {
+    'stage_duration_seconds': ('histogram', 'Time spent in each stage of story generation, reading and animation'),
+    'upstream_request_seconds': ('histogram', 'Time until a remote API responded (headers, for streamed calls)'),
+    'upstream_queue_seconds': ('histogram', 'Time a remote API call waited for a concurrency slot'),
+    'upstream_shed_total': ('counter', 'Calls refused without being sent: circuit open, call queue full or waited too long'),
+}
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count for one label set."""
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class TelemetryService:
+    """Times the stages of a request and exposes them as Prometheus metrics.
+
+    span() wraps a stage (a Claude call, an image, a disk write) and records
+    its duration in a histogram labelled by stage, upstream and outcome.
+    Spans nest through a context variable, so stages running in pipeline
+    threads or asyncio tasks are attributed to the request that started
+    them; when the outermost span ends, the time spent per stage is logged
+    in one line.
+
+    Metrics are kept in memory per process: each worker reports its own.
+    If the OpenTelemetry SDK is installed and OTEL_EXPORTER_OTLP_ENDPOINT
+    is set, spans are also exported to that collector.
+    """
+
+    def __init__(self, service_name="esme-story-generator", otlp_endpoint=None):
+        """Initialize TelemetryService.
+
+        Args:
+            service_name (str): Service name reported to OpenTelemetry
+            otlp_endpoint (str, optional): OTLP collector URL; spans are only exported when set
+        """
+        self.service_name = service_name
+        self.otlp_endpoint = otlp_endpoint
+
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._collectors = []
+        self._tracer = None
+        self._exporter_pid = None
+
+    @contextmanager
+    def span(self, stage, upstream=None, **attributes):
+        """Time the block as one stage.
+
+        Args:
+            stage (str): Stage name, e.g. 'story.critique' or 'storage.save_story'
+            upstream (str, optional): Remote API the stage waits on
+            **attributes: Extra attributes for the exported span
+
+        Yields:
+            dict: The span, whose 'attributes' can be added to inside the block
+        """
+        parent = _current_span.get()
+        span = {
+            'stage': stage,
+            'upstream': upstream,
+            'attributes': attributes,
+            # The outermost span collects the per-stage totals for its summary line
+            'trace': parent['trace'] if parent else {'id': uuid.uuid4().hex[:16], 'stages': {}, 'lock': threading.Lock()}
+        }
+        exported = self._start_exported_span(stage, upstream, attributes, parent)
+        span['exported'] = exported
+        token = _current_span.set(span)
+        started = time.perf_counter()
+        outcome = 'ok'
+        try:
+            yield span
+        except Exception:
+            outcome = 'error'
+            raise
+        finally:
+            duration = time.perf_counter() - started
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # A generator was closed from a different context than it started in
+                _current_span.set(parent)
+            self.observe('stage_duration_seconds', duration, stage=stage, upstream=upstream or '', outcome=outcome)
+            if exported is not None:
+                for key, value in span['attributes'].items():
+                    exported.set_attribute(key, value)
+                exported.set_attribute('outcome', outcome)
+                exported.end()
+
+            trace = span['trace']
+            with trace['lock']:
+                trace['stages'][stage] = trace['stages'].get(stage, 0.0) + duration
+            if parent is None:
+                self._log_trace(stage, duration, outcome, trace)
+
+    def observe(self, metric, value, **labels):
+        """Add a value to a histogram."""
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def increment(self, metric, amount=1, **labels):
+        """Add to a counter."""
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def add_collector(self, collector):
+        """Register a function returning gauges to read at scrape time.
+
+        Args:
+            collector (callable): Returns a list of (name, help, [(labels dict, value), ...])
+        """
+        self._collectors.append(collector)
+
+    def render_prometheus(self):
+        """Every metric in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = {key: (list(h.counts), h.sum, h.count, h.buckets) for key, h in self._histograms.items()}
+            counters = dict(self._counters)
+
+        lines = []
+        for metric, (kind, help_text) in METRICS.items():
+            name = f"esme_{metric}"
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'histogram':
+                for (key_metric, labels), (counts, total, count, buckets) in sorted(histograms.items()):
+                    if key_metric != metric:
+                        continue
+                    for bound, bucket_count in zip(buckets, counts):
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', _number(bound)),))} {bucket_count}")
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+                    lines.append(f"{name}_sum{_labels(labels)} {total:.6f}")
+                    lines.append(f"{name}_count{_labels(labels)} {count}")
+            else:
+                for (key_metric, labels), value in sorted(counters.items()):
+                    if key_metric == metric:
+                        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+        for collector in self._collectors:
+            try:
+                gauges = collector()
+            except Exception as e:
+                logging.error(f"✗ Metrics collector failed: {e}")
+                continue
+            for metric, help_text, samples in gauges:
+                name = f"esme_{metric}"
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} gauge")
+                for labels, value in samples:
+                    lines.append(f"{name}{_labels(tuple(sorted(labels.items())))} {_number(value)}")
+
+        return '\n'.join(lines) + '\n'
+
+    def _log_trace(self, stage, duration, outcome, trace):
+        """One line per request showing where its time went (stages can overlap)."""
+        with trace['lock']:
+            stages = sorted(trace['stages'].items(), key=lambda item: -item[1])
+        breakdown = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in stages if name != stage)
+        if not breakdown:
+            # A lone stage (e.g. a background poll) isn't worth a line of its own
+            logging.debug(f"{stage} took {duration:.2f}s ({outcome})")
+            return
+        symbol = '✓' if outcome == 'ok' else '✗'
+        logging.info(f"{symbol} {stage} took {duration:.2f}s [trace {trace['id']}]: {breakdown}")
+
+    def _start_exported_span(self, stage, upstream, attributes, parent):
+        tracer = self._ensure_exporter()
+        if tracer is None:
+            return None
+        context = None
+        if parent is not None and parent.get('exported') is not None:
+            context = otel_trace.set_span_in_context(parent['exported'])
+        span = tracer.start_span(stage, context=context)
+        if upstream:
+            span.set_attribute('upstream', upstream)
+        for key, value in attributes.items():
+            span.set_attribute(key, value)
+        return span
+
+    def _ensure_exporter(self):
+        """Set up OTLP export once per process (the batch exporter's thread doesn't survive a fork)."""
+        if not self.otlp_endpoint or otel_trace is None:
+            return None
+        if self._exporter_pid == os.getpid():
+            return self._tracer
+        with self._lock:
+            if self._exporter_pid != os.getpid():
+                self._exporter_pid = os.getpid()
+                self._tracer = self._create_tracer()
+        return self._tracer
+
+    def _create_tracer(self):
+        try:
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        except ImportError as e:
+            logging.warning(f"OpenTelemetry export disabled, SDK or OTLP exporter missing: {e}")
+            return None
+
+        provider = TracerProvider(resource=Resource.create({'service.name': self.service_name}))
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=f"{self.otlp_endpoint.rstrip('/')}/v1/traces")))
+        logging.info(f"✓ Exporting spans to {self.otlp_endpoint}")
+        return provider.get_tracer(self.service_name)
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        f'{key}="' + str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+        for key, value in labels
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def _number(value):
+    return f"{value:g}" if isinstance(value, float) else str(value)
+
+
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry():
+    """Get the shared telemetry service, creating it on first use."""
+    global _telemetry
+    with _telemetry_lock:
+        if _telemetry is None:
+            _telemetry = TelemetryService(
+                os.getenv('OTEL_SERVICE_NAME', 'esme-story-generator'),
+                otlp_endpoint=os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT')
+            )
+        return _telemetry
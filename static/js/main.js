@@ -232,11 +232,30 @@ async function saveStoryWithTitle() {
     }
 }
 
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    // randomUUID needs a secure context; plain-http LAN access falls back to this
+    return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+}
+
 // Handle form submission
 document.addEventListener('DOMContentLoaded', function() {
     const storyForm = document.querySelector('form[action="/generate"]');
     if (storyForm) {
+        const idempotencyKey = storyForm.querySelector('input[name="idempotency_key"]');
+        // Coming back to the form (including from the back/forward cache) starts a new story
+        window.addEventListener('pageshow', function() {
+            if (idempotencyKey) {
+                idempotencyKey.value = '';
+            }
+        });
+
         storyForm.addEventListener('submit', function() {
+            if (idempotencyKey && !idempotencyKey.value) {
+                idempotencyKey.value = newIdempotencyKey();
+            }
             const submitButton = this.querySelector('button[type="submit"]');
             if (submitButton) {
                 submitButton.disabled = true;
@@ -0,0 +1,110 @@
+/**
+ * Offline story packages: build one for a saved story and have the
+ * service worker cache it for reading without a connection
+ */
+
+const STORY_WORKER_URL = '/story-sw.js';
+const STORY_WORKER_SCOPE = '/static/offline/';
+
+// Offline package pages cache themselves as soon as they open
+document.addEventListener('DOMContentLoaded', function() {
+    if (window.OFFLINE_PACKAGE) {
+        cacheStoryPackage(window.OFFLINE_PACKAGE)
+            .then(result => showOfflineStatus(result.cached ? '✓ Available offline' : 'Not available offline yet'))
+            .catch(error => console.warn('Offline caching failed:', error));
+    }
+});
+
+/**
+ * Register the story service worker and wait until it is active
+ */
+async function registerStoryWorker() {
+    if (!('serviceWorker' in navigator)) {
+        throw new Error('This browser cannot keep stories offline');
+    }
+
+    const registration = await navigator.serviceWorker.register(STORY_WORKER_URL, { scope: STORY_WORKER_SCOPE });
+    const worker = registration.active || registration.waiting || registration.installing;
+    if (worker.state !== 'activated') {
+        await new Promise(resolve => {
+            worker.addEventListener('statechange', () => worker.state === 'activated' && resolve());
+        });
+    }
+    return registration.active || worker;
+}
+
+/**
+ * Ask the service worker to cache a package version
+ * @param {Object} pkg - storyId, version and manifestUrl
+ */
+async function cacheStoryPackage(pkg) {
+    const worker = await registerStoryWorker();
+    const channel = new MessageChannel();
+    const reply = new Promise(resolve => { channel.port1.onmessage = event => resolve(event.data); });
+    worker.postMessage({ type: 'cache-story', ...pkg }, [channel.port2]);
+    return reply;
+}
+
+/**
+ * Build the offline package of a saved story, then cache it in this browser
+ * @param {string} storyId - Saved story ID
+ */
+async function saveStoryOffline(storyId) {
+    const voiceSelect = document.getElementById('voiceSelect');
+    if (!voiceSelect || !voiceSelect.value) {
+        alert('Please select a voice for the offline narration');
+        return;
+    }
+
+    const button = document.getElementById('offlineButton');
+    if (button) {
+        button.disabled = true;
+        button.textContent = '📦 Recording narration...';
+    }
+
+    try {
+        const response = await fetch(`/offline_package/${storyId}`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({
+                voice: voiceSelect.value,
+                voice_name: voiceSelect.options[voiceSelect.selectedIndex].text
+            })
+        });
+        const pkg = await response.json();
+        if (!response.ok) {
+            throw new Error(pkg.error || `Packaging failed: ${response.status}`);
+        }
+
+        const result = await cacheStoryPackage({ storyId, version: pkg.version, manifestUrl: pkg.manifest_url });
+        if (!result.cached) {
+            throw new Error(result.error || 'The browser could not cache the story');
+        }
+
+        const missing = pkg.missing_narration.length;
+        showOfflineStatus(missing ? `✓ Saved offline (${missing} stanzas without narration)` : '✓ Saved offline', pkg.url);
+    } catch (error) {
+        console.error('Offline package error:', error);
+        alert(`Could not save the story offline: ${error.message}`);
+    } finally {
+        if (button) {
+            button.disabled = false;
+            button.textContent = '📦 Save for Offline Reading';
+        }
+    }
+}
+
+/**
+ * Show the package state next to the offline button
+ */
+function showOfflineStatus(message, url) {
+    const status = document.getElementById('offlineStatus');
+    if (!status) return;
+    status.textContent = message;
+    if (url) {
+        const link = document.createElement('a');
+        link.href = url;
+        link.textContent = ' Open offline copy';
+        status.appendChild(link);
+    }
+}
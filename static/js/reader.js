@@ -27,8 +27,10 @@ document.addEventListener('DOMContentLoaded', function() {
     const savedMode = localStorage.getItem('currentReadingMode') || 'normal';
     switchReadingMode(savedMode);
 
-    // Load voices
-    loadVoices();
+    // Load voices (an offline package is narrated in one voice already)
+    if (!window.OFFLINE_NARRATION) {
+        loadVoices();
+    }
 
     // Attach stanza listeners
     attachStanzaListeners();
@@ -36,8 +38,45 @@ document.addEventListener('DOMContentLoaded', function() {
     // Initialize word styling and legend
     initializeWordStyling();
     addWordTypeLegend();
+
+    // Fetch the remaining pages of long stories as they come into view
+    loadPageFragments();
 });
 
+/**
+ * Replace page placeholders with their server-rendered fragments shortly
+ * before they scroll into view
+ */
+function loadPageFragments() {
+    const placeholders = document.querySelectorAll('.page-placeholder');
+    if (placeholders.length === 0) return;
+
+    const loadFragment = async placeholder => {
+        try {
+            const response = await fetch(placeholder.dataset.fragmentUrl);
+            if (!response.ok) {
+                throw new Error(`Page could not be loaded: ${response.status}`);
+            }
+            replaceWithPageFragment(placeholder, await response.text());
+        } catch (error) {
+            console.error('Page fragment error:', error);
+            placeholder.textContent = 'This page could not be loaded. Trying again...';
+            setTimeout(() => observer.observe(placeholder), 5000);
+        }
+    };
+
+    const observer = new IntersectionObserver(entries => {
+        entries.forEach(entry => {
+            if (entry.isIntersecting) {
+                observer.unobserve(entry.target);
+                loadFragment(entry.target);
+            }
+        });
+    }, { rootMargin: '600px 0px' });
+
+    placeholders.forEach(placeholder => observer.observe(placeholder));
+}
+
 /**
  * Add word type legend to the page
  */
@@ -298,6 +337,12 @@ async function readStanzaWithSlowerSync(stanzaId) {
         return;
     }
 
+    const offlineEntry = window.OFFLINE_NARRATION && window.OFFLINE_NARRATION[stanzaId];
+    if (offlineEntry) {
+        playOfflineNarration(stanza, words, offlineEntry);
+        return;
+    }
+
     const text = Array.from(words).map(word => word.textContent.trim()).join(' ');
     const voiceSelect = document.getElementById('voiceSelect');
 
@@ -337,12 +382,14 @@ async function readStanzaWithSlowerSync(stanzaId) {
         // Get timing information from headers
         const playbackRate = parseFloat(speechResponse.headers.get('X-Playback-Rate') || '1.0');
         const wordCount = parseInt(speechResponse.headers.get('X-Word-Count') || words.length);
+        const estimatedDuration = parseInt(speechResponse.headers.get('X-Estimated-Duration') || '0');
+        const timeToFirstAudio = speechResponse.headers.get('X-Time-To-First-Audio');
 
-        console.log(`Audio settings: playback=${playbackRate}, words=${wordCount}`);
+        console.log(`Audio settings: playback=${playbackRate}, words=${wordCount}, server TTFA=${timeToFirstAudio}ms`);
 
-        const audioBlob = await speechResponse.blob();
-        const audioUrl = URL.createObjectURL(audioBlob);
-        const audio = new Audio(audioUrl);
+        const audio = canStreamAudio(speechResponse)
+            ? createStreamingAudio(speechResponse)
+            : new Audio(URL.createObjectURL(await speechResponse.blob()));
 
         audio.playbackRate = playbackRate;
         currentAudio = audio;
@@ -356,7 +403,9 @@ async function readStanzaWithSlowerSync(stanzaId) {
             console.log('Audio playing started - beginning SLOWER word highlighting');
             audioStartTime = Date.now();
             highlightStartTime = Date.now();
-            startMuchSlowerWordHighlighting(words, audio.duration * 1000);
+            // Streamed audio has no known duration until the download finishes
+            const audioDuration = isFinite(audio.duration) ? audio.duration * 1000 : estimatedDuration / playbackRate;
+            startMuchSlowerWordHighlighting(words, audioDuration);
         });
 
         audio.addEventListener('ended', function() {
@@ -380,6 +429,114 @@ async function readStanzaWithSlowerSync(stanzaId) {
     }
 }
 
+/**
+ * Swap an element for a server-rendered page and set the page up like the
+ * pages that came with the story
+ * @param {Element} element - Placeholder or outdated page
+ * @param {string} html - Page fragment from /story_page or /regenerate_page
+ */
+function replaceWithPageFragment(element, html) {
+    const template = document.createElement('template');
+    template.innerHTML = html.trim();
+    const page = template.content.firstElementChild;
+    element.replaceWith(page);
+
+    // Give the new page the current reading mode, styling and listeners
+    page.querySelectorAll('.word').forEach(wordElement => {
+        const wordType = classifyWordType(wordElement.textContent.trim());
+        wordElement.classList.add(WORD_TYPES[wordType] || 'regular-word-highlight');
+        wordElement.setAttribute('data-word-type', wordType);
+    });
+    switchReadingMode(currentReadingMode);
+    document.dispatchEvent(new CustomEvent('storypageloaded', { detail: { page } }));
+    return page;
+}
+
+/**
+ * Play a stanza's pre-rendered narration from an offline package; the
+ * service worker answers the request from the browser cache
+ */
+function playOfflineNarration(stanza, words, entry) {
+    const audio = new Audio(entry.url);
+    audio.playbackRate = entry.playback_rate;
+    currentAudio = audio;
+
+    audio.addEventListener('playing', function() {
+        audioStartTime = Date.now();
+        highlightStartTime = Date.now();
+        const audioDuration = isFinite(audio.duration) ? audio.duration * 1000 : entry.estimated_duration / entry.playback_rate;
+        startMuchSlowerWordHighlighting(words, audioDuration);
+    });
+
+    audio.addEventListener('ended', function() {
+        cleanupAudioPlayback(stanza);
+    });
+
+    audio.addEventListener('error', function(e) {
+        console.error('Offline narration error:', e);
+        alert('This stanza\'s narration is not available offline.');
+    });
+
+    audio.play().catch(error => console.error('Offline narration playback error:', error));
+}
+
+/**
+ * Check whether the browser can play the /read response while it downloads
+ */
+function canStreamAudio(response) {
+    return Boolean(window.MediaSource && response.body &&
+                   MediaSource.isTypeSupported('audio/mpeg'));
+}
+
+/**
+ * Play an MP3 response progressively through MediaSource instead of
+ * waiting for the whole blob
+ */
+function createStreamingAudio(response) {
+    const mediaSource = new MediaSource();
+    const audio = new Audio();
+    audio.src = URL.createObjectURL(mediaSource);
+
+    mediaSource.addEventListener('sourceopen', async function() {
+        const sourceBuffer = mediaSource.addSourceBuffer('audio/mpeg');
+        const reader = response.body.getReader();
+        const appendChunk = chunk => new Promise((resolve, reject) => {
+            sourceBuffer.addEventListener('updateend', resolve, { once: true });
+            sourceBuffer.addEventListener('error', reject, { once: true });
+            sourceBuffer.appendBuffer(chunk);
+        });
+
+        try {
+            let firstChunk = true;
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                if (audio !== currentAudio) {
+                    // A newer stanza took over - stop downloading this one
+                    reader.cancel();
+                    return;
+                }
+                await appendChunk(value);
+
+                if (firstChunk) {
+                    firstChunk = false;
+                    console.log(`First audio chunk buffered (${value.byteLength} bytes)`);
+                }
+            }
+            if (mediaSource.readyState === 'open') {
+                mediaSource.endOfStream();
+            }
+        } catch (error) {
+            console.error('Audio streaming error:', error);
+            if (mediaSource.readyState === 'open') {
+                mediaSource.endOfStream('network');
+            }
+        }
+    }, { once: true });
+
+    return audio;
+}
+
 /**
  * MUCH SLOWER word highlighting - This is the key fix!
  */
@@ -0,0 +1,77 @@
+/**
+ * Service worker for offline story packages
+ *
+ * Served from /story-sw.js and registered for /static/offline/. A page asks
+ * it to cache a package (see offline.js); every file in the package
+ * manifest is then answered from the cache, so a reopened story makes no
+ * requests to the server at all.
+ */
+
+const CACHE_PREFIX = 'esme-story-';
+
+self.addEventListener('install', () => self.skipWaiting());
+
+self.addEventListener('activate', event => event.waitUntil(self.clients.claim()));
+
+self.addEventListener('message', event => {
+    if (!event.data || event.data.type !== 'cache-story') return;
+    const reply = event.ports[0];
+
+    event.waitUntil(
+        cacheStory(event.data)
+            .then(result => reply && reply.postMessage(result))
+            .catch(error => reply && reply.postMessage({ cached: false, error: error.message }))
+    );
+});
+
+/**
+ * Cache one version of a story package and drop its older versions
+ */
+async function cacheStory({ storyId, version, manifestUrl }) {
+    const cacheName = `${CACHE_PREFIX}${storyId}-${version}`;
+
+    // Already cached: no network at all
+    if (await caches.has(cacheName)) {
+        return { cached: true, storyId, version };
+    }
+
+    const response = await fetch(manifestUrl, { cache: 'no-cache' });
+    if (!response.ok) {
+        throw new Error(`Could not fetch the package manifest (${response.status})`);
+    }
+    const manifest = await response.json();
+    if (manifest.version !== version) {
+        // The package was rebuilt since this page was made; cache what the manifest describes
+        version = manifest.version;
+    }
+
+    const cache = await caches.open(`${CACHE_PREFIX}${storyId}-${version}`);
+    await cache.addAll(manifest.files);
+
+    // Cross-origin scripts can only be stored as opaque responses
+    await Promise.all((manifest.external || []).map(async url => {
+        try {
+            const request = new Request(url, { mode: 'no-cors' });
+            await cache.put(request, await fetch(request));
+        } catch (error) {
+            console.warn(`Could not cache ${url} for offline use`, error);
+        }
+    }));
+
+    for (const name of await caches.keys()) {
+        if (name.startsWith(`${CACHE_PREFIX}${storyId}-`) && name !== `${CACHE_PREFIX}${storyId}-${version}`) {
+            await caches.delete(name);
+        }
+    }
+
+    return { cached: true, storyId, version, files: manifest.files.length };
+}
+
+self.addEventListener('fetch', event => {
+    if (event.request.method !== 'GET') return;
+
+    // Cache first; anything not in a package (e.g. /get_voices) still goes to the network
+    event.respondWith(
+        caches.match(event.request).then(cached => cached || fetch(event.request))
+    );
+});